@@ -9,6 +9,7 @@ import { RDILambda } from '../lambda';
 import { Runtime as LambdaRuntime } from 'aws-cdk-lib/aws-lambda';
 import * as fgConfig from '../../resources/sagemaker/featurestore/agg-fg-schema.json';
 import { RDIStartFlinkApplication } from './start-kinesis';
+import { RDIScaleFlinkApplication } from './scale-flink-app';
 import { StreamMode, IStream } from 'aws-cdk-lib/aws-kinesis';
 import { KinesisStreamsToLambda } from '@aws-solutions-constructs/aws-kinesisstreams-lambda';
 import { CfnTrigger, CfnJob } from 'aws-cdk-lib/aws-glue';
@@ -325,6 +326,14 @@ export class RDIFeatureStore extends Construct {
       customResourceLayerArn: props.customResourceLayerArn,
     });
 
+    // Adjust the parallelism of the Flink application when the ingestion stream backs up
+    new RDIScaleFlinkApplication(this, 'ScaleFlinkApp', {
+      prefix: this.prefix,
+      runtime: this.runtime,
+      flinkApplicationName: this.flinkApp.applicationName,
+      ingestionDataStreamName: props.ingestionDataStreamName,
+    });
+
     const glueRole = new Role(this, 'GlueRole', {
       roleName: `${this.prefix}-glue-role`,
       assumedBy:  new ServicePrincipal("glue.amazonaws.com"),
@@ -366,9 +375,29 @@ export class RDIFeatureStore extends Construct {
       glueVersion: '4.0',
       timeout: 60,
       defaultArguments: {
+        // Compaction engine imported by the Glue script
+        "--extra-py-files": `s3://${codeAssetsBucket.bucketName}/glue-scripts/feature_store_compaction.py`,
         "--s3_bucket_name": this.bucket.bucketName,
         "--prefix": `${account}/sagemaker/${region}/offline-store/`,
         "--target_file_size_in_bytes": 536870912,
+        // Merge the hourly partitions older than 7 days into daily files, and the days
+        // older than 3 months into monthly files (0 disables a rollup level)
+        "--daily_rollup_after_days": 7,
+        "--monthly_rollup_after_months": 3,
+        // Hours before the last run watermark visited again to compact late files
+        "--lookback_hours": 2,
+        // Upload the compacted files directly to their final location, without rename (copy)
+        "--enable-s3-parquet-optimized-committer": "true",
+        // Keep every version of the records (set to "true" to keep only the latest one, which
+        // drops the record versions history of the offline store)
+        "--dedupe_records": "false",
+        // Sort the compacted records by record identifier
+        "--record_identifier": fgConfig.record_identifier_feature_name,
+        "--event_time_feature": fgConfig.event_time_feature_name,
+        // ZSTD Parquet with 128 MB row groups and 1 MB pages
+        "--parquet_compression": "zstd",
+        "--parquet_block_size": 134217728,
+        "--parquet_page_size": 1048576,
       }
     });
     glueJob.node.addDependency(glueDeployment)
@@ -0,0 +1,67 @@
+import * as path from 'path';
+import { Construct } from 'constructs';
+import { RemovalPolicy } from 'aws-cdk-lib';
+import { Runtime } from 'aws-cdk-lib/aws-lambda';
+import { Repository, TagMutability, IRepository } from 'aws-cdk-lib/aws-ecr';
+import { DockerImageAsset, Platform } from 'aws-cdk-lib/aws-ecr-assets';
+import * as ecrdeploy from 'cdk-ecr-deployment';
+import { cleanupEcrRepo } from '../ingestion/ingestion-worker-image';
+
+interface RDIProcessingImageProps {
+  readonly prefix: string;
+  readonly removalPolicy: RemovalPolicy;
+  readonly runtime: Runtime;
+  readonly customResourceLayerArn: string;
+}
+
+// Processing image of the SageMaker model build and monitoring pipelines, with the pinned
+// dependencies of the processing scripts so that the jobs do not install them at startup
+export class RDIProcessingImage extends Construct {
+  public readonly prefix: string;
+  public readonly removalPolicy: RemovalPolicy;
+  public readonly runtime: Runtime;
+  public readonly ecrRepo: IRepository;
+  public readonly imageUri: string;
+
+  constructor(scope: Construct, id: string, props: RDIProcessingImageProps) {
+    super(scope, id);
+
+    this.prefix = props.prefix;
+    this.removalPolicy = props.removalPolicy;
+    this.runtime = props.runtime;
+
+    //
+    // ECR
+    //
+    // Setup ECR Repository
+    this.ecrRepo = new Repository(this, 'EcrRepo', {
+      repositoryName: `${this.prefix}-sagemaker-processing`,
+      imageTagMutability: TagMutability.MUTABLE,
+      imageScanOnPush: true,
+      removalPolicy: this.removalPolicy,
+    });
+    // The processing instances are x86 instances
+    const ecrAsset = new DockerImageAsset(this, 'ProcessingImage', {
+      directory: path.join(__dirname, '../../resources/sagemaker/processing-image'),
+      platform: Platform.LINUX_AMD64,
+    });
+    // The image is tagged with the hash of its definition, so that the pipelines only use a new
+    // image when the dependencies change
+    this.imageUri = `${this.ecrRepo.repositoryUri}:${ecrAsset.assetHash}`;
+    new ecrdeploy.ECRDeployment(this, 'DeployDockerImage', {
+      src: new ecrdeploy.DockerImageName(ecrAsset.imageUri),
+      dest: new ecrdeploy.DockerImageName(this.imageUri),
+    });
+
+    // Custom Resource to clean up ECR Repository
+    if (props.removalPolicy === RemovalPolicy.DESTROY) {
+      new cleanupEcrRepo(this, 'CleanupEcrRepo', {
+        prefix: this.prefix,
+        runtime: this.runtime,
+        ecrRepositoryName: this.ecrRepo.repositoryName,
+        ecrRepositoryArn: this.ecrRepo.repositoryArn,
+        customResourceLayerArn: props.customResourceLayerArn,
+      });
+    }
+  }
+}
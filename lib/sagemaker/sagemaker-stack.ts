@@ -11,6 +11,7 @@ import { StringParameter } from 'aws-cdk-lib/aws-ssm';
 import { Dashboard, GraphWidget } from 'aws-cdk-lib/aws-cloudwatch';
 import { RDIIngestionPipelineDashboard } from './dashboard';
 import { RDICleanupStepFunction } from './cleanup-project';
+import { RDIProcessingImage } from './processing-image';
 
 
 export interface SagemakerStackProps extends StackProps {
@@ -80,6 +81,14 @@ export class SagemakerStack extends Stack {
       autoDeleteObjects: this.removalPolicy === RemovalPolicy.DESTROY,
     });
 
+    // Processing image of the model build and monitoring pipelines
+    const processingImage = new RDIProcessingImage(this, 'ProcessingImage', {
+      prefix: this.prefix,
+      removalPolicy: this.removalPolicy,
+      runtime: this.runtime,
+      customResourceLayerArn: customResourceLayerArn,
+    });
+
     // Create IAM policy to access the buckets
     const dataAccessDocument = new PolicyDocument({
       statements: [
@@ -132,6 +141,32 @@ export class SagemakerStack extends Stack {
           ],
           resources: ['*'],
         }),
+        new PolicyStatement({
+          sid: 'ProcessingImagePull',
+          effect: Effect.ALLOW,
+          actions: [
+            'ecr:BatchCheckLayerAvailability',
+            'ecr:BatchGetImage',
+            'ecr:GetDownloadUrlForLayer',
+          ],
+          resources: [processingImage.ecrRepo.repositoryArn],
+        }),
+        new PolicyStatement({
+          sid: 'EcrAuthorization',
+          effect: Effect.ALLOW,
+          actions: ['ecr:GetAuthorizationToken'],
+          resources: ['*'],
+        }),
+        // The model build pipeline stores the best hyperparameters of its tuning jobs on the
+        // registered model packages
+        new PolicyStatement({
+          sid: 'TunedHyperparametersUpdate',
+          effect: Effect.ALLOW,
+          actions: ['sagemaker:UpdateModelPackage'],
+          resources: [
+            `arn:aws:sagemaker:${this.region}:${this.account}:model-package/*`,
+          ],
+        }),
       ],
     });
     const dataAccessPolicy = new Policy(this, 'DataPolicy', {
@@ -288,6 +323,11 @@ export class SagemakerStack extends Stack {
       stringValue: this.domain.executionRole.roleArn,
       description: 'SageMaker Execution Role ARN',
     });
+    new StringParameter(this, 'SagemakerProcessingImageUriSSMParameter', {
+      parameterName: '/rdi-mlops/stack-parameters/sagemaker-processing-image-uri',
+      stringValue: processingImage.imageUri,
+      description: 'URI of the SageMaker pipelines processing image',
+    });
 
     // Create a Step Function to cleanup the SageMaker resources
     new RDICleanupStepFunction(this, 'CleanupSagemakerProject', {
@@ -0,0 +1,81 @@
+import { Construct } from 'constructs';
+import { Duration, Stack } from 'aws-cdk-lib';
+import { Effect, PolicyStatement } from 'aws-cdk-lib/aws-iam';
+import { Runtime } from 'aws-cdk-lib/aws-lambda';
+import { Rule, Schedule } from 'aws-cdk-lib/aws-events';
+import { LambdaFunction } from 'aws-cdk-lib/aws-events-targets';
+import { RDILambda } from '../lambda';
+
+// Interval between two scaling decisions, the SCHEDULE_INTERVAL_SECONDS of scaling.py
+const SCHEDULE_INTERVAL = Duration.minutes(5);
+
+interface RDIScaleFlinkApplicationProps {
+  readonly prefix: string;
+  readonly runtime: Runtime;
+  readonly flinkApplicationName: string;
+  readonly ingestionDataStreamName: string;
+  readonly maxParallelism?: number;
+  readonly dryRun?: boolean;
+}
+
+export class RDIScaleFlinkApplication extends Construct {
+  public readonly prefix: string;
+  public readonly runtime: Runtime;
+  public readonly flinkApplicationName: string;
+
+  constructor(scope: Construct, id: string, props: RDIScaleFlinkApplicationProps) {
+    super(scope, id);
+
+    this.prefix = props.prefix;
+    this.runtime = props.runtime;
+    this.flinkApplicationName = props.flinkApplicationName;
+    const region = Stack.of(this).region;
+    const account = Stack.of(this).account;
+    // By default only log the scaling decisions. Updating the parallelism restarts the application
+    const dryRun = props.dryRun ?? true;
+
+    // Lambda Function reading the Flink application consumer lag and backpressure to adjust its parallelism
+    const lambda = new RDILambda(this, 'ScaleFlinkApp', {
+      prefix: this.prefix,
+      name: 'scale-flink-app',
+      codePath: 'resources/lambdas/scale_flink_app',
+      runtime: this.runtime,
+      memorySize: 256,
+      timeout: Duration.seconds(60),
+      hasLayer: true,
+      environment: {
+        FLINK_APPLICATION_NAME: this.flinkApplicationName,
+        INGESTION_STREAM_NAME: props.ingestionDataStreamName,
+        DRY_RUN: dryRun ? 'true' : 'false',
+        MAX_PARALLELISM: String(props.maxParallelism || 4),
+      },
+      additionalPolicyStatements: [
+        new PolicyStatement({
+          effect: Effect.ALLOW,
+          actions: [
+            'kinesisanalytics:DescribeApplication',
+            'kinesisanalytics:UpdateApplication',
+          ],
+          resources: [`arn:aws:kinesisanalytics:${region}:${account}:application/${this.flinkApplicationName}`],
+        }),
+        new PolicyStatement({
+          effect: Effect.ALLOW,
+          actions: ['kinesis:DescribeStreamSummary'],
+          resources: [`arn:aws:kinesis:${region}:${account}:stream/${props.ingestionDataStreamName}`],
+        }),
+        new PolicyStatement({
+          effect: Effect.ALLOW,
+          actions: ['cloudwatch:GetMetricData'],
+          resources: ['*'],
+        }),
+      ],
+    });
+
+    // Evaluate the scaling decision every 5 minutes
+    new Rule(this, 'ScheduleRule', {
+      ruleName: `${this.prefix}-scale-flink-app-schedule`,
+      schedule: Schedule.rate(SCHEDULE_INTERVAL),
+      targets: [new LambdaFunction(lambda.function)],
+    });
+  }
+}
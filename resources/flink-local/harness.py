@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+
+"""
+harness.py
+~~~~~~~~~~~~~~~~~~~
+Local test harness for the Managed Service for Apache Flink application in resources/flink/main.py.
+It:
+    1. Creates the same source table as the application, but reads recorded transactions
+       (JSON lines) with the filesystem connector instead of the Kinesis connector
+    2. Replays the transactions with their recorded event time (the `time` field) and collects
+       the results of the 1 minute tumbling window aggregation
+    3. Benchmarks the aggregation throughput by inserting the results into a blackhole sink
+
+Usage:
+    python harness.py replay --transactions data/transactions-sample.jsonl
+    python harness.py benchmark --nb-transactions 500000 --min-throughput 20000
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+BASE_DIR = os.path.dirname(os.path.realpath(__file__))
+FLINK_APP_DIR = os.path.join(BASE_DIR, "..", "flink")
+SAMPLE_TRANSACTIONS_PATH = os.path.join(BASE_DIR, "data", "transactions-sample.jsonl")
+sys.path.insert(0, FLINK_APP_DIR)
+import main as flink_app  # noqa: E402
+
+INPUT_TABLE_NAME = "input_table"
+OUTPUT_TABLE_NAME = "output_table"
+# Must match the WATERMARK definition of the application input table
+WATERMARK_DELAY_SECONDS = 60
+
+
+# Functions to read, write and generate recorded transaction streams
+def read_transactions(path):
+    with open(path, "r") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def write_transactions(path, transactions):
+    with open(path, "w") as file:
+        for transaction in transactions:
+            file.write(json.dumps(transaction))
+            file.write("\n")
+
+
+def generate_transactions(
+    nb_transactions,
+    start_time=1718870400,
+    transactions_per_second=10,
+    max_out_of_order_seconds=0,
+    seed=42,
+):
+    """Generates a deterministic stream of transactions with the same fields as the blockchain.com
+    API. Transactions can arrive out of order by up to `max_out_of_order_seconds`, which must stay
+    below the watermark delay for all of them to be aggregated.
+    """
+    rng = random.Random(seed)
+    transactions = []
+    for i in range(nb_transactions):
+        event_time = start_time + i // transactions_per_second
+        if max_out_of_order_seconds:
+            event_time = max(
+                start_time, event_time - rng.randint(0, max_out_of_order_seconds)
+            )
+        transactions.append(
+            {
+                "hash": "%064x" % rng.getrandbits(256),
+                "ver": 2,
+                "vin_sz": 1,
+                "vout_sz": 2,
+                "size": rng.randint(200, 400),
+                "weight": rng.randint(600, 1200),
+                "fee": rng.randint(500, 20000),
+                "relayed_by": "0.0.0.0",
+                "lock_time": 0,
+                "tx_index": i,
+                "double_spend": False,
+                "time": event_time,
+                "block_index": None,
+                "block_height": None,
+                "inputs": "[]",
+                "out": "[]",
+                "rbf": False,
+            }
+        )
+    return transactions
+
+
+def expected_aggregates(transactions):
+    """Computes in plain Python the per minute aggregates the Flink application should emit.
+    Flink's AVG over an INTEGER column is an INTEGER, hence the truncated average fee.
+    """
+    windows = defaultdict(list)
+    for transaction in transactions:
+        window_start = transaction["time"] - transaction["time"] % 60
+        windows[window_start].append(transaction["fee"])
+    return [
+        {
+            "tx_minute": str(
+                datetime.fromtimestamp(window_start, tz=timezone.utc).replace(
+                    tzinfo=None
+                )
+            ),
+            "total_nb_trx_1min": len(fees),
+            "total_fee_1min": sum(fees),
+            "avg_fee_1min": float(sum(fees) // len(fees)),
+        }
+        for window_start, fees in sorted(windows.items())
+    ]
+
+
+# Functions to run the application tables locally
+def filesystem_source_options(path):
+    return {
+        "connector": "filesystem",
+        "path": os.path.abspath(path),
+        "format": "json",
+    }
+
+
+def create_local_table_environment():
+    table_env = flink_app.create_table_environment()
+    table_config = table_env.get_config()
+    # Managed Service for Apache Flink runs in UTC. Make the replay independent of the local time zone
+    table_config.set("table.local-time-zone", "UTC")
+    # A single task makes the replay order, and thus the results, deterministic
+    table_config.set("parallelism.default", "1")
+    return table_env
+
+
+def replay(transactions_path):
+    """Replays the recorded transactions through the application aggregation and returns the
+    emitted windows sorted by minute. The filesystem source is bounded: once all the transactions
+    are read, the watermark is moved to the end of time and all the windows are fired.
+    """
+    table_env = create_local_table_environment()
+    table_env.execute_sql(
+        flink_app.create_table(
+            INPUT_TABLE_NAME,
+            flink_app.INPUT_TABLE_SCHEMA,
+            filesystem_source_options(transactions_path),
+        )
+    )
+    tumbling_window_table = flink_app.perform_tumbling_window_aggregation(
+        table_env, INPUT_TABLE_NAME
+    )
+    results = []
+    with tumbling_window_table.execute().collect() as rows:
+        for row in rows:
+            results.append(
+                {
+                    "tx_minute": row[0],
+                    "total_nb_trx_1min": row[1],
+                    "total_fee_1min": row[2],
+                    "avg_fee_1min": float(row[3]),
+                }
+            )
+    return sorted(results, key=lambda result: result["tx_minute"])
+
+
+def benchmark(transactions_path):
+    """Runs the application INSERT statement into a blackhole sink with the same schema as the
+    Kinesis sink and returns the number of transactions and the job wall time in seconds.
+    """
+    nb_transactions = len(read_transactions(transactions_path))
+    table_env = create_local_table_environment()
+    table_env.execute_sql(
+        flink_app.create_table(
+            INPUT_TABLE_NAME,
+            flink_app.INPUT_TABLE_SCHEMA,
+            filesystem_source_options(transactions_path),
+        )
+    )
+    table_env.execute_sql(
+        flink_app.create_table(
+            OUTPUT_TABLE_NAME, flink_app.OUTPUT_TABLE_SCHEMA, {"connector": "blackhole"}
+        )
+    )
+    tumbling_window_table = flink_app.perform_tumbling_window_aggregation(
+        table_env, INPUT_TABLE_NAME
+    )
+    table_env.create_temporary_view("tumbling_window_table", tumbling_window_table)
+    start = time.perf_counter()
+    table_env.execute_sql(
+        "INSERT INTO {0} SELECT * FROM {1}".format(
+            OUTPUT_TABLE_NAME, "tumbling_window_table"
+        )
+    ).wait()
+    return nb_transactions, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        "Replay recorded transactions through the Flink application locally."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    replay_parser = subparsers.add_parser(
+        "replay", help="Replay recorded transactions and compare the emitted windows."
+    )
+    replay_parser.add_argument(
+        "--transactions", type=str, default=SAMPLE_TRANSACTIONS_PATH
+    )
+    benchmark_parser = subparsers.add_parser(
+        "benchmark",
+        help="Measure the aggregation throughput on generated transactions.",
+    )
+    benchmark_parser.add_argument("--nb-transactions", type=int, default=200000)
+    benchmark_parser.add_argument("--transactions-per-second", type=int, default=50)
+    benchmark_parser.add_argument(
+        "--min-throughput",
+        type=float,
+        default=0,
+        help="Fail if fewer transactions per second are processed. Default 0 (no check).",
+    )
+    args = parser.parse_args()
+
+    if args.command == "replay":
+        results = replay(args.transactions)
+        expected = expected_aggregates(read_transactions(args.transactions))
+        for result in results:
+            print(json.dumps(result))
+        if results != expected:
+            print("The emitted windows do not match the expected aggregates:")
+            print(json.dumps(expected, indent=2))
+            sys.exit(1)
+        print(f"{len(results)} windows match the expected aggregates.")
+    else:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            transactions_path = os.path.join(tmp_dir, "transactions.jsonl")
+            write_transactions(
+                transactions_path,
+                generate_transactions(
+                    args.nb_transactions,
+                    transactions_per_second=args.transactions_per_second,
+                    max_out_of_order_seconds=WATERMARK_DELAY_SECONDS // 2,
+                ),
+            )
+            nb_transactions, elapsed = benchmark(transactions_path)
+        throughput = nb_transactions / elapsed
+        print(
+            f"Aggregated {nb_transactions} transactions in {elapsed:.2f}s: {throughput:.0f} transactions/s"
+        )
+        if throughput < args.min_throughput:
+            print(
+                f"Throughput is below the minimum of {args.min_throughput:.0f} transactions/s"
+            )
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import os
+
+import pytest
+
+pytest.importorskip("pyflink")
+
+import harness  # noqa: E402
+
+
+def test_replay_sample_matches_expected_aggregates():
+    transactions = harness.read_transactions(harness.SAMPLE_TRANSACTIONS_PATH)
+    results = harness.replay(harness.SAMPLE_TRANSACTIONS_PATH)
+    assert results == harness.expected_aggregates(transactions)
+
+
+def test_replay_out_of_order_transactions_within_watermark(tmp_path):
+    transactions = harness.generate_transactions(
+        600,
+        transactions_per_second=2,
+        max_out_of_order_seconds=harness.WATERMARK_DELAY_SECONDS // 2,
+    )
+    transactions_path = os.path.join(tmp_path, "transactions.jsonl")
+    harness.write_transactions(transactions_path, transactions)
+    results = harness.replay(transactions_path)
+    assert results == harness.expected_aggregates(transactions)
+    assert sum(r["total_nb_trx_1min"] for r in results) == len(transactions)
+
+
+def test_benchmark_processes_all_transactions(tmp_path):
+    transactions_path = os.path.join(tmp_path, "transactions.jsonl")
+    harness.write_transactions(transactions_path, harness.generate_transactions(1000))
+    nb_transactions, elapsed = harness.benchmark(transactions_path)
+    assert nb_transactions == 1000
+    assert elapsed > 0
@@ -0,0 +1,104 @@
+import json
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(BASE_DIR, "..", "lambdas", "scale_flink_app"))
+
+from scaling import DEFAULT_SCALING_CONFIG, decide_parallelism, replay_trace  # noqa: E402
+
+SAMPLE_TRACE_PATH = os.path.join(BASE_DIR, "data", "scaling-trace.json")
+CONFIG = DEFAULT_SCALING_CONFIG
+HIGH_LAG = [CONFIG["scale_up_lag_ms"] + 1] * CONFIG["scale_up_periods"]
+LOW_LAG = [CONFIG["scale_down_lag_ms"] - 1] * CONFIG["scale_down_periods"]
+LOW_BACKPRESSURE = [0.0] * CONFIG["scale_down_periods"]
+NO_COOLDOWN = CONFIG["cooldown_periods"]
+
+
+def test_scale_up_on_lag():
+    assert decide_parallelism(HIGH_LAG, [0.0] * 3, 1, NO_COOLDOWN, CONFIG) == (
+        2,
+        "scale up",
+    )
+
+
+def test_scale_up_on_backpressure():
+    backpressure = [CONFIG["scale_up_backpressure_ms"] + 1] * CONFIG["scale_up_periods"]
+    assert decide_parallelism([0.0] * 3, backpressure, 2, NO_COOLDOWN, CONFIG) == (
+        4,
+        "scale up",
+    )
+
+
+def test_scale_up_needs_consecutive_periods():
+    lag = HIGH_LAG[:-1] + [0.0]
+    assert decide_parallelism(lag, [0.0] * 3, 1, NO_COOLDOWN, CONFIG) == (1, "hold")
+
+
+def test_scale_down():
+    assert decide_parallelism(LOW_LAG, LOW_BACKPRESSURE, 4, NO_COOLDOWN, CONFIG) == (
+        2,
+        "scale down",
+    )
+
+
+def test_scale_down_needs_the_longer_window():
+    periods = CONFIG["scale_down_periods"] - 1
+    assert decide_parallelism(
+        LOW_LAG[:periods], LOW_BACKPRESSURE[:periods], 4, NO_COOLDOWN, CONFIG
+    ) == (4, "hold")
+
+
+def test_cooldown_holds_the_parallelism():
+    assert decide_parallelism(HIGH_LAG, [0.0] * 3, 1, NO_COOLDOWN - 1, CONFIG) == (
+        1,
+        "cooldown",
+    )
+
+
+def test_bounds():
+    assert decide_parallelism(HIGH_LAG, [0.0] * 3, 4, NO_COOLDOWN, CONFIG)[0] == 4
+    assert decide_parallelism(LOW_LAG, LOW_BACKPRESSURE, 1, NO_COOLDOWN, CONFIG) == (
+        1,
+        "hold",
+    )
+    assert decide_parallelism([], [], 0, NO_COOLDOWN, CONFIG) == (
+        1,
+        "below minimum parallelism",
+    )
+    assert decide_parallelism([], [], 8, NO_COOLDOWN, CONFIG) == (
+        4,
+        "above maximum parallelism",
+    )
+
+
+def test_parallelism_capped_at_shard_count():
+    assert decide_parallelism(HIGH_LAG, [0.0] * 3, 2, NO_COOLDOWN, CONFIG, 3) == (
+        3,
+        "scale up",
+    )
+    assert decide_parallelism([], [], 4, NO_COOLDOWN, CONFIG, 2) == (
+        2,
+        "above maximum parallelism",
+    )
+
+
+def test_replay_sample_trace():
+    with open(SAMPLE_TRACE_PATH) as f:
+        trace = json.load(f)
+    decisions = replay_trace(trace, 1, CONFIG)
+    # The controller decides at the end of every 5 minutes schedule interval
+    assert [d["period"] for d in decisions] == list(range(4, len(trace), 5))
+    changes = [
+        (d["period"], d["parallelism"]) for d in decisions if "scale" in d["reason"]
+    ]
+    assert changes == [(14, 2), (24, 4), (44, 2), (54, 1)]
+    # The cooldown of 6 periods skips the decision 5 minutes after an update
+    assert next(d for d in decisions if d["period"] == 19)["reason"] == "cooldown"
+
+
+def test_replay_sample_trace_with_shard_count():
+    with open(SAMPLE_TRACE_PATH) as f:
+        trace = json.load(f)
+    decisions = replay_trace(trace, 1, CONFIG, shard_count=2)
+    assert max(d["parallelism"] for d in decisions) == 2
@@ -23,16 +23,6 @@ from pyflink.table.udf import udf
 import os
 import json
 
-# 1. Creates a Table Environment
-env_settings = EnvironmentSettings.in_streaming_mode()
-table_env = TableEnvironment.create(environment_settings=env_settings)
-# access flink configuration after table environment instantiation
-table_config = table_env.get_config()
-# set the Flink Watermaker IDLE strategy
-# Documentation: https://nightlies.apache.org/flink/flink-docs-release-1.19/docs/dev/datastream/event-time/generating_watermarks/#dealing-with-idle-sources
-# Article: https://medium.com/@ipolyzos_/understanding-watermarks-in-apache-flink-c8793a50fbb8
-table_config.set("table.exec.source.idle-timeout", "20000")
-
 APPLICATION_PROPERTIES_FILE_PATH = "/etc/flink/application_properties.json"
 
 
@@ -53,9 +43,24 @@ def property_map(props, property_group_id):
             return prop["PropertyMap"]
 
 
+# 1. Creates a Table Environment
+def create_table_environment():
+    env_settings = EnvironmentSettings.in_streaming_mode()
+    table_env = TableEnvironment.create(environment_settings=env_settings)
+    # access flink configuration after table environment instantiation
+    table_config = table_env.get_config()
+    # set the Flink Watermaker IDLE strategy
+    # Documentation: https://nightlies.apache.org/flink/flink-docs-release-1.19/docs/dev/datastream/event-time/generating_watermarks/#dealing-with-idle-sources
+    # Article: https://medium.com/@ipolyzos_/understanding-watermarks-in-apache-flink-c8793a50fbb8
+    table_config.set("table.exec.source.idle-timeout", "20000")
+    table_env.create_temporary_system_function("to_string", to_string)
+    return table_env
+
+
 # Functions to create the input and out tables and the tumbling window aggregation
-def create_input_table(table_name, stream_name, region, initpos):
-    return """CREATE TABLE {0} (
+# The table schemas are kept separate from the connectors so that the same tables can be created
+# locally with the filesystem connector (see resources/flink-local)
+INPUT_TABLE_SCHEMA = """
                 hash VARCHAR(64) NOT NULL,
                 ver INTEGER,
                 vin_sz INTEGER,
@@ -75,34 +80,56 @@ def create_input_table(table_name, stream_name, region, initpos):
                 `out` STRING,
                 rbf BOOLEAN,
                 WATERMARK FOR tx_time AS tx_time - INTERVAL '60' SECOND
-              )
-              WITH (
-                'connector' = 'kinesis',
-                'stream' = '{1}',
-                'aws.region' = '{2}',
-                'scan.stream.initpos' = '{3}',
-                'format' = 'json',
-                'json.timestamp-format.standard' = 'ISO-8601'
-              ) """.format(table_name, stream_name, region, initpos)
-
+"""
 
-def create_output_table(table_name, stream_name, region):
-    return """CREATE TABLE {0} (
+OUTPUT_TABLE_SCHEMA = """
                 tx_minute VARCHAR(64),
                 total_nb_trx_1min BIGINT,
                 total_fee_1min BIGINT,
                 avg_fee_1min FLOAT
-              )
+"""
+
+
+def create_table(table_name, schema, connector_options):
+    options = ",\n".join(
+        "'{0}' = '{1}'".format(key, value) for key, value in connector_options.items()
+    )
+    return """CREATE TABLE {0} ({1})
               WITH (
-                'connector' = 'kinesis',
-                'stream' = '{1}',
-                'aws.region' = '{2}',
-                'format' = 'json',
-                'json.timestamp-format.standard' = 'ISO-8601'
-              ) """.format(table_name, stream_name, region)
+                {2}
+              ) """.format(table_name, schema, options)
+
+
+def create_input_table(table_name, stream_name, region, initpos):
+    return create_table(
+        table_name,
+        INPUT_TABLE_SCHEMA,
+        {
+            "connector": "kinesis",
+            "stream": stream_name,
+            "aws.region": region,
+            "scan.stream.initpos": initpos,
+            "format": "json",
+            "json.timestamp-format.standard": "ISO-8601",
+        },
+    )
+
+
+def create_output_table(table_name, stream_name, region):
+    return create_table(
+        table_name,
+        OUTPUT_TABLE_SCHEMA,
+        {
+            "connector": "kinesis",
+            "stream": stream_name,
+            "aws.region": region,
+            "format": "json",
+            "json.timestamp-format.standard": "ISO-8601",
+        },
+    )
 
 
-def perform_tumbling_window_aggregation(input_table_name):
+def perform_tumbling_window_aggregation(table_env, input_table_name):
     # use SQL Table in the Table API
     input_table = table_env.from_path(input_table_name)
     tumbling_window_table = (
@@ -126,9 +153,6 @@ def to_string(i):
     return str(i)
 
 
-table_env.create_temporary_system_function("to_string", to_string)
-
-
 def main():
     # Application Property Keys
     INPUT_PROPERTY_GROUP_KEY = "consumer.config.0"
@@ -147,6 +171,7 @@ def main():
 
     # get application properties
     props = get_application_properties()
+    table_env = create_table_environment()
 
     input_property_map = property_map(props, INPUT_PROPERTY_GROUP_KEY)
     output_property_map = property_map(props, PRODUCER_PROPERTY_GROUP_KEY)
@@ -170,7 +195,9 @@ def main():
 
     # 4. Queries from the Source Table and creates a tumbling window over 1 minute to calculate the
     # aggregated metrics over the window.
-    tumbling_window_table = perform_tumbling_window_aggregation(INPUT_TABLE_NAME)
+    tumbling_window_table = perform_tumbling_window_aggregation(
+        table_env, INPUT_TABLE_NAME
+    )
     table_env.create_temporary_view("tumbling_window_table", tumbling_window_table)
 
     # 5. These tumbling windows are inserted into the sink table
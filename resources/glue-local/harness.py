@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+
+"""
+harness.py
+~~~~~~~~~~~~~~~~~~~
+Local harness for the Glue compaction engine in resources/glue/feature_store_compaction.py.
+It:
+    1. Generates a synthetic SageMaker Feature Store offline store layout in a local folder,
+       with many small Parquet files per hourly partition and duplicate record versions
+    2. Runs the compaction engine with a local PySpark session against the folder
+    3. Benchmarks the compaction for increasing numbers of partitions, reporting the files
+       read and written, the bytes rewritten and the wall time
+
+Usage:
+    python harness.py generate --output /tmp/offline-store --nb-hours 48
+    python harness.py compact --offline-store /tmp/offline-store
+    python harness.py benchmark --nb-hours 24 96 384
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+BASE_DIR = os.path.dirname(os.path.realpath(__file__))
+GLUE_SCRIPTS_DIR = os.path.join(BASE_DIR, "..", "glue")
+sys.path.insert(0, GLUE_SCRIPTS_DIR)
+import feature_store_compaction as compaction  # noqa: E402
+
+FEATURE_GROUP_PREFIX = "123456789012/sagemaker/eu-west-1/offline-store/"
+FEATURE_GROUP_FOLDER = FEATURE_GROUP_PREFIX + "mlops-agg-feature-group-1718870400/"
+START_TIME = datetime(2024, 6, 20, tzinfo=timezone.utc)
+# Same columns as the offline store files of the aggregated feature group, the features
+# followed by the columns added by the Feature Store
+FEATURE_NAMES = [
+    "tx_minute",
+    "total_nb_trx_1min",
+    "total_fee_1min",
+    "avg_fee_1min",
+    "event_time",
+]
+OFFLINE_STORE_SCHEMA = pa.schema(
+    [
+        ("tx_minute", pa.string()),
+        ("total_nb_trx_1min", pa.int64()),
+        ("total_fee_1min", pa.int64()),
+        ("avg_fee_1min", pa.float64()),
+        ("event_time", pa.float64()),
+        ("write_time", pa.timestamp("ms", tz="UTC")),
+        ("api_invocation_time", pa.timestamp("ms", tz="UTC")),
+        ("is_deleted", pa.bool_()),
+    ]
+)
+
+
+# Functions to generate a synthetic offline store
+def generate_offline_store(
+    root,
+    nb_hours,
+    files_per_hour=12,
+    duplicate_ratio=0.1,
+    start_time=START_TIME,
+    seed=42,
+):
+    """Writes one record per minute over `nb_hours` hours, spread over `files_per_hour` files
+    per hourly partition like the Feature Store offline store. A `duplicate_ratio` of the
+    records is written a second time, with a later write time, as a new record version.
+    Returns the number of distinct records.
+    """
+    rng = random.Random(seed)
+    storage = compaction.LocalStorage(root)
+    for hour in range(nb_hours):
+        hour_start = start_time + timedelta(hours=hour)
+        rows = []
+        for minute in range(60):
+            tx_minute = hour_start + timedelta(minutes=minute)
+            nb_trx = rng.randint(100, 400)
+            total_fee = nb_trx * rng.randint(2000, 8000)
+            versions = 2 if rng.random() < duplicate_ratio else 1
+            for version in range(versions):
+                write_time = tx_minute + timedelta(minutes=1, seconds=version * 30)
+                rows.append(
+                    {
+                        "tx_minute": tx_minute.strftime("%Y-%m-%d %H:%M:%S"),
+                        "total_nb_trx_1min": nb_trx,
+                        "total_fee_1min": total_fee + version,
+                        "avg_fee_1min": (total_fee + version) / nb_trx,
+                        "event_time": (tx_minute + timedelta(minutes=1)).timestamp()
+                        + version,
+                        "write_time": write_time,
+                        "api_invocation_time": write_time,
+                        "is_deleted": False,
+                    }
+                )
+        partition_path = storage.path(
+            FEATURE_GROUP_FOLDER
+            + "data/"
+            + hour_start.strftime(compaction.HOUR_PREFIX_FORMAT)
+        )
+        os.makedirs(partition_path, exist_ok=True)
+        rows_per_file = -(-len(rows) // files_per_hour)
+        for i in range(0, len(rows), rows_per_file):
+            pq.write_table(
+                pa.Table.from_pylist(
+                    rows[i : i + rows_per_file], schema=OFFLINE_STORE_SCHEMA
+                ),
+                os.path.join(
+                    partition_path,
+                    hour_start.strftime("%Y%m%dT%H%M%SZ") + f"_{i:05d}.parquet",
+                ),
+            )
+    return nb_hours * 60
+
+
+def data_files(root):
+    """Lists the data files of the offline store, ignoring the hidden files like Athena."""
+    storage = compaction.LocalStorage(root)
+    return [
+        (key, size)
+        for key, size in storage.list_objects(FEATURE_GROUP_FOLDER + "data/")
+        if compaction.PARTITION_PATTERN.match(key)
+        and not key.rsplit("/", 1)[-1].startswith(compaction.HIDDEN_FILE_PREFIXES)
+    ]
+
+
+def read_offline_store(root):
+    """Reads the features of all the records of the offline store, sorted by tx_minute.
+    The Feature Store columns are not read, as Spark writes the timestamps with another type.
+    """
+    storage = compaction.LocalStorage(root)
+    tables = [
+        pq.read_table(storage.path(key), columns=FEATURE_NAMES)
+        for key, _ in data_files(root)
+    ]
+    return sorted(
+        pa.concat_tables(tables).to_pylist(), key=lambda row: row["tx_minute"]
+    )
+
+
+# Functions to run the compaction engine locally
+def create_local_spark_session():
+    from pyspark.sql import SparkSession
+
+    return (
+        SparkSession.builder.master("local[*]")
+        .appName("feature-store-compaction-local")
+        .config("spark.sql.session.timeZone", "UTC")
+        # Do not write the .crc checksum files next to the compacted files
+        .config("spark.hadoop.fs.file.impl", "org.apache.hadoop.fs.RawLocalFileSystem")
+        .getOrCreate()
+    )
+
+
+def create_local_compaction(spark, root, **kwargs):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    return compaction.FeatureStoreCompaction(
+        spark,
+        compaction.LocalStorage(root),
+        kwargs.pop("target_file_size_in_bytes", 536870912),
+        parquet_write_options={"compression": "zstd"},
+        **kwargs,
+    )
+
+
+def count_data_files(root):
+    files = data_files(root)
+    return len(files), sum(size for _, size in files)
+
+
+def benchmark(spark, nb_hours_list, files_per_hour, now=None, **kwargs):
+    """Generates an offline store for each number of hourly partitions and runs a full
+    compaction on it. Returns a report per number of partitions.
+    """
+    reports = []
+    for nb_hours in nb_hours_list:
+        with tempfile.TemporaryDirectory() as root:
+            generate_offline_store(root, nb_hours, files_per_hour=files_per_hour)
+            files_before, bytes_before = count_data_files(root)
+            engine = create_local_compaction(spark, root, **kwargs)
+            start = time.perf_counter()
+            summary = engine.run(
+                FEATURE_GROUP_FOLDER, now=now or START_TIME + timedelta(hours=nb_hours)
+            )
+            elapsed = time.perf_counter() - start
+            files_after, bytes_after = count_data_files(root)
+        reports.append(
+            {
+                "partitions": nb_hours,
+                "files_before": files_before,
+                "files_after": files_after,
+                "bytes_before": bytes_before,
+                "bytes_after": bytes_after,
+                "files_in": summary["files_in"],
+                "files_out": summary["files_out"],
+                "bytes_rewritten": summary["bytes_rewritten"],
+                "seconds": round(elapsed, 2),
+                "seconds_per_partition": round(elapsed / nb_hours, 3),
+            }
+        )
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        "Run the Feature Store offline store compaction locally."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    generate_parser = subparsers.add_parser(
+        "generate", help="Generate a synthetic offline store layout."
+    )
+    generate_parser.add_argument("--output", type=str, required=True)
+    generate_parser.add_argument("--nb-hours", type=int, default=48)
+    generate_parser.add_argument("--files-per-hour", type=int, default=12)
+    compact_parser = subparsers.add_parser(
+        "compact", help="Compact a local offline store layout."
+    )
+    compact_parser.add_argument("--offline-store", type=str, required=True)
+    compact_parser.add_argument("--daily-rollup-after-days", type=int, default=0)
+    compact_parser.add_argument("--monthly-rollup-after-months", type=int, default=0)
+    compact_parser.add_argument("--dedupe-records", action="store_true")
+    benchmark_parser = subparsers.add_parser(
+        "benchmark",
+        help="Benchmark the compaction for increasing numbers of partitions.",
+    )
+    benchmark_parser.add_argument("--nb-hours", type=int, nargs="+", default=[24, 96])
+    benchmark_parser.add_argument("--files-per-hour", type=int, default=12)
+    benchmark_parser.add_argument("--daily-rollup-after-days", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        nb_records = generate_offline_store(
+            args.output, args.nb_hours, files_per_hour=args.files_per_hour
+        )
+        print(
+            f"Generated {nb_records} records in {FEATURE_GROUP_FOLDER} of {args.output}"
+        )
+    elif args.command == "compact":
+        engine = create_local_compaction(
+            create_local_spark_session(),
+            args.offline_store,
+            daily_rollup_after_days=args.daily_rollup_after_days,
+            monthly_rollup_after_months=args.monthly_rollup_after_months,
+            dedupe_records=args.dedupe_records,
+        )
+        print(json.dumps(engine.run(FEATURE_GROUP_FOLDER), indent=2))
+    else:
+        reports = benchmark(
+            create_local_spark_session(),
+            args.nb_hours,
+            args.files_per_hour,
+            daily_rollup_after_days=args.daily_rollup_after_days,
+        )
+        for report in reports:
+            print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""Unit tests of the compaction engine planning: the partitions visited, scanned, compacted and
+rolled up. The offline store files are empty placeholders and the Spark session is mocked, the
+compaction of actual records is tested in test_harness.py.
+"""
+
+import os
+import sys
+from datetime import date, datetime, timedelta, timezone
+from unittest import mock
+
+import pytest
+
+pytest.importorskip("pyspark")
+
+BASE_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(BASE_DIR, "..", "glue"))
+import feature_store_compaction as compaction  # noqa: E402
+
+FEATURE_GROUP_FOLDER = "offline-store/feature-group/"
+DATA_FOLDER = FEATURE_GROUP_FOLDER + "data/"
+MANIFEST_KEY = FEATURE_GROUP_FOLDER + compaction.MANIFEST_FILE_NAME
+START_TIME = datetime(2024, 6, 20, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return compaction.LocalStorage(str(tmp_path))
+
+
+def hour_prefix(hours):
+    return DATA_FOLDER + (START_TIME + timedelta(hours=hours)).strftime(
+        compaction.HOUR_PREFIX_FORMAT
+    )
+
+
+def touch(storage, key, size=10):
+    os.makedirs(os.path.dirname(storage.path(key)), exist_ok=True)
+    with open(storage.path(key), "wb") as f:
+        f.write(b"0" * size)
+
+
+def create_engine(storage, spark=None, **kwargs):
+    return compaction.FeatureStoreCompaction(
+        spark or mock.MagicMock(), storage, 1024, **kwargs
+    )
+
+
+def test_hour_prefixes_since(storage):
+    prefixes = create_engine(storage).hour_prefixes_since(
+        DATA_FOLDER, START_TIME + timedelta(hours=22), START_TIME + timedelta(hours=25)
+    )
+    assert prefixes == [
+        DATA_FOLDER + "year=2024/month=06/day=20/hour=22/",
+        DATA_FOLDER + "year=2024/month=06/day=20/hour=23/",
+        DATA_FOLDER + "year=2024/month=06/day=21/hour=00/",
+        DATA_FOLDER + "year=2024/month=06/day=21/hour=01/",
+    ]
+
+
+def test_first_run_visits_all_partitions(storage):
+    for hours in [0, 30, 100]:
+        touch(storage, hour_prefix(hours) + "file.parquet")
+    summary = create_engine(storage).run(
+        FEATURE_GROUP_FOLDER, now=START_TIME + timedelta(hours=200, minutes=10)
+    )
+    assert summary["visited_partitions"] == 3
+    assert storage.read_json(MANIFEST_KEY)["watermark"] == "2024-06-28T08"
+
+
+def test_run_visits_the_hours_since_the_watermark_minus_lookback(storage):
+    for hours in range(10):
+        touch(storage, hour_prefix(hours) + "file.parquet")
+    storage.write_json(MANIFEST_KEY, {"watermark": "2024-06-20T06"})
+    summary = create_engine(storage, lookback_hours=2).run(
+        FEATURE_GROUP_FOLDER, now=START_TIME + timedelta(hours=9, minutes=30)
+    )
+    # The hours 4 to 9, the current hour included
+    assert summary["visited_partitions"] == 6
+    assert storage.read_json(MANIFEST_KEY)["watermark"] == "2024-06-20T09"
+
+
+def test_failed_run_keeps_the_watermark(storage):
+    touch(storage, hour_prefix(7) + "file-1.parquet")
+    touch(storage, hour_prefix(7) + "file-2.parquet")
+    storage.write_json(MANIFEST_KEY, {"watermark": "2024-06-20T06"})
+    engine = create_engine(storage, lookback_hours=0)
+    with mock.patch.object(engine, "compact_partition", side_effect=RuntimeError):
+        with pytest.raises(RuntimeError):
+            engine.run(FEATURE_GROUP_FOLDER, now=START_TIME + timedelta(hours=8))
+    assert storage.read_json(MANIFEST_KEY) == {"watermark": "2024-06-20T06"}
+
+
+class FakePaginator:
+    def __init__(self, pages):
+        self.pages = pages
+
+    def paginate(self, **kwargs):
+        return iter(self.pages)
+
+
+class FakeS3Client:
+    def __init__(self, pages):
+        self.pages = pages
+
+    def get_paginator(self, operation_name):
+        return FakePaginator(self.pages)
+
+
+def test_s3_listings_read_all_the_pages():
+    pages = [
+        {"Contents": [{"Key": f"key-{page}-{i}", "Size": i} for i in range(1000)]}
+        for page in range(3)
+    ] + [{"KeyCount": 0}]
+    objects = compaction.S3Storage(FakeS3Client(pages), "bucket").list_objects("")
+    assert len(objects) == 3000
+    assert objects[1] == ("key-0-1", 1)
+    prefixes = compaction.S3Storage(
+        FakeS3Client(
+            [
+                {"CommonPrefixes": [{"Prefix": "a/"}]},
+                {"CommonPrefixes": [{"Prefix": "b/"}]},
+            ]
+        ),
+        "bucket",
+    ).list_common_prefixes("")
+    assert prefixes == ["a/", "b/"]
+
+
+def test_scan_groups_the_files_by_partition(storage):
+    touch(storage, hour_prefix(0) + "file-1.parquet", size=5)
+    touch(storage, hour_prefix(0) + "file-2.parquet", size=7)
+    touch(storage, hour_prefix(0) + "_hidden")
+    touch(storage, hour_prefix(1) + "compacted-run/part-0.parquet")
+    touch(storage, hour_prefix(2) + "file.parquet")
+    touch(storage, hour_prefix(2) + compaction.COMMIT_RECORD_NAME)
+    touch(storage, DATA_FOLDER + "not-a-partition.parquet")
+    engine = create_engine(storage)
+    day_prefixes = engine.discover_all_day_prefixes(DATA_FOLDER)
+    assert day_prefixes == [DATA_FOLDER + "year=2024/month=06/day=20/"]
+    partitions, interrupted_partitions = engine.scan_partitions(day_prefixes)
+    assert partitions == {
+        hour_prefix(0): [
+            (hour_prefix(0) + "file-1.parquet", 5),
+            (hour_prefix(0) + "file-2.parquet", 7),
+        ],
+        hour_prefix(1): [(hour_prefix(1) + "compacted-run/part-0.parquet", 10)],
+        hour_prefix(2): [(hour_prefix(2) + "file.parquet", 10)],
+    }
+    assert interrupted_partitions == {hour_prefix(2)}
+
+
+def spark_writing_files(nb_files):
+    """Returns a mocked Spark session whose Parquet writes create placeholder files."""
+    spark = mock.MagicMock()
+
+    def write(uri, mode):
+        directory = uri[len("file://") :]
+        os.makedirs(directory)
+        for i in range(nb_files):
+            with open(os.path.join(directory, f"part-{i}.parquet"), "wb") as f:
+                f.write(b"0")
+
+    df = spark.read.parquet.return_value.coalesce.return_value
+    df.write.options.return_value.parquet.side_effect = write
+    return spark
+
+
+def test_compaction_replaces_only_the_listed_files(storage):
+    for i in range(3):
+        touch(storage, hour_prefix(0) + f"file-{i}.parquet")
+    objects = storage.list_objects(hour_prefix(0))
+    # Written by the Feature Store after the partition was scanned
+    touch(storage, hour_prefix(0) + "late.parquet")
+    spark = spark_writing_files(2)
+    engine = create_engine(storage, spark=spark)
+    engine.run_id = "run"
+    engine.compact_partition(hour_prefix(0), objects)
+    spark.read.parquet.assert_called_once_with(
+        *[storage.uri(key) for key, _ in objects]
+    )
+    assert [key for key, _ in storage.list_objects(hour_prefix(0))] == [
+        hour_prefix(0) + "compacted-run/part-0.parquet",
+        hour_prefix(0) + "compacted-run/part-1.parquet",
+        hour_prefix(0) + "late.parquet",
+    ]
+    assert engine.partition_reports[0]["files_in"] == 3
+    assert engine.partition_reports[0]["files_out"] == 2
+
+
+def test_committed_compaction_is_rolled_forward(storage):
+    old_keys = [hour_prefix(0) + f"file-{i}.parquet" for i in range(2)]
+    for key in old_keys:
+        touch(storage, key)
+    touch(storage, hour_prefix(0) + "compacted-run/part-0.parquet")
+    storage.write_json(
+        hour_prefix(0) + compaction.COMMIT_RECORD_NAME,
+        {"state": "committed", "generation": "compacted-run", "old_keys": old_keys},
+    )
+    create_engine(storage).recover_partition(hour_prefix(0))
+    assert storage.list_objects(hour_prefix(0)) == [
+        (hour_prefix(0) + "compacted-run/part-0.parquet", 10)
+    ]
+
+
+def test_committed_rollup_is_rolled_forward_before_rolling_up_again(storage):
+    # Regression: the hourly files deleted by the recovery of an interrupted daily rollup were
+    # rolled up again
+    day_prefix = DATA_FOLDER + "year=2024/month=06/day=20/"
+    old_keys = [hour_prefix(0) + "a.parquet", hour_prefix(1) + "b.parquet"]
+    for key in old_keys:
+        touch(storage, key)
+    touch(storage, day_prefix + "compacted-run/part-0.parquet")
+    # Interrupted after the commit record was marked as committed, before the deletion
+    storage.write_json(
+        day_prefix + compaction.COMMIT_RECORD_NAME,
+        {"state": "committed", "generation": "compacted-run", "old_keys": old_keys},
+    )
+    # Written late by the Feature Store
+    touch(storage, hour_prefix(2) + "c.parquet")
+    spark = spark_writing_files(1)
+    engine = create_engine(storage, spark=spark)
+    engine.run_id = "rerun"
+    assert engine.rollup_partitions([day_prefix]) == [day_prefix.strip("/")]
+    read_keys = [
+        day_prefix + "compacted-run/part-0.parquet",
+        hour_prefix(2) + "c.parquet",
+    ]
+    spark.read.parquet.assert_called_once_with(*[storage.uri(key) for key in read_keys])
+    assert [key for key, _ in storage.list_objects(day_prefix)] == [
+        day_prefix + "compacted-rerun/part-0.parquet"
+    ]
+
+
+def test_records_are_not_deduped_by_default(storage):
+    df = mock.MagicMock(columns=["tx_minute", "event_time", "write_time"])
+    create_engine(storage).prepare_records(df, 2)
+    df.withColumn.assert_not_called()
+    df.repartitionByRange.assert_called_once_with(2, "tx_minute")
+
+
+def test_first_run_skips_the_rolled_up_month_folders(storage):
+    # Regression: the compacted folder of a rolled up month was discovered as a day partition
+    touch(storage, DATA_FOLDER + "year=2024/month=03/compacted-old/part-0.parquet")
+    touch(storage, DATA_FOLDER + "year=2024/month=03/compacted-old/part-1.parquet")
+    touch(storage, hour_prefix(0) + "file.parquet")
+    engine = create_engine(storage)
+    assert engine.discover_all_day_prefixes(DATA_FOLDER) == [
+        DATA_FOLDER + "year=2024/month=06/day=20/"
+    ]
+    summary = engine.run(FEATURE_GROUP_FOLDER, now=START_TIME + timedelta(hours=2))
+    assert summary["compacted_partitions"] == []
+    assert summary["visited_partitions"] == 1
+
+
+def test_rollup_prefixes_before(storage):
+    touch(storage, DATA_FOLDER + "year=2024/month=03/compacted-old/part-0.parquet")
+    touch(
+        storage, DATA_FOLDER + "year=2024/month=05/day=31/compacted-old/part-0.parquet"
+    )
+    touch(storage, hour_prefix(0) + "file.parquet")
+    touch(storage, hour_prefix(48) + "file.parquet")
+    engine = create_engine(storage)
+    cutoff = (START_TIME + timedelta(days=2)).date()
+    assert engine.rollup_prefixes_before(DATA_FOLDER, "day", None, cutoff) == [
+        DATA_FOLDER + "year=2024/month=05/day=31/",
+        DATA_FOLDER + "year=2024/month=06/day=20/",
+    ]
+    assert engine.rollup_prefixes_before(DATA_FOLDER, "month", None, cutoff) == [
+        DATA_FOLDER + "year=2024/month=03/",
+        DATA_FOLDER + "year=2024/month=05/",
+        DATA_FOLDER + "year=2024/month=06/",
+    ]
+    watermark = START_TIME.date()
+    assert engine.rollup_prefixes_before(DATA_FOLDER, "day", watermark, cutoff) == [
+        DATA_FOLDER + "year=2024/month=06/day=20/",
+        DATA_FOLDER + "year=2024/month=06/day=21/",
+    ]
+    assert engine.rollup_prefixes_before(
+        DATA_FOLDER, "month", date(2024, 4, 1), date(2024, 6, 1)
+    ) == [DATA_FOLDER + "year=2024/month=04/", DATA_FOLDER + "year=2024/month=05/"]
@@ -0,0 +1,122 @@
+import os
+import shutil
+from datetime import timedelta
+
+import pytest
+
+pytest.importorskip("pyspark")
+pytest.importorskip("pyarrow")
+
+import harness  # noqa: E402
+from harness import compaction  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def spark():
+    return harness.create_local_spark_session()
+
+
+def latest_versions(records):
+    latest = {}
+    for record in records:
+        current = latest.get(record["tx_minute"])
+        if current is None or record["event_time"] > current["event_time"]:
+            latest[record["tx_minute"]] = record
+    return [latest[tx_minute] for tx_minute in sorted(latest)]
+
+
+def test_compaction_keeps_every_record_version_by_default(spark, tmp_path):
+    root = str(tmp_path)
+    harness.generate_offline_store(root, 2, files_per_hour=6)
+    expected = sorted(
+        harness.read_offline_store(root),
+        key=lambda record: (record["tx_minute"], record["event_time"]),
+    )
+    engine = harness.create_local_compaction(spark, root)
+    engine.run(
+        harness.FEATURE_GROUP_FOLDER, now=harness.START_TIME + timedelta(hours=2)
+    )
+    records = sorted(
+        harness.read_offline_store(root),
+        key=lambda record: (record["tx_minute"], record["event_time"]),
+    )
+    assert records == expected
+
+
+def test_compaction_keeps_latest_record_versions(spark, tmp_path):
+    root = str(tmp_path)
+    nb_records = harness.generate_offline_store(root, 3, files_per_hour=6)
+    expected = latest_versions(harness.read_offline_store(root))
+    engine = harness.create_local_compaction(spark, root, dedupe_records=True)
+    summary = engine.run(
+        harness.FEATURE_GROUP_FOLDER, now=harness.START_TIME + timedelta(hours=3)
+    )
+    assert summary["files_in"] == 18
+    assert harness.count_data_files(root)[0] == 3
+    records = harness.read_offline_store(root)
+    assert len(records) == nb_records
+    assert records == expected
+
+
+def test_interrupted_compaction_is_rolled_back(spark, tmp_path):
+    root = str(tmp_path)
+    harness.generate_offline_store(root, 1, files_per_hour=4)
+    expected = latest_versions(harness.read_offline_store(root))
+    # Simulate a run which wrote part of its compacted files before failing
+    storage = compaction.LocalStorage(root)
+    partition_prefix = (
+        harness.FEATURE_GROUP_FOLDER
+        + "data/"
+        + harness.START_TIME.strftime(compaction.HOUR_PREFIX_FORMAT)
+    )
+    old_keys = [key for key, _ in storage.list_objects(partition_prefix)]
+    os.makedirs(storage.path(partition_prefix + "compacted-failed-run/"))
+    shutil.copy(
+        storage.path(old_keys[0]),
+        storage.path(partition_prefix + "compacted-failed-run/part-0.parquet"),
+    )
+    storage.write_json(
+        partition_prefix + compaction.COMMIT_RECORD_NAME,
+        {
+            "state": "pending",
+            "generation": "compacted-failed-run",
+            "old_keys": old_keys,
+        },
+    )
+    engine = harness.create_local_compaction(spark, root)
+    engine.run(
+        harness.FEATURE_GROUP_FOLDER, now=harness.START_TIME + timedelta(hours=1)
+    )
+    assert harness.read_offline_store(root) == expected
+    assert not os.path.exists(
+        storage.path(partition_prefix + compaction.COMMIT_RECORD_NAME)
+    )
+    assert not os.path.exists(storage.path(partition_prefix + "compacted-failed-run"))
+
+
+def test_incremental_run_only_visits_recent_partitions(spark, tmp_path):
+    root = str(tmp_path)
+    harness.generate_offline_store(root, 6, files_per_hour=2)
+    engine = harness.create_local_compaction(spark, root, lookback_hours=1)
+    now = harness.START_TIME + timedelta(hours=6)
+    engine.run(harness.FEATURE_GROUP_FOLDER, now=now)
+    summary = engine.run(harness.FEATURE_GROUP_FOLDER, now=now + timedelta(hours=1))
+    # Only the hour before the watermark exists within the lookback window
+    assert summary["visited_partitions"] == 1
+    assert summary["compacted_partitions"] == []
+    manifest = compaction.LocalStorage(root).read_json(
+        harness.FEATURE_GROUP_FOLDER + compaction.MANIFEST_FILE_NAME
+    )
+    assert manifest["watermark"] == "2024-06-20T07"
+
+
+def test_daily_rollup_merges_the_hours_of_old_days(spark, tmp_path):
+    root = str(tmp_path)
+    nb_records = harness.generate_offline_store(root, 48, files_per_hour=2)
+    engine = harness.create_local_compaction(spark, root, daily_rollup_after_days=1)
+    summary = engine.run(
+        harness.FEATURE_GROUP_FOLDER, now=harness.START_TIME + timedelta(days=3)
+    )
+    assert len(summary["rolled_up_partitions"]) == 2
+    assert harness.count_data_files(root)[0] == 2
+    assert len(harness.read_offline_store(root)) == nb_records
@@ -3,16 +3,51 @@ from awsglue.utils import getResolvedOptions
 from pyspark.context import SparkContext
 from awsglue.context import GlueContext
 from awsglue.job import Job
+from botocore.config import Config
 import boto3
-import math
+
+# Shipped with the job with the --extra-py-files argument
+from feature_store_compaction import (
+    MAX_LISTING_WORKERS,
+    FeatureStoreCompaction,
+    S3Storage,
+)
 
 ## @params: [JOB_NAME]
 args = getResolvedOptions(
     sys.argv, ["JOB_NAME", "s3_bucket_name", "prefix", "target_file_size_in_bytes"]
 )
-
-sc = SparkContext()
-glueContext = GlueContext(sc)
+# Optional parameters
+# lookback_hours: number of hours before the last run watermark which are visited again
+# to compact the files written late by the Feature Store offline store
+# dedupe_records: keep only the latest version of each record in the compacted files.
+# Opt-in, the record versions history of the offline store is kept by default
+# record_identifier / event_time_feature: the feature group record identifier and event
+# time feature names, used to dedupe and sort the records
+# parquet_compression, parquet_block_size, parquet_page_size: compacted files Parquet
+# codec, row group and page sizes in bytes
+# daily_rollup_after_days: number of days after which the hourly partitions of a day are
+# merged into daily files. 0 disables the daily rollup
+# monthly_rollup_after_months: number of months after which the partitions of a month are
+# merged into monthly files. 0 disables the monthly rollup
+optional_args = {
+    "lookback_hours": "2",
+    "daily_rollup_after_days": "0",
+    "monthly_rollup_after_months": "0",
+    "dedupe_records": "false",
+    "record_identifier": "tx_minute",
+    "event_time_feature": "event_time",
+    "parquet_compression": "zstd",
+    "parquet_block_size": "134217728",
+    "parquet_page_size": "1048576",
+}
+for arg_name, default_value in optional_args.items():
+    if f"--{arg_name}" in sys.argv:
+        args.update(getResolvedOptions(sys.argv, [arg_name]))
+    else:
+        args[arg_name] = default_value
+
+glueContext = GlueContext(SparkContext())
 spark = glueContext.spark_session
 job = Job(glueContext)
 job.init(args["JOB_NAME"], args)
@@ -25,88 +60,43 @@ prefix = args["prefix"]  # Do not include trailing /
 target_file_size_in_bytes = int(
     args["target_file_size_in_bytes"]
 )  # 536,870,912 (.5 GB) - 1,073,741,824 (1 GB) is recomended
-subfolders = []
 
 # Validate configuration information
 s3_bucket_name = s3_bucket_name.rstrip("/")
 
-s3_client = boto3.client("s3")
-
-result = s3_client.list_objects_v2(Bucket=s3_bucket_name, Delimiter="/", Prefix=prefix)
-datafolder = result.get("CommonPrefixes")[0].get("Prefix") + "data/"
-result = s3_client.list_objects_v2(
-    Bucket=s3_bucket_name, Delimiter="/", Prefix=datafolder
+# boto3 clients are thread safe. Size the connection pool for the concurrent listings
+s3_client = boto3.client("s3", config=Config(max_pool_connections=MAX_LISTING_WORKERS))
+storage = S3Storage(s3_client, s3_bucket_name)
+
+compaction = FeatureStoreCompaction(
+    spark,
+    storage,
+    target_file_size_in_bytes,
+    lookback_hours=int(args["lookback_hours"]),
+    daily_rollup_after_days=int(args["daily_rollup_after_days"]),
+    monthly_rollup_after_months=int(args["monthly_rollup_after_months"]),
+    dedupe_records=args["dedupe_records"].lower() == "true",
+    record_identifier=args["record_identifier"],
+    event_time_feature=args["event_time_feature"],
+    parquet_write_options={
+        "compression": args["parquet_compression"],
+        "parquet.block.size": args["parquet_block_size"],
+        "parquet.page.size": args["parquet_page_size"],
+        # Keep the dictionary encoding and min/max statistics used by Athena to skip row groups
+        "parquet.enable.dictionary": "true",
+    },
+    logger=logger,
+)
+feature_group_folder = storage.list_common_prefixes(prefix)[0]
+summary = compaction.run(feature_group_folder)
+logger.info(
+    "Rewrote "
+    + str(summary["bytes_rewritten"])
+    + " bytes from "
+    + str(summary["files_in"])
+    + " files into "
+    + str(summary["files_out"])
+    + " files"
 )
-for year in result.get("CommonPrefixes"):
-    result = s3_client.list_objects_v2(
-        Bucket=s3_bucket_name, Delimiter="/", Prefix=year.get("Prefix")
-    )
-    for month in result.get("CommonPrefixes"):
-        result = s3_client.list_objects_v2(
-            Bucket=s3_bucket_name, Delimiter="/", Prefix=month.get("Prefix")
-        )
-        for day in result.get("CommonPrefixes"):
-            result = s3_client.list_objects_v2(
-                Bucket=s3_bucket_name, Delimiter="/", Prefix=day.get("Prefix")
-            )
-            for hour in result.get("CommonPrefixes"):
-                files = s3_client.list_objects_v2(
-                    Bucket=s3_bucket_name, Prefix=hour.get("Prefix")
-                )
-                fileCount = files["KeyCount"]
-                if fileCount > 1:
-                    subfolders.append(hour.get("Prefix").strip("/"))
-
-session = boto3.Session()
-s3 = session.resource("s3")
-my_bucket = s3.Bucket(s3_bucket_name)
-
-for subfolder in subfolders:
-    total_prefix_size = 0
-
-    logger.info("Working in subfolder: " + subfolder)
-
-    for my_bucket_object in my_bucket.objects.filter(Prefix=subfolder + "/"):
-        object = s3.Object(s3_bucket_name, my_bucket_object.key)
-        total_prefix_size = total_prefix_size + object.content_length
-        # Optional - log each file + size in the prefix
-        # logger.info(my_bucket_object.key + ": " + str(object.content_length) + " bytes")
-
-    logger.info(
-        "Total prefix size of " + subfolder + "/: " + str(total_prefix_size) + " bytes"
-    )
-
-    target_number_of_files = math.ceil(total_prefix_size / target_file_size_in_bytes)
-
-    logger.info("Target number of files: " + str(target_number_of_files))
-
-    # Read the prefix and coalesce the dataframe to the target number of file
-    prefix_df = spark.read.parquet("s3://" + s3_bucket_name + "/" + subfolder + "/*")
-    prefix_df = prefix_df.coalesce(target_number_of_files)
-
-    # Write data to a new temp prefix
-    prefix_df.write.parquet(
-        "s3://" + s3_bucket_name + "/" + subfolder + "_temp/", mode="overwrite"
-    )
-
-    logger.info("Coalesced data to prefix: " + subfolder + "_temp/")
-
-    # Delete the prefix
-    for my_bucket_object in my_bucket.objects.filter(Prefix=subfolder + "/"):
-        my_bucket_object.delete()
-
-    logger.info("Deleted prefix: " + subfolder + "/")
-
-    # 'Rename' the temp prefix
-    for my_bucket_object in my_bucket.objects.filter(Prefix=subfolder + "_temp/"):
-        old_source = {"Bucket": s3_bucket_name, "Key": my_bucket_object.key}
-        new_key = my_bucket_object.key.replace(subfolder + "_temp/", subfolder + "/", 1)
-        new_obj = my_bucket.Object(new_key)
-        new_obj.copy(old_source)
-
-    logger.info("Copied prefix: " + subfolder + "_temp/ to prefix" + subfolder + "/")
-
-    for my_bucket_object in my_bucket.objects.filter(Prefix=subfolder + "_temp/"):
-        my_bucket_object.delete()
 
-    logger.info("Deleted prefix: " + subfolder + "_temp/")
+job.commit()
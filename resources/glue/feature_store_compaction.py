@@ -0,0 +1,620 @@
+"""Compaction engine of the SageMaker Feature Store offline store.
+
+The engine only depends on PySpark and on a storage abstraction, so that the same logic is
+run by the Glue job (FeatureStoreAggregateParquet.py) against S3 and locally, against a
+folder on disk (see resources/glue-local).
+
+Offline store layout:
+    <feature group folder>/data/year=YYYY/month=MM/day=DD/hour=HH/<file>.parquet
+Compacted files are written in a compacted-<run id>/ folder of the hour, day (daily
+rollup) or month (monthly rollup) partition.
+"""
+
+import json
+import logging
+import math
+import os
+import re
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+
+from pyspark.sql import Window
+from pyspark.sql import functions as F
+
+# The manifest is stored next to the "data/" folder of the feature group, outside of the
+# Glue table location so that it is not read by Athena
+MANIFEST_FILE_NAME = "compaction-manifest.json"
+HOUR_PREFIX_FORMAT = "year=%Y/month=%m/day=%d/hour=%H/"
+DAY_PREFIX_FORMAT = "year=%Y/month=%m/day=%d/"
+MONTH_PREFIX_FORMAT = "year=%Y/month=%m/"
+PREFIX_DATE_PATTERN = re.compile(r"year=(\d{4})/month=(\d{2})/(?:day=(\d{2})/)?$")
+# Data files of an hourly, daily (rolled up hours) or monthly (rolled up days) partition,
+# either written by the Feature Store or in a compacted generation folder.
+# Athena and Spark ignore the files starting with "_" or "."
+PARTITION_PATTERN = re.compile(
+    r"^(.*/year=\d{4}/month=\d{2}/(?:day=\d{2}/(?:hour=\d{2}/)?)?)(?:compacted-[^/]+/)?([^/]+)$"
+)
+HIDDEN_FILE_PREFIXES = ("_", ".")
+# Hidden record of an in-progress compaction, used to recover from an interrupted run
+COMMIT_RECORD_NAME = "_compaction-commit.json"
+# Maximum number of keys per DeleteObjects request
+DELETE_BATCH_SIZE = 1000
+# Number of concurrent listing requests
+MAX_LISTING_WORKERS = 32
+
+
+class S3Storage:
+    """Offline store objects in an S3 bucket. boto3 clients are thread safe, size the
+    client connection pool for MAX_LISTING_WORKERS concurrent listings.
+    """
+
+    def __init__(self, s3_client, bucket_name):
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+
+    def uri(self, key):
+        return "s3://" + self.bucket_name + "/" + key
+
+    def list_common_prefixes(self, list_prefix):
+        prefixes = []
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(
+            Bucket=self.bucket_name, Delimiter="/", Prefix=list_prefix
+        ):
+            prefixes.extend(p["Prefix"] for p in page.get("CommonPrefixes", []))
+        return prefixes
+
+    def list_objects(self, list_prefix):
+        # The sizes are returned by the listing, no need to request the objects metadata
+        objects = []
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=list_prefix):
+            objects.extend((o["Key"], o["Size"]) for o in page.get("Contents", []))
+        return objects
+
+    def read_json(self, key):
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=key)
+        except self.s3_client.exceptions.NoSuchKey:
+            return None
+        return json.loads(response["Body"].read())
+
+    def write_json(self, key, content):
+        self.s3_client.put_object(
+            Bucket=self.bucket_name,
+            Key=key,
+            Body=json.dumps(content, indent=2).encode("utf-8"),
+        )
+
+    def delete_objects(self, keys):
+        for i in range(0, len(keys), DELETE_BATCH_SIZE):
+            response = self.s3_client.delete_objects(
+                Bucket=self.bucket_name,
+                Delete={
+                    "Objects": [
+                        {"Key": key} for key in keys[i : i + DELETE_BATCH_SIZE]
+                    ],
+                    "Quiet": True,
+                },
+            )
+            if response.get("Errors"):
+                raise RuntimeError(
+                    "Failed to delete objects: " + str(response["Errors"])
+                )
+
+
+class LocalStorage:
+    """Offline store objects in a local folder, the object keys being the paths relative to
+    the folder. Empty folders are removed, as there are no empty prefixes in S3.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def path(self, key):
+        return os.path.join(self.root, *key.split("/"))
+
+    def uri(self, key):
+        return "file://" + self.path(key)
+
+    def list_common_prefixes(self, list_prefix):
+        directory, name_prefix = os.path.split(self.path(list_prefix))
+        if not os.path.isdir(directory):
+            return []
+        parent_prefix = list_prefix[: len(list_prefix) - len(name_prefix)]
+        return sorted(
+            parent_prefix + name + "/"
+            for name in os.listdir(directory)
+            if name.startswith(name_prefix)
+            and os.path.isdir(os.path.join(directory, name))
+        )
+
+    def list_objects(self, list_prefix):
+        directory = self.path(list_prefix[: list_prefix.rfind("/") + 1])
+        objects = []
+        for dirpath, _, filenames in os.walk(directory):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                key = os.path.relpath(path, self.root).replace(os.sep, "/")
+                if key.startswith(list_prefix):
+                    objects.append((key, os.path.getsize(path)))
+        return sorted(objects)
+
+    def read_json(self, key):
+        if not os.path.isfile(self.path(key)):
+            return None
+        with open(self.path(key), "r") as f:
+            return json.load(f)
+
+    def write_json(self, key, content):
+        os.makedirs(os.path.dirname(self.path(key)), exist_ok=True)
+        with open(self.path(key), "w") as f:
+            json.dump(content, f, indent=2)
+
+    def delete_objects(self, keys):
+        for key in keys:
+            path = self.path(key)
+            if os.path.isfile(path):
+                os.remove(path)
+            directory = os.path.dirname(path)
+            while (
+                directory != self.root
+                and os.path.isdir(directory)
+                and not os.listdir(directory)
+            ):
+                os.rmdir(directory)
+                directory = os.path.dirname(directory)
+
+
+def prefix_date(partition_prefix):
+    year, month, day = PREFIX_DATE_PATTERN.search(partition_prefix).groups()
+    return date(int(year), int(month), int(day or 1))
+
+
+def add_months(month, months):
+    month_index = month.year * 12 + month.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def group_partition_files(objects, partitions, interrupted_partitions):
+    # Group the data files by partition prefix, objects outside of a partition are ignored
+    for key, size in objects:
+        match = PARTITION_PATTERN.match(key)
+        if not match:
+            continue
+        if match.group(2) == COMMIT_RECORD_NAME:
+            interrupted_partitions.add(match.group(1))
+        elif not match.group(2).startswith(HIDDEN_FILE_PREFIXES):
+            partitions[match.group(1)].append((key, size))
+
+
+class FeatureStoreCompaction:
+    """Compacts the small files written by the Feature Store in the offline store partitions.
+
+    Args:
+        spark (SparkSession): the Spark session reading and writing the Parquet files
+        storage (S3Storage | LocalStorage): the offline store objects
+        target_file_size_in_bytes (int): the target size of the compacted files
+        lookback_hours (int): number of hours before the last run watermark which are
+            visited again to compact the files written late by the Feature Store
+        daily_rollup_after_days (int): number of days after which the hourly partitions of
+            a day are merged into daily files. 0 disables the daily rollup
+        monthly_rollup_after_months (int): number of months after which the partitions of
+            a month are merged into monthly files. 0 disables the monthly rollup
+        dedupe_records (bool): keep only the latest version of each record. Off by default,
+            the offline store keeps the history of the record versions
+        record_identifier (str): the feature group record identifier feature name
+        event_time_feature (str): the feature group event time feature name
+        parquet_write_options (dict): the Parquet writer options of the compacted files
+        logger: the Glue logger, or a Python logger when running locally
+    """
+
+    def __init__(
+        self,
+        spark,
+        storage,
+        target_file_size_in_bytes,
+        lookback_hours=2,
+        daily_rollup_after_days=0,
+        monthly_rollup_after_months=0,
+        dedupe_records=False,
+        record_identifier="tx_minute",
+        event_time_feature="event_time",
+        parquet_write_options=None,
+        logger=None,
+    ):
+        self.spark = spark
+        self.storage = storage
+        self.target_file_size_in_bytes = target_file_size_in_bytes
+        self.lookback_hours = lookback_hours
+        self.daily_rollup_after_days = daily_rollup_after_days
+        self.monthly_rollup_after_months = monthly_rollup_after_months
+        self.dedupe_records = dedupe_records
+        self.record_identifier = record_identifier
+        self.event_time_feature = event_time_feature
+        self.parquet_write_options = parquet_write_options or {}
+        self.logger = logger or logging.getLogger(__name__)
+        # Do not write _SUCCESS files in the compacted partitions
+        spark.sparkContext._jsc.hadoopConfiguration().set(
+            "mapreduce.fileoutputcommitter.marksuccessfuljobs", "false"
+        )
+        self.run_id = None
+        self.partition_reports = []
+
+    def concurrent_map(self, function, items):
+        with ThreadPoolExecutor(max_workers=MAX_LISTING_WORKERS) as executor:
+            return list(executor.map(function, items))
+
+    def discover_partition_prefixes(self, datafolder, levels):
+        # Walk down the year/month/day partitions, listing all the prefixes of a level concurrently.
+        # The compacted generation folders of the rolled up partitions, listed next to the
+        # partitions of the level below, are skipped
+        prefixes = [datafolder]
+        for level in levels:
+            prefixes = [
+                p
+                for listed in self.concurrent_map(
+                    self.storage.list_common_prefixes, prefixes
+                )
+                for p in listed
+                if p[:-1].rsplit("/", 1)[-1].startswith(level + "=")
+            ]
+        return prefixes
+
+    def discover_all_day_prefixes(self, datafolder):
+        return self.discover_partition_prefixes(datafolder, ["year", "month", "day"])
+
+    def scan_partitions(self, list_prefixes):
+        """Lists all the objects under the prefixes concurrently and groups the data files by
+        partition prefix. Also returns the partitions with the commit record of an interrupted
+        compaction.
+        """
+        partitions = defaultdict(list)
+        interrupted_partitions = set()
+        for objects in self.concurrent_map(self.storage.list_objects, list_prefixes):
+            group_partition_files(objects, partitions, interrupted_partitions)
+        return partitions, interrupted_partitions
+
+    def prepare_records(self, df, target_number_of_files):
+        """Dedupes and sorts the records of a partition before they are written.
+
+        The Feature Store offline store appends a new row for each version of a record. Only
+        the latest one, by event time then write time, is kept when dedupe_records is set.
+        The records are range partitioned and sorted by record identifier, so that each file,
+        and each row group within, covers a distinct range of identifiers and Athena can skip
+        them using the min/max statistics.
+        """
+        if self.record_identifier not in df.columns:
+            return df.coalesce(target_number_of_files)
+        if self.dedupe_records:
+            order_columns = [
+                F.col(c).desc()
+                for c in [self.event_time_feature, "write_time", "api_invocation_time"]
+                if c in df.columns
+            ]
+            latest_first = Window.partitionBy(self.record_identifier).orderBy(
+                *order_columns
+            )
+            df = (
+                df.withColumn("_version", F.row_number().over(latest_first))
+                .filter(F.col("_version") == 1)
+                .drop("_version")
+            )
+        return df.repartitionByRange(
+            target_number_of_files, self.record_identifier
+        ).sortWithinPartitions(self.record_identifier)
+
+    def recover_partition(self, partition_prefix):
+        # Roll forward a compaction whose files were all written, roll back the others
+        commit_key = partition_prefix + COMMIT_RECORD_NAME
+        record = self.storage.read_json(commit_key)
+        if record["state"] == "committed":
+            self.logger.info("Rolling forward the compaction of " + partition_prefix)
+            self.storage.delete_objects(record["old_keys"] + [commit_key])
+        else:
+            self.logger.info("Rolling back the compaction of " + partition_prefix)
+            generation_keys = [
+                key
+                for key, _ in self.storage.list_objects(
+                    partition_prefix + record["generation"] + "/"
+                )
+            ]
+            self.storage.delete_objects(generation_keys + [commit_key])
+
+    def recover_partitions(self, partitions, interrupted_partitions):
+        """Recovers the interrupted compactions and lists the files of their partitions again.
+
+        A rolled forward rollup deletes the files of the sub-partitions of its partition, e.g.
+        the hourly files of a day, so all the partitions under a recovered prefix are listed
+        again rather than only the recovered one.
+        """
+        for partition_prefix in sorted(interrupted_partitions):
+            self.recover_partition(partition_prefix)
+        recovered_prefixes = [
+            prefix
+            for prefix in sorted(interrupted_partitions)
+            if not any(
+                prefix != other and prefix.startswith(other)
+                for other in interrupted_partitions
+            )
+        ]
+        for recovered_prefix in recovered_prefixes:
+            for partition_prefix in [
+                p for p in partitions if p.startswith(recovered_prefix)
+            ]:
+                del partitions[partition_prefix]
+            group_partition_files(
+                self.storage.list_objects(recovered_prefix), partitions, set()
+            )
+
+    def compact_partition(self, partition_prefix, objects):
+        """Compacts the data files of a partition without copying objects:
+            1. a hidden commit record lists the files to compact
+            2. the compacted files are written in a new generation folder of the partition
+            3. the commit record is marked as committed
+            4. the original files and the commit record are deleted in batches
+        Only the listed files are read and deleted, so files written by the Feature Store
+        in the meantime are kept. If the job is interrupted, the commit record is used by the
+        next run to roll the compaction forward or back. The record is only read by the job.
+
+        The original files are replaced in two steps, not swapped atomically. The Glue table of
+        the offline store is not partitioned and the Feature Store keeps writing under its
+        location, so the readers cannot be switched to the compacted files with a manifest or a
+        new table location. Athena reads the location recursively and reads the compacted files
+        as soon as they are written, together with the original files until these are deleted:
+        in between, queries return the records of the partition twice. The window lasts the
+        deletion requests, or until the next run if the job is interrupted before the deletion.
+        The queries of the model pipelines keep a single version of each record and are not
+        affected.
+        """
+        start = time.perf_counter()
+        commit_key = partition_prefix + COMMIT_RECORD_NAME
+        generation = "compacted-" + self.run_id
+        old_keys = [key for key, _ in objects]
+        total_prefix_size = sum(size for _, size in objects)
+
+        self.logger.info(
+            "Total prefix size of "
+            + partition_prefix
+            + ": "
+            + str(total_prefix_size)
+            + " bytes in "
+            + str(len(old_keys))
+            + " files"
+        )
+
+        target_number_of_files = math.ceil(
+            total_prefix_size / self.target_file_size_in_bytes
+        )
+
+        self.logger.info("Target number of files: " + str(target_number_of_files))
+
+        record = {"state": "pending", "generation": generation, "old_keys": old_keys}
+        self.storage.write_json(commit_key, record)
+
+        # Read the files and prepare the records for the target number of file
+        prefix_df = self.spark.read.parquet(
+            *[self.storage.uri(key) for key in old_keys]
+        )
+        prefix_df = self.prepare_records(prefix_df, target_number_of_files)
+
+        # The S3 optimized committer uploads the files directly to the generation folder,
+        # without rename. They are read by Athena as soon as they are uploaded
+        prefix_df.write.options(**self.parquet_write_options).parquet(
+            self.storage.uri(partition_prefix + generation + "/"),
+            mode="errorifexists",
+        )
+
+        self.logger.info(
+            "Coalesced data to prefix: " + partition_prefix + generation + "/"
+        )
+
+        record["state"] = "committed"
+        self.storage.write_json(commit_key, record)
+        self.storage.delete_objects(old_keys + [commit_key])
+
+        self.logger.info("Deleted the " + str(len(old_keys)) + " compacted files")
+
+        new_partitions = defaultdict(list)
+        group_partition_files(
+            self.storage.list_objects(partition_prefix + generation + "/"),
+            new_partitions,
+            set(),
+        )
+        new_objects = new_partitions[partition_prefix]
+        self.partition_reports.append(
+            {
+                "partition": partition_prefix,
+                "files_in": len(old_keys),
+                "files_out": len(new_objects),
+                "bytes_in": total_prefix_size,
+                "bytes_out": sum(size for _, size in new_objects),
+                "seconds": time.perf_counter() - start,
+            }
+        )
+
+    def rollup_partitions(self, rollup_prefixes):
+        """Merges all the data files under each prefix, whatever the partition they are in,
+        into files at the prefix level. Returns the rolled up prefixes.
+        """
+        rolled_up_prefixes = []
+        for rollup_prefix, objects in zip(
+            rollup_prefixes,
+            self.concurrent_map(self.storage.list_objects, rollup_prefixes),
+        ):
+            partitions = defaultdict(list)
+            interrupted_partitions = set()
+            group_partition_files(objects, partitions, interrupted_partitions)
+            self.recover_partitions(partitions, interrupted_partitions)
+            files = [file for partition in partitions.values() for file in partition]
+            if len(files) > 1:
+                self.logger.info("Rolling up partition: " + rollup_prefix)
+                self.compact_partition(rollup_prefix, files)
+                rolled_up_prefixes.append(rollup_prefix.strip("/"))
+        return rolled_up_prefixes
+
+    def rollup_prefixes_before(self, datafolder, level, watermark, cutoff):
+        """Returns the day or month prefixes from the watermark, or from the first partition if
+        there is no watermark, to the cutoff date excluded.
+        """
+        if watermark is None:
+            if level == "day":
+                prefixes = self.discover_all_day_prefixes(datafolder)
+            else:
+                prefixes = self.discover_partition_prefixes(
+                    datafolder, ["year", "month"]
+                )
+            return [p for p in prefixes if prefix_date(p) < cutoff]
+        prefixes = []
+        current = watermark
+        while current < cutoff:
+            if level == "day":
+                prefixes.append(datafolder + current.strftime(DAY_PREFIX_FORMAT))
+                current += timedelta(days=1)
+            else:
+                prefixes.append(datafolder + current.strftime(MONTH_PREFIX_FORMAT))
+                current = add_months(current, 1)
+        return prefixes
+
+    def hour_prefixes_since(self, datafolder, start_hour, end_hour):
+        # The offline store partitions are named after the hours, so the partitions written
+        # since the last run can be derived from the watermark without listing the history
+        hour_prefixes = []
+        hour = start_hour
+        while hour <= end_hour:
+            hour_prefixes.append(datafolder + hour.strftime(HOUR_PREFIX_FORMAT))
+            hour += timedelta(hours=1)
+        return hour_prefixes
+
+    def run(self, feature_group_folder, now=None):
+        """Compacts the partitions of a feature group written since the last run, rolls up the
+        old partitions and moves the manifest watermarks.
+
+        Args:
+            feature_group_folder (str): the feature group folder prefix, ending with "/"
+            now (datetime): the run time in UTC. Defaults to the current time
+
+        Returns:
+            dict: the run summary written in the manifest, with a report per compacted partition
+        """
+        now = now or datetime.now(timezone.utc)
+        self.run_id = now.strftime("%Y%m%dT%H%M%S") + "-" + uuid.uuid4().hex[:8]
+        self.partition_reports = []
+        datafolder = feature_group_folder + "data/"
+        manifest_key = feature_group_folder + MANIFEST_FILE_NAME
+
+        # The current hour is still being written to, so it is visited again by the next run
+        run_hour = now.replace(minute=0, second=0, microsecond=0)
+        manifest = self.storage.read_json(manifest_key)
+        if manifest is None:
+            self.logger.info(
+                "No compaction manifest found. Visiting all the partitions."
+            )
+            list_prefixes = self.discover_all_day_prefixes(datafolder)
+        else:
+            watermark = datetime.strptime(manifest["watermark"], "%Y-%m-%dT%H").replace(
+                tzinfo=timezone.utc
+            )
+            self.logger.info(
+                "Visiting the partitions since the watermark "
+                + manifest["watermark"]
+                + " minus "
+                + str(self.lookback_hours)
+                + " hours"
+            )
+            list_prefixes = self.hour_prefixes_since(
+                datafolder, watermark - timedelta(hours=self.lookback_hours), run_hour
+            )
+
+        subfolders = []
+        partitions, interrupted_partitions = self.scan_partitions(list_prefixes)
+        self.recover_partitions(partitions, interrupted_partitions)
+        for hour_prefix, objects in sorted(partitions.items()):
+            if len(objects) > 1:
+                subfolders.append(hour_prefix.strip("/"))
+
+        self.logger.info(
+            "Visited "
+            + str(len(partitions))
+            + " partitions, "
+            + str(len(subfolders))
+            + " to compact"
+        )
+
+        for subfolder in subfolders:
+            self.logger.info("Working in subfolder: " + subfolder)
+            self.compact_partition(subfolder + "/", partitions[subfolder + "/"])
+
+        # Roll up the old hourly partitions into daily files, then the old days into monthly
+        # files. The rollup watermarks are the first day and month which are not rolled up yet
+        previous_manifest = manifest or {}
+        rollup_watermarks = {
+            name: previous_manifest[name]
+            for name in ["daily_rollup_watermark", "monthly_rollup_watermark"]
+            if name in previous_manifest
+        }
+        rolled_up_partitions = []
+        if self.daily_rollup_after_days > 0:
+            daily_cutoff = run_hour.date() - timedelta(
+                days=self.daily_rollup_after_days
+            )
+            daily_watermark = rollup_watermarks.get("daily_rollup_watermark")
+            rolled_up_partitions += self.rollup_partitions(
+                self.rollup_prefixes_before(
+                    datafolder,
+                    "day",
+                    datetime.strptime(daily_watermark, "%Y-%m-%d").date()
+                    if daily_watermark
+                    else None,
+                    daily_cutoff,
+                )
+            )
+            rollup_watermarks["daily_rollup_watermark"] = daily_cutoff.strftime(
+                "%Y-%m-%d"
+            )
+        if self.monthly_rollup_after_months > 0:
+            monthly_cutoff = add_months(
+                run_hour.date().replace(day=1), -self.monthly_rollup_after_months
+            )
+            monthly_watermark = rollup_watermarks.get("monthly_rollup_watermark")
+            rolled_up_partitions += self.rollup_partitions(
+                self.rollup_prefixes_before(
+                    datafolder,
+                    "month",
+                    datetime.strptime(monthly_watermark, "%Y-%m").date()
+                    if monthly_watermark
+                    else None,
+                    monthly_cutoff,
+                )
+            )
+            rollup_watermarks["monthly_rollup_watermark"] = monthly_cutoff.strftime(
+                "%Y-%m"
+            )
+
+        # Only move the watermark once all the partitions have been compacted, so that a failed
+        # run is retried from the same watermark
+        last_run = {
+            "run_time": now.isoformat(),
+            "visited_partitions": len(partitions),
+            "compacted_partitions": subfolders,
+            "rolled_up_partitions": rolled_up_partitions,
+            "files_in": sum(r["files_in"] for r in self.partition_reports),
+            "files_out": sum(r["files_out"] for r in self.partition_reports),
+            "bytes_rewritten": sum(r["bytes_in"] for r in self.partition_reports),
+        }
+        self.storage.write_json(
+            manifest_key,
+            {
+                "watermark": run_hour.strftime("%Y-%m-%dT%H"),
+                **rollup_watermarks,
+                "last_run": last_run,
+            },
+        )
+        self.logger.info(
+            "Updated the compaction manifest watermark to "
+            + run_hour.strftime("%Y-%m-%dT%H")
+        )
+        return {**last_run, "partitions": self.partition_reports}
@@ -0,0 +1,172 @@
+import os
+from datetime import datetime, timedelta, timezone
+import boto3
+from aws_lambda_powertools import Logger
+from scaling import (
+    DEFAULT_SCALING_CONFIG,
+    METRIC_PERIOD_SECONDS,
+    ScalingConfig,
+    decide_parallelism,
+)
+
+logger = Logger()
+kda_client = boto3.client("kinesisanalyticsv2")
+cw_client = boto3.client("cloudwatch")
+kinesis_client = boto3.client("kinesis")
+
+FLINK_APPLICATION_NAME = os.environ["FLINK_APPLICATION_NAME"]
+INGESTION_STREAM_NAME = os.environ["INGESTION_STREAM_NAME"]
+# In dry-run mode the decisions are only logged, the application is not updated
+DRY_RUN = os.environ.get("DRY_RUN", "true").lower() == "true"
+PARALLELISM_PER_KPU = int(os.environ.get("PARALLELISM_PER_KPU", "1"))
+
+SCALING_CONFIG: ScalingConfig = {
+    key: type(value)(os.environ.get(key.upper(), value))
+    for key, value in DEFAULT_SCALING_CONFIG.items()
+}
+
+
+@logger.inject_lambda_context(log_event=True)
+def lambda_handler(event, context):
+    application = kda_client.describe_application(
+        ApplicationName=FLINK_APPLICATION_NAME, IncludeAdditionalDetails=False
+    )["ApplicationDetail"]
+    application_status = application["ApplicationStatus"]
+    if application_status != "RUNNING":
+        logger.info(f"Cannot scale the application in the {application_status} state.")
+        return
+    parallelism_configuration = application["ApplicationConfigurationDescription"][
+        "FlinkApplicationConfigurationDescription"
+    ]["ParallelismConfigurationDescription"]
+    current_parallelism = parallelism_configuration["CurrentParallelism"]
+    current_parallelism_per_kpu = parallelism_configuration["ParallelismPerKPU"]
+    last_update = application.get(
+        "LastUpdateTimestamp", application.get("CreateTimestamp")
+    )
+    periods_since_last_update = int(
+        (datetime.now(timezone.utc) - last_update).total_seconds()
+        // METRIC_PERIOD_SECONDS
+    )
+
+    lag_ms, backpressure_ms = get_metric_samples(
+        max(SCALING_CONFIG["scale_up_periods"], SCALING_CONFIG["scale_down_periods"])
+    )
+    # The Kinesis source reads each shard with a single subtask, more subtasks would be idle
+    shard_count = kinesis_client.describe_stream_summary(
+        StreamName=INGESTION_STREAM_NAME
+    )["StreamDescriptionSummary"]["OpenShardCount"]
+    new_parallelism, reason = decide_parallelism(
+        lag_ms,
+        backpressure_ms,
+        current_parallelism,
+        periods_since_last_update,
+        SCALING_CONFIG,
+        shard_count,
+    )
+    logger.info(
+        {
+            "current_parallelism": current_parallelism,
+            "new_parallelism": new_parallelism,
+            "reason": reason,
+            "periods_since_last_update": periods_since_last_update,
+            "shard_count": shard_count,
+            "lag_ms": lag_ms,
+            "backpressure_ms": backpressure_ms,
+            "dry_run": DRY_RUN,
+        }
+    )
+    if (
+        new_parallelism == current_parallelism
+        and current_parallelism_per_kpu == PARALLELISM_PER_KPU
+    ):
+        return
+    if DRY_RUN:
+        logger.info("Dry-run mode: the application parallelism is not updated.")
+        return
+    kda_client.update_application(
+        ApplicationName=FLINK_APPLICATION_NAME,
+        CurrentApplicationVersionId=application["ApplicationVersionId"],
+        ApplicationConfigurationUpdate={
+            "FlinkApplicationConfigurationUpdate": {
+                "ParallelismConfigurationUpdate": {
+                    "ConfigurationTypeUpdate": "CUSTOM",
+                    "ParallelismUpdate": new_parallelism,
+                    "ParallelismPerKPUUpdate": PARALLELISM_PER_KPU,
+                    # This controller replaces the built-in CPU based autoscaling
+                    "AutoScalingEnabledUpdate": False,
+                }
+            }
+        },
+    )
+    logger.info(
+        f"Updated the application parallelism from {current_parallelism} to {new_parallelism}."
+    )
+
+
+def get_metric_samples(nb_periods: int) -> tuple[list[float], list[float]]:
+    """Reads the consumer lag and the backpressure of the Flink application over the last
+    periods. The consumer lag is the maximum of the Flink Kinesis source millisBehindLatest
+    and the ingestion stream iterator age.
+
+    Args:
+        nb_periods (int): the number of metric periods to read
+
+    Returns:
+        tuple[list[float], list[float]]: the lag and backpressure samples, oldest first
+    """
+    end_time = datetime.now(timezone.utc)
+    start_time = end_time - timedelta(seconds=nb_periods * METRIC_PERIOD_SECONDS)
+    queries = {
+        "millis_behind_latest": (
+            "AWS/KinesisAnalytics",
+            "millisBehindLatest",
+            [{"Name": "Application", "Value": FLINK_APPLICATION_NAME}],
+        ),
+        "iterator_age": (
+            "AWS/Kinesis",
+            "GetRecords.IteratorAgeMilliseconds",
+            [{"Name": "StreamName", "Value": INGESTION_STREAM_NAME}],
+        ),
+        "backpressure": (
+            "AWS/KinesisAnalytics",
+            "backPressuredTimeMsPerSecond",
+            [{"Name": "Application", "Value": FLINK_APPLICATION_NAME}],
+        ),
+    }
+    response = cw_client.get_metric_data(
+        MetricDataQueries=[
+            {
+                "Id": query_id,
+                "MetricStat": {
+                    "Metric": {
+                        "Namespace": namespace,
+                        "MetricName": metric_name,
+                        "Dimensions": dimensions,
+                    },
+                    "Period": METRIC_PERIOD_SECONDS,
+                    "Stat": "Maximum",
+                },
+            }
+            for query_id, (namespace, metric_name, dimensions) in queries.items()
+        ],
+        StartTime=start_time,
+        EndTime=end_time,
+        ScanBy="TimestampAscending",
+    )
+    samples = {query_id: {} for query_id in queries}
+    for result in response["MetricDataResults"]:
+        samples[result["Id"]] = dict(zip(result["Timestamps"], result["Values"]))
+    # Keep the periods for which the application or the stream reported a lag. The metrics
+    # missing in a period (e.g. the source lag during a restart) count as 0
+    timestamps = sorted(
+        set(samples["millis_behind_latest"]) | set(samples["iterator_age"])
+    )
+    lag_ms = [
+        max(
+            samples["millis_behind_latest"].get(t, 0.0),
+            samples["iterator_age"].get(t, 0.0),
+        )
+        for t in timestamps
+    ]
+    backpressure_ms = [samples["backpressure"].get(t, 0.0) for t in timestamps]
+    return lag_ms, backpressure_ms
@@ -0,0 +1,190 @@
+"""Parallelism scaling decisions for the Managed Service for Apache Flink application.
+
+The decision logic only depends on the metric samples it is given, so that it can be
+replayed offline against recorded metric traces:
+
+    python scaling.py --trace trace.json --initial-parallelism 1 --shard-count 4
+
+where trace.json is a list of {"lag_ms": ..., "backpressure_ms": ...} samples, one per
+metric period, in chronological order.
+"""
+
+import argparse
+import json
+from typing import Optional, TypedDict
+
+# The controller reads the metrics per period of 1 minute and is scheduled every 5 minutes
+# (keep in sync with the schedule rule of lib/sagemaker/scale-flink-app.ts)
+METRIC_PERIOD_SECONDS = 60
+SCHEDULE_INTERVAL_SECONDS = 300
+
+
+class ScalingConfig(TypedDict):
+    min_parallelism: int
+    max_parallelism: int
+    # Scale up when the consumer lag or the backpressure stay above these thresholds
+    # for scale_up_periods consecutive periods
+    scale_up_lag_ms: float
+    scale_up_backpressure_ms: float
+    scale_up_periods: int
+    # Scale down when the consumer lag and the backpressure stay below these thresholds
+    # for scale_down_periods consecutive periods
+    scale_down_lag_ms: float
+    scale_down_backpressure_ms: float
+    scale_down_periods: int
+    # Minimum number of periods between two parallelism updates
+    cooldown_periods: int
+
+
+DEFAULT_SCALING_CONFIG: ScalingConfig = {
+    "min_parallelism": 1,
+    "max_parallelism": 4,
+    "scale_up_lag_ms": 60000.0,
+    "scale_up_backpressure_ms": 500.0,
+    "scale_up_periods": 3,
+    "scale_down_lag_ms": 5000.0,
+    "scale_down_backpressure_ms": 100.0,
+    "scale_down_periods": 12,
+    "cooldown_periods": 6,
+}
+
+
+def decide_parallelism(
+    lag_ms: list[float],
+    backpressure_ms: list[float],
+    current_parallelism: int,
+    periods_since_last_update: int,
+    config: ScalingConfig,
+    shard_count: Optional[int] = None,
+) -> tuple[int, str]:
+    """Decides the parallelism of the application from the latest metric samples.
+
+    The gap between the scale up and scale down thresholds, the longer scale down window
+    and the cooldown after each update provide the hysteresis preventing the application
+    from flapping between two parallelism values (each update restarts the application).
+
+    Args:
+        lag_ms (list[float]): the consumer lag samples in milliseconds, oldest first
+        backpressure_ms (list[float]): the backpressure samples in milliseconds per second, oldest first
+        current_parallelism (int): the current parallelism of the application
+        periods_since_last_update (int): the number of periods since the last application update
+        config (ScalingConfig): the scaling thresholds
+        shard_count (int): the number of open shards of the ingestion stream. The Kinesis source
+            reads each shard with a single subtask, so the parallelism is capped at this number
+
+    Returns:
+        tuple[int, str]: the new parallelism and the reason of the decision
+    """
+    max_parallelism = config["max_parallelism"]
+    if shard_count is not None:
+        max_parallelism = max(
+            config["min_parallelism"], min(max_parallelism, shard_count)
+        )
+    if periods_since_last_update < config["cooldown_periods"]:
+        return current_parallelism, "cooldown"
+    if current_parallelism < config["min_parallelism"]:
+        return config["min_parallelism"], "below minimum parallelism"
+    if current_parallelism > max_parallelism:
+        return max_parallelism, "above maximum parallelism"
+
+    up_periods = config["scale_up_periods"]
+    if len(lag_ms) >= up_periods and len(backpressure_ms) >= up_periods:
+        recent = zip(lag_ms[-up_periods:], backpressure_ms[-up_periods:])
+        if all(
+            lag > config["scale_up_lag_ms"]
+            or backpressure > config["scale_up_backpressure_ms"]
+            for lag, backpressure in recent
+        ):
+            if current_parallelism >= max_parallelism:
+                return current_parallelism, "backlog but already at maximum parallelism"
+            return min(max_parallelism, current_parallelism * 2), "scale up"
+
+    down_periods = config["scale_down_periods"]
+    if len(lag_ms) >= down_periods and len(backpressure_ms) >= down_periods:
+        recent = zip(lag_ms[-down_periods:], backpressure_ms[-down_periods:])
+        if all(
+            lag < config["scale_down_lag_ms"]
+            and backpressure < config["scale_down_backpressure_ms"]
+            for lag, backpressure in recent
+        ):
+            if current_parallelism > config["min_parallelism"]:
+                return (
+                    max(config["min_parallelism"], current_parallelism // 2),
+                    "scale down",
+                )
+    return current_parallelism, "hold"
+
+
+def replay_trace(
+    trace: list[dict[str, float]],
+    initial_parallelism: int,
+    config: ScalingConfig,
+    shard_count: Optional[int] = None,
+    schedule_interval_seconds: int = SCHEDULE_INTERVAL_SECONDS,
+    metric_period_seconds: int = METRIC_PERIOD_SECONDS,
+) -> list[dict]:
+    """Replays a recorded metric trace, evaluating the scaling decision at the end of every
+    schedule interval as the scheduled controller does, and returns the decisions taken.
+
+    Args:
+        trace (list[dict[str, float]]): the lag_ms and backpressure_ms samples, one per metric
+            period, oldest first
+        initial_parallelism (int): the parallelism of the application at the start of the trace
+        config (ScalingConfig): the scaling thresholds
+        shard_count (int): the number of open shards of the ingestion stream
+        schedule_interval_seconds (int): the interval between two runs of the controller
+        metric_period_seconds (int): the period of the metric samples
+
+    Returns:
+        list[dict]: the period, parallelism and reason of each decision
+    """
+    step = max(1, schedule_interval_seconds // metric_period_seconds)
+    window = max(config["scale_up_periods"], config["scale_down_periods"])
+    parallelism = initial_parallelism
+    periods_since_last_update = config["cooldown_periods"]
+    decisions = []
+    for period in range(step - 1, len(trace), step):
+        samples = trace[max(0, period + 1 - window) : period + 1]
+        new_parallelism, reason = decide_parallelism(
+            [s["lag_ms"] for s in samples],
+            [s["backpressure_ms"] for s in samples],
+            parallelism,
+            periods_since_last_update,
+            config,
+            shard_count,
+        )
+        decisions.append(
+            {"period": period, "parallelism": new_parallelism, "reason": reason}
+        )
+        if new_parallelism != parallelism:
+            parallelism = new_parallelism
+            periods_since_last_update = 0
+        periods_since_last_update += step
+    return decisions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        "Replay a recorded metric trace through the Flink application scaling decisions."
+    )
+    parser.add_argument("--trace", type=str, required=True)
+    parser.add_argument("--initial-parallelism", type=int, default=1)
+    parser.add_argument("--shard-count", type=int, default=None)
+    parser.add_argument(
+        "--config",
+        type=str,
+        default=None,
+        help="JSON file overriding the default scaling configuration.",
+    )
+    args = parser.parse_args()
+    config = dict(DEFAULT_SCALING_CONFIG)
+    if args.config:
+        with open(args.config, "r") as f:
+            config.update(json.load(f))
+    with open(args.trace, "r") as f:
+        trace = json.load(f)
+    for decision in replay_trace(
+        trace, args.initial_parallelism, config, args.shard_count
+    ):
+        if decision["reason"] not in ["hold", "cooldown"]:
+            print(json.dumps(decision))
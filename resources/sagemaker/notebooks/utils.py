@@ -1,12 +1,17 @@
 import json
+from concurrent.futures import ThreadPoolExecutor
 import sagemaker
 import botocore
 import pandas as pd
-import numpy as np
 from sagemaker.serializers import IdentitySerializer
+from deepar_encoding import encode_series, encode_target
 from typing import Dict
 
 
+# Maximum size of the request payload of a real-time endpoint
+MAX_PAYLOAD_BYTES = 6 * 1024 * 1024
+
+
 class DeepARPredictor(sagemaker.predictor.Predictor):
     def __init__(self, *args, **kwargs):
         super().__init__(
@@ -28,32 +33,134 @@ class DeepARPredictor(sagemaker.predictor.Predictor):
         quantiles=["0.1", "0.5", "0.9"],
     ):
         """Requests the prediction of for the time series listed in `ts`, each with the (optional)
-        corresponding category listed in `cat`.
+        corresponding category listed in `cat`. A list of time series is predicted in a single
+        request, which is faster than one request per time series.
 
-        ts -- `pandas.Series` object, the time series to predict
-        cat -- integer, the group associated to the time series (default: None)
+        ts -- `pandas.Series` object or list of `pandas.Series` objects, the time series to predict
+        cat -- list of integers, the groups associated to the time series, or a list of them for a
+            list of time series (default: None)
+        dynamic_feat -- list of lists of floats, the dynamic features of the time series covering
+            the prediction length, or a list of them for a list of time series (default: None)
         num_samples -- integer, number of samples to compute at prediction time (default: 100)
         return_samples -- boolean indicating whether to include samples in the response (default: False)
         quantiles -- list of strings specifying the quantiles to compute (default: ["0.1", "0.5", "0.9"])
 
-        Return value: list of `pandas.DataFrame` objects, each containing the predictions
+        Return value: `pandas.DataFrame` object containing the predictions, or a list of them in
+        the order of the list of time series
         """
-        prediction_time = ts.index[-1] + freq
-        quantiles = [str(q) for q in quantiles]
-        req = self.__encode_request(
-            ts, cat, dynamic_feat, num_samples, return_samples, return_mean, quantiles
+        batched = isinstance(ts, (list, tuple))
+        series = list(ts) if batched else [ts]
+        cats = cat if batched and cat is not None else [cat] * len(series)
+        dynamic_feats = (
+            dynamic_feat
+            if batched and dynamic_feat is not None
+            else [dynamic_feat] * len(series)
         )
-        res = super(DeepARPredictor, self).predict(req)
-        return self.__decode_response(
-            res, freq, prediction_time, return_samples, return_mean
+        instances = encode_instances(series, cats, dynamic_feats)
+        configuration = self.__encode_configuration(
+            num_samples, return_samples, return_mean, quantiles
+        )
+        predictions = self.__predict_instances(
+            instances,
+            [s.index[-1] + freq for s in series],
+            configuration,
+            freq,
+            return_samples,
+            return_mean,
+        )
+        return predictions if batched else predictions[0]
+
+    def predict_batch(
+        self,
+        series,
+        freq=pd.Timedelta(1, "min"),
+        cat=None,
+        dynamic_feat=None,
+        series_ids=None,
+        num_samples=100,
+        return_samples=False,
+        return_mean=False,
+        quantiles=["0.1", "0.5", "0.9"],
+        max_payload_bytes=MAX_PAYLOAD_BYTES,
+        max_workers=4,
+    ):
+        """Requests the prediction of many time series, e.g. the cut-off points of a time series
+        returned by `cutoff_series`. The time series are split into chunks of requests below the
+        `max_payload_bytes` payload size, which are sent concurrently.
+
+        series -- list of `pandas.Series` objects, the time series to predict
+        cat -- list of the categories of each time series (default: None)
+        dynamic_feat -- list of the dynamic features of each time series (default: None)
+        series_ids -- list of the identifiers of the time series in the returned dataframe
+            (default: the position of the time series in `series`)
+        max_payload_bytes -- integer, the maximum size of a request (default: 6 MB, the maximum
+            payload size of a real-time endpoint)
+        max_workers -- integer, the number of requests sent concurrently (default: 4)
+        The other arguments are the ones of `predict`.
+
+        Return value: `pandas.DataFrame` object with one row per time series and predicted
+        timestamp, with the `series` and `timestamp` columns followed by the predictions columns
+        """
+        series = list(series)
+        series_ids = (
+            list(series_ids) if series_ids is not None else list(range(len(series)))
+        )
+        cats = cat if cat is not None else [None] * len(series)
+        dynamic_feats = (
+            dynamic_feat if dynamic_feat is not None else [None] * len(series)
+        )
+        instances = encode_instances(series, cats, dynamic_feats)
+        prediction_times = [s.index[-1] + freq for s in series]
+        configuration = self.__encode_configuration(
+            num_samples, return_samples, return_mean, quantiles
+        )
+        chunks = chunk_instances(
+            instances, max_payload_bytes - len(self.__encode_request([], configuration))
+        )
+
+        def predict_chunk(chunk):
+            start, end = chunk
+            return self.__predict_instances(
+                instances[start:end],
+                prediction_times[start:end],
+                configuration,
+                freq,
+                return_samples,
+                return_mean,
+            )
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            predictions = [
+                p for chunk in executor.map(predict_chunk, chunks) for p in chunk
+            ]
+        if not predictions:
+            return pd.DataFrame(columns=["series", "timestamp"])
+        df = pd.concat(
+            [
+                df.rename_axis("timestamp").reset_index().assign(series=series_id)
+                for series_id, df in zip(series_ids, predictions)
+            ],
+            ignore_index=True,
         )
+        return df[["series"] + [c for c in df.columns if c != "series"]]
 
-    def __encode_request(
-        self, ts, cat, dynamic_feat, num_samples, return_samples, return_mean, quantiles
+    def __predict_instances(
+        self,
+        instances,
+        prediction_times,
+        configuration,
+        freq,
+        return_samples,
+        return_mean,
     ):
-        instance = series_to_dict(
-            ts, cat if cat is not None else None, dynamic_feat if dynamic_feat else None
+        req = self.__encode_request(instances, configuration)
+        res = super(DeepARPredictor, self).predict(req)
+        return self.__decode_response(
+            res, freq, prediction_times, return_samples, return_mean
         )
+
+    @staticmethod
+    def __encode_configuration(num_samples, return_samples, return_mean, quantiles):
         output_types = ["quantiles"]
         if return_samples:
             output_types.append("samples")
@@ -63,19 +170,33 @@ class DeepARPredictor(sagemaker.predictor.Predictor):
         configuration = {
             "num_samples": num_samples,
             "output_types": output_types,
-            "quantiles": quantiles,
+            "quantiles": [str(q) for q in quantiles],
         }
+        return json.dumps(configuration)
 
-        http_request_data = {"instances": [instance], "configuration": configuration}
-
-        return json.dumps(http_request_data).encode("utf-8")
+    @staticmethod
+    def __encode_request(instances, configuration):
+        # The instances and configuration are already JSON encoded, so that the size of the
+        # requests is known when splitting the instances into chunks
+        http_request_data = f'{{"instances": [{", ".join(instances)}], "configuration": {configuration}}}'
+        return http_request_data.encode("utf-8")
 
     def __decode_response(
-        self, response, freq, prediction_time, return_samples, return_mean
+        self, response, freq, prediction_times, return_samples, return_mean
+    ):
+        # The predictions are returned in the order of the time series of the request
+        predictions = json.loads(response.decode("utf-8"))["predictions"]
+        return [
+            self.__prediction_to_dataframe(
+                prediction, freq, prediction_time, return_samples, return_mean
+            )
+            for prediction, prediction_time in zip(predictions, prediction_times)
+        ]
+
+    @staticmethod
+    def __prediction_to_dataframe(
+        predictions, freq, prediction_time, return_samples, return_mean
     ):
-        # we only sent one time series so we only receive one in return
-        # however, if possible one will pass multiple time series as predictions will then be faster
-        predictions = json.loads(response.decode("utf-8"))["predictions"][0]
         prediction_length = len(next(iter(predictions["quantiles"].values())))
         prediction_index = pd.date_range(
             start=prediction_time, freq=freq, periods=prediction_length
@@ -99,15 +220,12 @@ class DeepARPredictor(sagemaker.predictor.Predictor):
         self.freq = freq
 
 
-def encode_target(ts):
-    return [x if np.isfinite(x) else "NaN" for x in ts]
-
-
 def series_to_dict(ts, cat=None, dynamic_feat=None):
     """Given a pandas.Series object, returns a dictionary encoding the time series.
 
     ts -- a pands.Series object with the target time series
-    cat -- an integer indicating the time series category
+    cat -- a list of integers indicating the time series categories
+    dynamic_feat -- a list of lists of floats, the dynamic features of the time series
 
     Return value: a dictionary
     """
@@ -119,6 +237,51 @@ def series_to_dict(ts, cat=None, dynamic_feat=None):
     return obj
 
 
+def cutoff_series(ts, cutoffs):
+    """Given a pandas.Series object, returns the time series ending at each cut-off point, to
+    predict the periods following each of them with `DeepARPredictor.predict_batch`.
+
+    ts -- a pands.Series object with the target time series
+    cutoffs -- a list of timestamps, the last timestamp of each time series
+
+    Return value: a list of pandas.Series objects
+    """
+    return [ts[:cutoff] for cutoff in cutoffs]
+
+
+def encode_instances(series, cats, dynamic_feats):
+    """Encodes the time series of a request to JSON, one string per time series. The values are
+    serialised as arrays, see the deepar_encoding module.
+    """
+    return [
+        encode_series(ts, cat, dynamic_feat if dynamic_feat else None)
+        for ts, cat, dynamic_feat in zip(series, cats, dynamic_feats)
+    ]
+
+
+def chunk_instances(instances, max_bytes):
+    """Splits the JSON encoded time series into consecutive chunks whose total size, with the
+    separators, does not exceed `max_bytes`.
+
+    Return value: a list of (start, end) positions of the chunks in `instances`
+    """
+    chunks = []
+    start, size = 0, 0
+    for i, instance in enumerate(instances):
+        instance_size = len(instance.encode("utf-8")) + len(", ")
+        if instance_size > max_bytes:
+            raise ValueError(
+                f"The time series {i} of {instance_size} bytes exceeds the maximum payload size."
+            )
+        if size + instance_size > max_bytes:
+            chunks.append((start, i))
+            start, size = i, 0
+        size += instance_size
+    if start < len(instances):
+        chunks.append((start, len(instances)))
+    return chunks
+
+
 def get_ssm_parameters(ssm_client: botocore.client, param_path: str) -> Dict[str, str]:
     """Retrieves the SSM parameters from the specified path
 
@@ -0,0 +1,110 @@
+"""Micro-benchmark of the computation of the forecast metrics.
+
+Compares, for 1 to 1000 backtest windows of a 60 points horizon and 3 quantiles:
+    * the previous computation, a Python loop over the windows and the quantiles growing the
+      weighted quantile losses with `np.append`
+    * the broadcasted computation of the forecast_metrics module
+
+Usage:
+    python benchmarks/metrics_benchmark.py --windows 1 100 1000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(BASE_DIR, "..", "pipelines", "blockchain", "shared"))
+from forecast_metrics import forecast_metrics  # noqa: E402
+
+QUANTILES = [0.1, 0.5, 0.9]
+
+
+def legacy_quantile_loss(alpha, q, x):
+    return np.where(x > q, alpha * (x - q), (1 - alpha) * (q - x))
+
+
+def legacy_metrics(targets, mean_predictions, quantile_predictions, quantiles):
+    rmses = []
+    mean_weighted_quantile_losses = []
+    for window in range(len(targets)):
+        window_targets = targets[window]
+        observed = np.isfinite(window_targets)
+        square_errors = (mean_predictions[window] - window_targets) ** 2
+        rmses.append(np.sqrt(square_errors[observed].mean()))
+        weighted_quantile_losses = np.array([])
+        weight = 2 / np.abs(window_targets[observed]).sum()
+        for i, q in enumerate(quantiles):
+            ql = legacy_quantile_loss(
+                q, quantile_predictions[i, window], window_targets
+            )
+            weighted_quantile_losses = np.append(
+                weighted_quantile_losses, ql[observed].sum() * weight
+            )
+        mean_weighted_quantile_losses.append(weighted_quantile_losses.mean())
+    return np.array(rmses), np.array(mean_weighted_quantile_losses)
+
+
+def make_forecasts(nb_windows, horizon=60, missing_ratio=0.01, seed=42):
+    rng = np.random.default_rng(seed)
+    targets = rng.gamma(2.0, 2000.0, (nb_windows, horizon))
+    targets[rng.random(targets.shape) < missing_ratio] = np.nan
+    mean_predictions = rng.gamma(2.0, 2000.0, targets.shape)
+    quantile_predictions = np.stack([mean_predictions * f for f in (0.5, 1.0, 1.5)])
+    return targets, mean_predictions, quantile_predictions
+
+
+def best_time(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def benchmark(windows, repeat=5):
+    reports = []
+    for nb_windows in windows:
+        forecasts = make_forecasts(nb_windows)
+        rmse, weighted_quantile_loss = legacy_metrics(*forecasts, QUANTILES)
+        metrics = forecast_metrics(*forecasts, QUANTILES)
+        np.testing.assert_allclose(metrics["rmse"], rmse)
+        np.testing.assert_allclose(
+            metrics["weighted_quantile_loss"], weighted_quantile_loss
+        )
+        report = {
+            "windows": nb_windows,
+            "legacy_seconds": best_time(
+                lambda: legacy_metrics(*forecasts, QUANTILES), repeat
+            ),
+            "vectorised_seconds": best_time(
+                lambda: forecast_metrics(*forecasts, QUANTILES), repeat
+            ),
+        }
+        report["speedup"] = round(
+            report["legacy_seconds"] / report["vectorised_seconds"], 1
+        )
+        report["legacy_seconds"] = round(report["legacy_seconds"], 5)
+        report["vectorised_seconds"] = round(report["vectorised_seconds"], 5)
+        reports.append(report)
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        "Benchmark the computation of the forecast metrics."
+    )
+    parser.add_argument("--windows", type=int, nargs="+", default=[1, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    for report in benchmark(args.windows, args.repeat):
+        print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,27 @@
 """Process the Batch Transform Outputs with the target data to have a single CSV file
-with the following format: target, low_quantile, quantile0.5, up_quantile"""
+with the following format: target, low_quantile, quantile0.5, up_quantile
+
+When the pipeline skips the Batch Transform for small test sets, the model artifacts are passed and
+the test inputs are first forecasted with a temporary model on a temporary serverless endpoint.
+
+The model is evaluated on the target series. When the model is trained on multiple series, the
+predictions of all the series are written to a second CSV file with a series column."""
 
-import subprocess
 import sys
 
-subprocess.check_call([sys.executable, "-m", "pip", "install", "pandas>=2.1.3"])
-import json
-import pathlib
-import logging
-import argparse
-import pandas as pd
-import numpy as np
+# The shared modules are mounted by the pipeline next to the code of the script
+sys.path.insert(0, "/opt/ml/processing/input/shared")
+from dependencies import install_missing  # noqa: E402
+
+# The dependencies are in the processing image, they are only installed on other images
+install_missing(["pandas>=2.1.3"])
+import json  # noqa: E402
+import pathlib  # noqa: E402
+import logging  # noqa: E402
+import argparse  # noqa: E402
+import pandas as pd  # noqa: E402
+import numpy as np  # noqa: E402
+from forecast_metrics import forecast_metrics, quantile_loss  # noqa: E402
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -22,15 +33,6 @@ logger.addHandler(logging.StreamHandler())
 #
 # Directories
 LOCAL_DATA_DIR = "/opt/ml/processing/data"
-TEST_DATA_PATH = f"{LOCAL_DATA_DIR}/test"
-TRANSFORM_DATA_PATH = f"{LOCAL_DATA_DIR}/transform"
-EVALUATION_DATA_PATH = f"{LOCAL_DATA_DIR}/evaluation"
-
-
-# See https://website-nine-gules.vercel.app/blog/how-to-evaluate-probabilistic-forecasts-weighted-quantile-loss
-# for weightd quantile losss calculations
-def quantile_loss(alpha, q, x):
-    return np.where(x > q, alpha * (x - q), (1 - alpha) * (q - x))
 
 
 if __name__ == "__main__":
@@ -39,23 +41,66 @@ if __name__ == "__main__":
     parser.add_argument("--target-col", type=str, required=True)
     parser.add_argument("--low_quantile", type=float, required=True)
     parser.add_argument("--up_quantile", type=float, required=True)
+    parser.add_argument("--local-data-dir", type=str, default=LOCAL_DATA_DIR)
+    # Model to forecast the test inputs with, when there are no Batch Transform outputs
+    parser.add_argument("--model-data", type=str, default=None)
+    parser.add_argument("--image-uri", type=str, default=None)
+    parser.add_argument("--model-role", type=str, default=None)
+    parser.add_argument("--inference-config", type=str, default="{}")
+    parser.add_argument("--serverless-memory-size", type=int, default=4096)
     args = parser.parse_args()
+    test_data_path = f"{args.local_data_dir}/test"
+    transform_data_path = f"{args.local_data_dir}/transform"
+    evaluation_data_path = f"{args.local_data_dir}/evaluation"
     # Set Data files variables
     target_col = args.target_col
     low_quantile = args.low_quantile
     up_quantile = args.up_quantile
-    transform_outputs_file = f"{TRANSFORM_DATA_PATH}/test-inputs.json.out"
-    test_targets_file = f"{TEST_DATA_PATH}/test-targets.csv"
+    transform_outputs_file = f"{transform_data_path}/test-inputs.json.out"
+    test_targets_file = f"{test_data_path}/test-targets.csv"
+
+    if args.model_data is not None:
+        install_missing(["boto3"])
+        import boto3  # noqa: E402
+        from serverless_inference import (  # noqa: E402
+            create_evaluation_model,
+            serverless_transform,
+        )
+
+        pathlib.Path(transform_data_path).mkdir(parents=True, exist_ok=True)
+        sm_client = boto3.client("sagemaker")
+        model_name = create_evaluation_model(
+            sm_client, args.image_uri, args.model_data, args.model_role
+        )
+        try:
+            serverless_transform(
+                sm_client,
+                boto3.client("sagemaker-runtime"),
+                model_name,
+                f"{test_data_path}/test-inputs.json",
+                transform_outputs_file,
+                json.loads(args.inference_config),
+                args.serverless_memory_size,
+            )
+        finally:
+            logger.info(f"Deleting the model {model_name}.")
+            try:
+                sm_client.delete_model(ModelName=model_name)
+            except sm_client.exceptions.ClientError as e:
+                logger.warning(f"An error occurred deleting the model {model_name}: {e}")
 
     # Load the test targets CSV
     logger.info("Loading the test targets.")
     df_test_targets = pd.read_csv(test_targets_file, header=0)
 
-    # Load the Batch Transform JSON outputs from S3.
-    # In our case there should be only one line to read
+    # Load the Batch Transform JSON lines outputs from S3.
+    # There is one line per series, in the order of the test targets columns
     logger.info("Loading the Batch Transform outputs.")
     with open(transform_outputs_file, "r") as f:
-        transform_outputs = json.load(f)
+        series_outputs = dict(
+            zip(df_test_targets.columns, (json.loads(line) for line in f if line.strip()))
+        )
+    transform_outputs = series_outputs[target_col]
 
     # Create a dataframe with the target_col from the test targets and the quantiles from the Batch Transform outputs
     logger.info("Creating the final dataframe.")
@@ -69,32 +114,34 @@ if __name__ == "__main__":
         }
     )
 
-    # Compute the RMSE for the mean
-    logger.info("Computing the RMSE for the mean prediction.")
-    targets = np.array(df_test_targets[target_col])
-    mean_predictions = np.array(transform_outputs["mean"])
-    square_errors=(mean_predictions-targets)**2
-    rmse = np.sqrt(square_errors.mean())
-    df_aggregate["square_errors"] = square_errors
-    # Compute the mean weighted quantile loss for a specific quantile
+    # Compute the metrics of the mean and quantile predictions at once
     # See https://docs.aws.amazon.com/sagemaker/latest/dg/deepar.html
     # And https://website-nine-gules.vercel.app/blog/how-to-evaluate-probabilistic-forecasts-weighted-quantile-loss
-    logger.info("Computing the mean weighted quantile loss.")
+    logger.info("Computing the forecast metrics.")
     logger.info(f"Low quantile is {low_quantile}, up quantile is {up_quantile}")
-    weighted_quantile_losses = np.array([])
-    weight = 2/np.abs(targets).sum()
-    for q in [low_quantile, 0.5, up_quantile]:
-        quantile_predictions = np.array(transform_outputs["quantiles"][str(q)])
-        ql = quantile_loss(q, quantile_predictions, targets)
+    quantiles = [low_quantile, 0.5, up_quantile]
+    targets = df_test_targets[target_col].to_numpy(dtype=float)
+    mean_predictions = np.array(transform_outputs["mean"], dtype=float)
+    quantile_predictions = np.array(
+        [transform_outputs["quantiles"][str(q)] for q in quantiles], dtype=float
+    )
+    metrics = forecast_metrics(targets, mean_predictions, quantile_predictions, quantiles)
+    df_aggregate["square_errors"] = (mean_predictions - targets) ** 2
+    quantile_losses = quantile_loss(quantiles, quantile_predictions, targets)
+    for q, ql in zip(quantiles, quantile_losses):
         df_aggregate[f"quantile_loss_{q}"] = ql
-        weighted_quantile_losses = np.append(weighted_quantile_losses, ql.sum() * weight)
-    mean_weighted_quantile_loss = weighted_quantile_losses.mean()
 
     report_dict = {
         "deepar_metrics": {
-            "rmse": {"value": rmse, "standard_deviation": "NaN"},
+            "rmse": {"value": float(metrics["rmse"]), "standard_deviation": "NaN"},
             "weighted_quantile_loss": {
-                "value": mean_weighted_quantile_loss,
+                "value": float(metrics["weighted_quantile_loss"]),
+                "standard_deviation": "NaN",
+            },
+            "mape": {"value": float(metrics["mape"]), "standard_deviation": "NaN"},
+            "coverage": {"value": float(metrics["coverage"]), "standard_deviation": "NaN"},
+            "interval_width": {
+                "value": float(metrics["interval_width"]),
                 "standard_deviation": "NaN",
             },
         },
@@ -102,9 +149,26 @@ if __name__ == "__main__":
 
     # Write the final dataframe to a CSV file (we keep only the target and the quantiles and mean)
     logger.info("Writing the output of the transform processing and evaluation.")
-    pathlib.Path(EVALUATION_DATA_PATH).mkdir(parents=True, exist_ok=True)
+    pathlib.Path(evaluation_data_path).mkdir(parents=True, exist_ok=True)
     df_aggregate.to_csv(
-        f"{EVALUATION_DATA_PATH}/targets-quantiles.csv", header=True, index=False
+        f"{evaluation_data_path}/targets-quantiles.csv", header=True, index=False
     )
-    with open(f"{EVALUATION_DATA_PATH}/evaluation.json", "w") as f:
+    with open(f"{evaluation_data_path}/evaluation.json", "w") as f:
         f.write(json.dumps(report_dict))
+    if len(series_outputs) > 1:
+        logger.info(f"Writing the predictions of the {len(series_outputs)} series.")
+        pd.concat(
+            [
+                pd.DataFrame(
+                    {
+                        "series": name,
+                        "target": df_test_targets[name],
+                        "prediction_mean": outputs["mean"],
+                        f"prediction_{low_quantile}": outputs["quantiles"][str(low_quantile)],
+                        "prediction_0.5": outputs["quantiles"]["0.5"],
+                        f"prediction_{up_quantile}": outputs["quantiles"][str(up_quantile)],
+                    }
+                )
+                for name, outputs in series_outputs.items()
+            ]
+        ).to_csv(f"{evaluation_data_path}/series-quantiles.csv", header=True, index=False)
@@ -0,0 +1,236 @@
+"""Runs the model build pipeline locally, without SageMaker jobs, for fast iteration.
+
+The processing scripts of the pipeline run as local processes on a local file of feature group
+records (by default a synthetic fixture), with the same arguments as in the pipeline. The DeepAR
+training and batch transform steps are replaced by a stub forecaster, which forecasts the test
+inputs with their recent mean and standard deviation. The model creation, quality check and
+registration steps only make sense in the cloud and are skipped. The evaluation is checked against
+the weighted quantile loss threshold, as by the pipeline condition step.
+
+The duration of each step is reported, so that the changes of the processing scripts can be tested
+and timed end to end in minutes.
+
+Usage:
+    python -m pipelines.blockchain.local_pipeline --work-dir /tmp/local-pipeline
+    python -m pipelines.blockchain.local_pipeline --records records.parquet --work-dir /tmp/run
+"""
+
+import argparse
+import json
+import os
+import pathlib
+import subprocess
+import sys
+import time
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.realpath(__file__))
+SHARED_CODE_DIR = os.path.join(BASE_DIR, "shared")
+MODEL_BUILD_PARAMS_FILE = os.path.join(BASE_DIR, "..", "..", "model-build-params.json")
+# Number of the latest values of a series the stub forecaster is fitted on
+STUB_CONTEXT_LENGTH = 60
+
+
+def make_feature_records(periods=3 * 24 * 60, start="2024-06-20 00:00:00", seed=42):
+    """Returns synthetic feature group records: one record per minute with a daily seasonality,
+    some missing minutes (ingestion outages) and some records written twice (updates).
+
+    Args:
+        periods (int): the number of minutes
+        start (str): the first tx_minute
+        seed (int): the seed of the random generator
+
+    Returns:
+        pd.DataFrame: the tx_minute, event_time and aggregated transactions features
+    """
+    rng = np.random.default_rng(seed)
+    index = pd.date_range(start, periods=periods, freq="1min")
+    daily = 1 + 0.3 * np.sin(2 * np.pi * np.arange(periods) / (24 * 60))
+    nb_trx = rng.poisson(200 * daily)
+    avg_fee = rng.gamma(4.0, 1000.0 * daily / 4.0)
+    df = pd.DataFrame(
+        {
+            "tx_minute": index.strftime("%Y-%m-%d %H:%M:%S"),
+            "event_time": (index - pd.Timestamp(0)).total_seconds() + 60,
+            "avg_fee_1min": avg_fee,
+            "total_nb_trx_1min": nb_trx,
+            "total_fee_1min": avg_fee * nb_trx,
+        }
+    )
+    df = df[rng.random(periods) > 0.01]
+    updates = df.sample(frac=0.01, random_state=seed).assign(
+        event_time=lambda d: d["event_time"] + 30,
+        avg_fee_1min=lambda d: d["avg_fee_1min"] * 1.01,
+    )
+    return pd.concat([df, updates]).reset_index(drop=True)
+
+
+def stub_forecast(target, prediction_length, quantiles):
+    """Forecasts a series with the mean and standard deviation of its latest values, in the format
+    of the DeepAR batch transform outputs.
+
+    Args:
+        target (list): the values of the series, with "NaN" or None for the missing values
+        prediction_length (int): the number of values to forecast
+        quantiles (list[float]): the quantiles to forecast
+
+    Returns:
+        dict: the `mean` and `quantiles` forecasts
+    """
+    values = pd.to_numeric(pd.Series(target[-STUB_CONTEXT_LENGTH:]), errors="coerce")
+    mean = float(values.mean())
+    std = float(values.std(ddof=0)) if values.count() > 1 else 0.0
+    return {
+        "mean": [mean] * prediction_length,
+        "quantiles": {
+            str(q): [mean + NormalDist().inv_cdf(q) * std] * prediction_length
+            for q in quantiles
+        },
+    }
+
+
+def run_stub_transform(
+    test_inputs_file, transform_outputs_file, prediction_length, quantiles
+):
+    """Writes the stub forecasts of the test inputs as the batch transform outputs."""
+    pathlib.Path(transform_outputs_file).parent.mkdir(parents=True, exist_ok=True)
+    with open(test_inputs_file) as f_in, open(transform_outputs_file, "w") as f_out:
+        for line in f_in:
+            if line.strip():
+                series = json.loads(line)
+                forecast = stub_forecast(series["target"], prediction_length, quantiles)
+                f_out.write(json.dumps(forecast) + "\n")
+
+
+def run_script(script, arguments):
+    """Runs a processing script with the shared modules in its Python path."""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [SHARED_CODE_DIR] + ([env["PYTHONPATH"]] if env.get("PYTHONPATH") else [])
+    )
+    subprocess.run(
+        [sys.executable, os.path.join(BASE_DIR, script), *arguments],
+        check=True,
+        env=env,
+    )
+
+
+def run_local_pipeline(records_file, work_dir, params):
+    """Runs the model build pipeline locally.
+
+    Args:
+        records_file (str): the Parquet or CSV file of feature group records
+        work_dir (str): the directory where the datasets and evaluation are written
+        params (dict): the model build parameters, see model-build-params.json
+
+    Returns:
+        dict: the `steps` durations in seconds, the `evaluation` report and whether the model
+            passes the threshold (`passed`)
+    """
+    target = params["target"]
+    threshold = float(params["validation-threshold"]["weighted_quantile_loss"])
+    # The quantiles are computed from the confidence as by the pipeline
+    confidence = float(params["validation-threshold"]["confidence"])
+    if not 50 < confidence < 100:
+        confidence = 90.0
+    low_quantile = round(0.5 - confidence * 0.005, 3)
+    up_quantile = round(confidence * 0.005 + 0.5, 3)
+    prediction_length = int(target["prediction_length"])
+    data_dir = os.path.join(work_dir, "data")
+    steps = {}
+
+    start = time.perf_counter()
+    run_script(
+        "preprocess.py",
+        [
+            "--input-records",
+            records_file,
+            "--local-data-dir",
+            data_dir,
+            "--freq",
+            target["freq"],
+            "--target-col",
+            target["target_col"],
+            "--prediction-length",
+            str(prediction_length),
+            "--series-cols",
+            str(target.get("series_cols", "none")),
+            "--series-windows",
+            str(target.get("series_windows", "1")),
+            "--dynamic-features",
+            str(target.get("dynamic_features", "none")),
+            "--dataset-compression",
+            "gzip",
+        ],
+    )
+    steps["PreprocessData"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    run_stub_transform(
+        os.path.join(data_dir, "test", "test-inputs.json"),
+        os.path.join(data_dir, "transform", "test-inputs.json.out"),
+        prediction_length,
+        [low_quantile, 0.5, up_quantile],
+    )
+    steps["Transform"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    run_script(
+        "evaluate.py",
+        [
+            "--target-col",
+            target["target_col"],
+            "--low_quantile",
+            str(low_quantile),
+            "--up_quantile",
+            str(up_quantile),
+            "--local-data-dir",
+            data_dir,
+        ],
+    )
+    steps["EvaluateModel"] = time.perf_counter() - start
+
+    with open(os.path.join(data_dir, "evaluation", "evaluation.json")) as f:
+        evaluation = json.load(f)
+    weighted_quantile_loss = evaluation["deepar_metrics"]["weighted_quantile_loss"][
+        "value"
+    ]
+    return {
+        "steps": {name: round(seconds, 2) for name, seconds in steps.items()},
+        "evaluation": evaluation,
+        "passed": weighted_quantile_loss <= threshold,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser("Runs the model build pipeline locally.")
+    parser.add_argument(
+        "--records",
+        type=str,
+        default=None,
+        help="Parquet or CSV file of feature group records. Defaults to a synthetic fixture",
+    )
+    parser.add_argument("--days", type=int, default=3, help="Days of synthetic records")
+    parser.add_argument("--params", type=str, default=MODEL_BUILD_PARAMS_FILE)
+    parser.add_argument("--work-dir", type=str, required=True)
+    args = parser.parse_args()
+    with open(args.params) as f:
+        params = json.load(f)
+    records_file = args.records
+    if records_file is None:
+        pathlib.Path(args.work_dir).mkdir(parents=True, exist_ok=True)
+        records_file = os.path.join(args.work_dir, "records.csv")
+        make_feature_records(periods=args.days * 24 * 60).to_csv(
+            records_file, index=False
+        )
+    start = time.perf_counter()
+    result = run_local_pipeline(records_file, args.work_dir, params)
+    result["total_seconds"] = round(time.perf_counter() - start, 2)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
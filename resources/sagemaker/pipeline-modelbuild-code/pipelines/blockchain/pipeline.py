@@ -4,6 +4,7 @@ Refer to the project's repo main documentation: https://github.com/amanoxsolutio
 
 import os
 import json
+import hashlib
 
 import boto3
 import sagemaker
@@ -16,7 +17,11 @@ from sagemaker.transformer import Transformer
 from sagemaker.model_metrics import MetricsSource, ModelMetrics
 from sagemaker.drift_check_baselines import DriftCheckBaselines
 from sagemaker.processing import ProcessingInput, ProcessingOutput, ScriptProcessor
-from sagemaker.workflow.conditions import ConditionLessThanOrEqualTo, ConditionLessThan
+from sagemaker.workflow.conditions import (
+    ConditionEquals,
+    ConditionLessThanOrEqualTo,
+    ConditionLessThan,
+)
 from sagemaker.workflow.condition_step import ConditionStep
 from sagemaker.workflow.functions import JsonGet
 from sagemaker.workflow.parameters import (
@@ -26,7 +31,21 @@ from sagemaker.workflow.parameters import (
 )
 from sagemaker.workflow.pipeline import Pipeline
 from sagemaker.workflow.properties import PropertyFile
-from sagemaker.workflow.steps import ProcessingStep, TrainingStep, TransformStep
+from sagemaker.workflow.steps import (
+    CacheConfig,
+    ProcessingStep,
+    TrainingStep,
+    TransformStep,
+    TuningStep,
+)
+from sagemaker.tuner import (
+    CategoricalParameter,
+    ContinuousParameter,
+    HyperparameterTuner,
+    IntegerParameter,
+    WarmStartConfig,
+    WarmStartTypes,
+)
 from sagemaker.workflow.check_job_config import CheckJobConfig
 from sagemaker.workflow.execution_variables import ExecutionVariables
 from sagemaker.workflow.functions import Join
@@ -38,6 +57,10 @@ from sagemaker.workflow.quality_check_step import (
 from sagemaker.workflow.model_step import ModelStep
 from sagemaker.model import Model
 from sagemaker.workflow.pipeline_context import PipelineSession
+from sagemaker.feature_store.feature_group import FeatureGroup
+
+from pipelines.blockchain.shared.feature_data import query_high_water_mark
+from pipelines.blockchain.shared.time_series import parse_list, series_layout
 
 
 #
@@ -51,12 +74,22 @@ LOCAL_MODEL_DIR = f"{PROCESSING_FOLDER_PREFIX}/model"
 LOCAL_TEST_DIR = f"{LOCAL_DATA_DIR}/test"
 LOCAL_TRANSFORM_DIR = f"{LOCAL_DATA_DIR}/transform"
 LOCAL_EVALUATION_DIR = f"{LOCAL_DATA_DIR}/evaluation"
+# Modules shared by the processing scripts, added to their Python path
+LOCAL_SHARED_CODE_DIR = f"{PROCESSING_FOLDER_PREFIX}/input/shared"
+# SSM parameter storing the URI of the processing image
+PROCESSING_IMAGE_URI_PARAMETER = "/rdi-mlops/stack-parameters/sagemaker-processing-image-uri"
+# SSM parameters path of the training hyperparameters
+TRAINING_HYPERPARAMETERS_PATH = "/rdi-mlops/sagemaker/model-build/training-hyperparameters"
 # Resources names
 # MODEL_PACKAGE_GROUP_NAME = f"PackageGroup"
 PROCESSING_STEP_NAME = "PreprocessData"
 PROCESSING_JOB_NAME = "PreprocessingJob"
 TRAINING_JOB_NAME = "TrainingJob"
 TRAINING_STEP_NAME = "TrainModel"
+TUNING_JOB_NAME = "TuningJob"
+TUNING_STEP_NAME = "TuneModel"
+UPDATE_HYPERPARAMETERS_JOB_NAME = "UpdateHyperparametersJob"
+UPDATE_HYPERPARAMETERS_STEP_NAME = "StoreTunedHyperparameters"
 CREATE_MODEL_STEP_NAME = "CreateModel"
 TRANSFORM_STEP_NAME = "Transform"
 TRANSFORM_JOB_NAME = "TransformOutputsProcessingJob"
@@ -67,6 +100,7 @@ EVALUATION_REPORT_NAME = "EvaluationReport"
 EVALUATION_STEP_NAME = "EvaluateModel"
 REGISTER_MODEL_STEP_NAME = "RegisterModel"
 CONDITON_STEP_NAME = "CheckMwqlLessThanThresholdCondition"
+DATA_VERSION_CONDITION_STEP_NAME = "CheckDataVersionRegisteredCondition"
 FAIL_STEP_NAME = "Fail"
 # Instances
 BASE_INSTANCE_TYPE = "ml.m5.large"
@@ -77,6 +111,31 @@ TRANSFORM_INSTANCE_TYPE = BASE_INSTANCE_TYPE
 CHECK_INSTANCE_TYPE = BASE_INSTANCE_TYPE
 INFERENCE_INSTANCES_TYPE = ["ml.t2.medium", BASE_INSTANCE_TYPE]
 ACCELERATOR_TYPE = "ml.eia1.medium"
+# Expiration of the cached steps results, as an ISO 8601 duration
+STEP_CACHE_EXPIRATION = "P30D"
+# Customer metadata property of the model packages storing the data version they were trained on
+DATA_VERSION_METADATA_KEY = "data_version"
+# Prefix of the customer metadata properties of the model packages storing the hyperparameters
+# tuned by their tuning job
+TUNED_HYPERPARAMETER_METADATA_PREFIX = "tuned_"
+# Test sets of up to this number of series are forecasted on a serverless endpoint by the
+# evaluation step instead of a Batch Transform, defaults of the evaluation parameters
+SERVERLESS_EVALUATION_MAX_SERIES = 10
+SERVERLESS_EVALUATION_MEMORY_SIZE = 4096
+# Hyperparameter tuning, defaults of the tuning parameters. The ranges are the ones of the model
+# hyperparameters tuning notebook
+TUNING_OBJECTIVE_METRIC = "test:mean_wQuantileLoss"
+TUNING_MAX_JOBS = 10
+TUNING_MAX_PARALLEL_JOBS = 2
+HYPERPARAMETER_RANGES = {
+    "epochs": IntegerParameter(50, 400),
+    "mini_batch_size": IntegerParameter(32, 128),
+    "num_cells": IntegerParameter(30, 100),
+    "likelihood": CategoricalParameter(["gaussian", "student-T"]),
+    "learning_rate": ContinuousParameter(1e-5, 1e-2),
+    "dropout_rate": ContinuousParameter(0.00, 0.2),
+    "embedding_dimension": IntegerParameter(5, 50),
+}
 
 
 def get_sagemaker_client(region):
@@ -183,6 +242,137 @@ def get_ssm_parameters(ssm_client, param_path):
     return parameters
 
 
+def get_processing_image_uri(ssm_client, region):
+    """Returns the URI of the prebuilt processing image, which has the dependencies of the
+    processing scripts. Defaults to the SageMaker base Python image if the processing image is not
+    deployed, the scripts then install their dependencies at runtime.
+
+    Args:
+        ssm_client (botocore.client): The SSM client
+        region (str): The AWS region
+
+    Returns:
+        str: The processing image URI
+    """
+    try:
+        return ssm_client.get_parameter(Name=PROCESSING_IMAGE_URI_PARAMETER)["Parameter"]["Value"]
+    except ssm_client.exceptions.ParameterNotFound:
+        print("The processing image is not deployed, using the SageMaker base Python image.")
+    # List of processing images: https://github.com/aws/sagemaker-python-sdk/tree/master/src/sagemaker/image_uri_config
+    return sagemaker.image_uris.get_base_python_image_uri(region=region, py_version="310")
+
+
+def get_data_version(high_water_mark, *parameters):
+    """Returns the key of the data and parameters the steps are run with: a hash of the latest
+    tx_minute of the feature group and of the model build parameters.
+
+    Args:
+        high_water_mark (str): the latest tx_minute of the feature group records
+        parameters (dict[str, str]): the model build SSM parameters
+
+    Returns:
+        str: the key
+    """
+    key = json.dumps([high_water_mark, *parameters], sort_keys=True)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+
+def describe_last_model_package(sm_client, model_package_group_name, approval_status=None):
+    """Returns the description of the last model package registered in the group.
+
+    Args:
+        sm_client (botocore.client): The SageMaker client
+        model_package_group_name (str): The model package group name
+        approval_status (str): Only the model packages with this approval status are considered,
+            whatever their status if None
+
+    Returns:
+        dict: The model package description, None if there is no model package
+    """
+    try:
+        response = sm_client.list_model_packages(
+            ModelPackageGroupName=model_package_group_name,
+            SortBy="CreationTime",
+            SortOrder="Descending",
+            MaxResults=1,
+            **({"ModelApprovalStatus": approval_status} if approval_status else {}),
+        )
+        if not response["ModelPackageSummaryList"]:
+            return None
+        return sm_client.describe_model_package(
+            ModelPackageName=response["ModelPackageSummaryList"][0]["ModelPackageArn"]
+        )
+    except Exception as e:
+        print(f"Error getting the last model package of {model_package_group_name}: {e}")
+        return None
+
+
+def get_warm_start_config(sm_client, model_package):
+    """Returns the warm start configuration of the hyperparameter tuning from the tuning job of the
+    last approved model, so that the tuning resumes from the hyperparameters already evaluated.
+
+    Args:
+        sm_client (botocore.client): The SageMaker client
+        model_package (dict): The description of the last approved model package
+
+    Returns:
+        WarmStartConfig: The warm start configuration, None if there is no approved model or if it
+            was not trained by a tuning job
+    """
+    if model_package is None:
+        return None
+    try:
+        # The model artifacts are in <output path>/<training job name>/output/model.tar.gz
+        model_data_url = model_package["InferenceSpecification"]["Containers"][0]["ModelDataUrl"]
+        training_job = sm_client.describe_training_job(
+            TrainingJobName=model_data_url.split("/")[-3]
+        )
+        if "TuningJobArn" not in training_job:
+            return None
+        tuning_job_name = training_job["TuningJobArn"].split("/")[-1]
+    except Exception as e:
+        print(f"Error getting the tuning job of the last approved model: {e}")
+        return None
+    print(f"The hyperparameter tuning is warm started from the tuning job {tuning_job_name}.")
+    # The training data changes between the tuning jobs
+    return WarmStartConfig(WarmStartTypes.TRANSFER_LEARNING, parents={tuning_job_name})
+
+
+def get_tuned_hyperparameters(model_package):
+    """Returns the hyperparameters tuned by the tuning job of the last approved model, which the
+    hyperparameter update step stores on the model package when the tuned model is registered.
+
+    Args:
+        model_package (dict): The description of the last approved model package
+
+    Returns:
+        dict[str, str]: The tuned hyperparameters, empty if there is no approved model or if it was
+            not tuned
+    """
+    if model_package is None:
+        return {}
+    return {
+        name[len(TUNED_HYPERPARAMETER_METADATA_PREFIX) :]: value
+        for name, value in model_package.get("CustomerMetadataProperties", {}).items()
+        if name.startswith(TUNED_HYPERPARAMETER_METADATA_PREFIX)
+    }
+
+
+def get_registered_data_version(model_package):
+    """Returns the data version of the last registered model, whatever its approval status.
+
+    Args:
+        model_package (dict): The description of the last registered model package
+
+    Returns:
+        str: The data version, an empty string if there is no model package or if it was not
+            registered with its data version
+    """
+    if model_package is None:
+        return ""
+    return model_package.get("CustomerMetadataProperties", {}).get(DATA_VERSION_METADATA_KEY, "")
+
+
 def get_pipeline(
     region,
     role=None,
@@ -208,11 +398,9 @@ def get_pipeline(
         sagemaker_project_id = "mlops-pipeline"
     pipeline_name = f"{sagemaker_project_name}-model-training"
     # Note we can't use f-strings since the SageMaker pipeline execution variable do not support __str__ operations
-    pipeline_execution_s3_path = Join(
+    pipeline_execution_s3_prefix = Join(
         on="/",
         values=[
-            "s3:/",
-            default_bucket,
             pipeline_name,
             "pipeline_executions",
             ExecutionVariables.PIPELINE_EXECUTION_ID,
@@ -255,10 +443,25 @@ def get_pipeline(
     model_target_parameters = get_ssm_parameters(
         ssm_client, "/rdi-mlops/sagemaker/model-build/target"
     )
-    # Read the SSM Parameters storing the model training hyperparamters
-    model_training_hyperparameters = get_ssm_parameters(
-        ssm_client, "/rdi-mlops/sagemaker/model-build/training-hyperparameters"
+    # Read the SSM Parameters for the training data extraction (optional)
+    data_extraction_parameters = get_ssm_parameters(
+        ssm_client, "/rdi-mlops/sagemaker/model-build/data-extraction"
+    )
+    # Read the SSM Parameters storing the model training hyperparamters. The hyperparameters tuned
+    # for the last approved model take precedence, the tuned values are only used once approved
+    sm_client = get_sagemaker_client(region)
+    approved_model_package = describe_last_model_package(
+        sm_client, model_package_group_name, "Approved"
     )
+    model_training_hyperparameters = {
+        **get_ssm_parameters(ssm_client, TRAINING_HYPERPARAMETERS_PATH),
+        **get_tuned_hyperparameters(approved_model_package),
+    }
+    # Read the SSM Parameters for the hyperparameter tuning (optional)
+    model_tuning_parameters = get_ssm_parameters(
+        ssm_client, "/rdi-mlops/sagemaker/model-build/tuning"
+    )
+    tuning_enabled = model_tuning_parameters.get("enabled", "false").lower() == "true"
     # Read the SSM Parameters storing the model validation thresholds by the parameters path
     model_validation_thresholds = get_ssm_parameters(
         ssm_client, "/rdi-mlops/sagemaker/model-build/validation-threshold"
@@ -266,6 +469,10 @@ def get_pipeline(
     weighted_quantile_loss_threshold = float(
         model_validation_thresholds["weighted_quantile_loss"]
     )
+    # Read the SSM Parameters for the model evaluation (optional)
+    model_evaluation_parameters = get_ssm_parameters(
+        ssm_client, "/rdi-mlops/sagemaker/model-build/evaluation"
+    )
     # Get the model confidence from the validation-threshold parameter and
     # Make sure the confidence is above 50 and below 100 otherwise default to 90
     confidence = float(model_validation_thresholds["confidence"])
@@ -274,15 +481,71 @@ def get_pipeline(
     low_quantile = round(0.5 - confidence * 0.005, 3)
     up_quantile = round(confidence * 0.005 + 0.5, 3)
 
+    # The steps are cached: a step is not run again if it was run with the same arguments before.
+    # The outputs of the steps are therefore stored under a path keyed on the latest tx_minute of the
+    # feature group and on the model build parameters instead of the execution ID. An execution
+    # without new data nor new parameters then reuses the results of the previous one, e.g. the
+    # model it trained. The preprocessing only reads the records until that tx_minute. The model
+    # steps cannot be cached, they are skipped when the model of the data version is registered
+    try:
+        high_water_mark = query_high_water_mark(
+            FeatureGroup(name=feature_group_name, sagemaker_session=sagemaker_session),
+            f"s3://{default_bucket}/{pipeline_name}/athena_query_results",
+            sagemaker_session.boto_session.client("s3"),
+        )
+    except Exception as e:
+        print(f"An error occurred querying the feature group high-water mark: {e}")
+        high_water_mark = None
+    if high_water_mark is not None:
+        data_version = get_data_version(
+            high_water_mark,
+            model_target_parameters,
+            data_extraction_parameters,
+            model_training_hyperparameters,
+            model_tuning_parameters,
+        )
+        print(f"Data high-water mark is {high_water_mark}, data version is {data_version}.")
+        steps_s3_prefix = f"{pipeline_name}/cached_steps/{data_version}"
+        steps_s3_path = f"s3://{default_bucket}/{steps_s3_prefix}"
+    else:
+        # Without high-water mark, the steps are not cached
+        data_version = None
+        steps_s3_prefix = pipeline_execution_s3_prefix
+        steps_s3_path = Join(on="/", values=["s3:/", default_bucket, steps_s3_prefix])
+    cache_config = CacheConfig(
+        enable_caching=high_water_mark is not None, expire_after=STEP_CACHE_EXPIRATION
+    )
+
+    # The model is trained on one series per aggregated column and hopping window (optional).
+    # Defaults to the single target series
+    series_cols = model_target_parameters.get("series_cols", "none")
+    series_windows = model_target_parameters.get("series_windows", "1")
+    dynamic_features = model_target_parameters.get("dynamic_features", "none")
+    nb_series = len(
+        series_layout(
+            model_target_parameters["target_col"],
+            parse_list(series_cols),
+            parse_list(series_windows),
+        )
+    )
+    # The test set has one input per series. Small test sets are forecasted in seconds, they are
+    # forecasted by the evaluation step on a serverless endpoint rather than on a Batch Transform
+    # instance which takes minutes to provision
+    serverless_evaluation = nb_series <= int(
+        model_evaluation_parameters.get("serverless_max_series", SERVERLESS_EVALUATION_MAX_SERIES)
+    )
+    print(
+        f"The test set of {nb_series} series is forecasted "
+        f"{'on a serverless endpoint' if serverless_evaluation else 'with a Batch Transform'}."
+    )
+
     #
     # Step 1: Data Preprocessing
     #
     # processing step for feature engineering
-    # List of processing images: https://github.com/aws/sagemaker-python-sdk/tree/master/src/sagemaker/image_uri_config
-    # If we need to create our own container: https://docs.aws.amazon.com/sagemaker/latest/dg/processing-container-run-scripts.html
-    processing_image_uri = sagemaker.image_uris.get_base_python_image_uri(
-        region=region, py_version="310"
-    )
+    # The processing image is built from resources/sagemaker/processing-image with the pinned
+    # dependencies of the processing scripts
+    processing_image_uri = get_processing_image_uri(ssm_client, region)
 
     data_preprocessor = ScriptProcessor(
         image_uri=processing_image_uri,
@@ -294,7 +557,14 @@ def get_pipeline(
         role=role,
     )
 
+    shared_code_input = ProcessingInput(
+        input_name="shared",
+        source=os.path.join(BASE_DIR, "shared"),
+        destination=LOCAL_SHARED_CODE_DIR,
+    )
+
     preprocessing_step_args = data_preprocessor.run(
+        inputs=[shared_code_input],
         outputs=[
             ProcessingOutput(
                 output_name="train",
@@ -302,7 +572,7 @@ def get_pipeline(
                 destination=Join(
                     on="/",
                     values=[
-                        pipeline_execution_s3_path,
+                        steps_s3_path,
                         "data_preprocessing",
                         "train",
                     ],
@@ -314,7 +584,7 @@ def get_pipeline(
                 destination=Join(
                     on="/",
                     values=[
-                        pipeline_execution_s3_path,
+                        steps_s3_path,
                         "data_preprocessing",
                         "validation",
                     ],
@@ -326,7 +596,7 @@ def get_pipeline(
                 destination=Join(
                     on="/",
                     values=[
-                        pipeline_execution_s3_path,
+                        steps_s3_path,
                         "data_preprocessing",
                         "test",
                     ],
@@ -345,7 +615,7 @@ def get_pipeline(
             Join(
                 on="/",
                 values=[
-                    pipeline_execution_s3_path,
+                    steps_s3_path,
                     "athena_query_results",
                 ],
             ),
@@ -355,12 +625,27 @@ def get_pipeline(
             model_target_parameters["target_col"],
             "--prediction-length",
             model_target_parameters["prediction_length"],
-        ],
+            "--series-cols",
+            series_cols,
+            "--series-windows",
+            series_windows,
+            "--dynamic-features",
+            dynamic_features,
+            "--extraction-mode",
+            data_extraction_parameters.get("mode", "incremental"),
+            "--snapshot-overlap-minutes",
+            data_extraction_parameters.get("snapshot_overlap_minutes", "60"),
+            # DeepAR reads gzip compressed JSON lines train and validation datasets
+            "--dataset-compression",
+            "gzip",
+        ]
+        + (["--high-water-mark", high_water_mark] if high_water_mark is not None else []),
     )
 
     step_preprocessing = ProcessingStep(
         name=PROCESSING_STEP_NAME,
         step_args=preprocessing_step_args,
+        cache_config=cache_config,
     )
 
     #
@@ -383,7 +668,7 @@ def get_pipeline(
         output_path=Join(
             on="/",
             values=[
-                pipeline_execution_s3_path,
+                steps_s3_path,
                 "model_training",
             ],
         ),
@@ -402,38 +687,83 @@ def get_pipeline(
         "context_length": model_target_parameters["prediction_length"],
         "prediction_length": model_target_parameters["prediction_length"],
     }
+    # The number of cells is only set once tuned and approved
+    if "num_cells" in model_training_hyperparameters:
+        hyperparameters["num_cells"] = model_training_hyperparameters["num_cells"]
+    # The series have their index as category, and share the calendar dynamic features
+    if nb_series > 1:
+        hyperparameters["cardinality"] = "auto"
+    if parse_list(dynamic_features):
+        hyperparameters["num_dynamic_feat"] = "auto"
     deepar_estimator.set_hyperparameters(**hyperparameters)
-    preprocessing_step_args = deepar_estimator.fit(
-        inputs={
-            "train": TrainingInput(
-                s3_data=step_preprocessing.properties.ProcessingOutputConfig.Outputs[
-                    "train"
-                ].S3Output.S3Uri,
-                content_type="json",
-            ),
-            # The DeepAR dataset used to validate the model while training is called test
-            # so we pass the validation dataset as test
-            "test": TrainingInput(
-                s3_data=step_preprocessing.properties.ProcessingOutputConfig.Outputs[
-                    "validation"
-                ].S3Output.S3Uri,
-                content_type="json",
+    training_inputs = {
+        "train": TrainingInput(
+            s3_data=step_preprocessing.properties.ProcessingOutputConfig.Outputs[
+                "train"
+            ].S3Output.S3Uri,
+            content_type="json",
+        ),
+        # The DeepAR dataset used to validate the model while training is called test
+        # so we pass the validation dataset as test
+        "test": TrainingInput(
+            s3_data=step_preprocessing.properties.ProcessingOutputConfig.Outputs[
+                "validation"
+            ].S3Output.S3Uri,
+            content_type="json",
+        ),
+    }
+
+    if tuning_enabled:
+        # The hyperparameter tuning trains models with the hyperparameters in the ranges, the other
+        # hyperparameters being static, and keeps the one with the lowest validation loss. The
+        # training jobs which do not improve are stopped early. The tuning is warm started from
+        # the tuning job of the last approved model, so that the cost of the tuning is spread
+        # across the retrainings
+        tuner = HyperparameterTuner(
+            estimator=deepar_estimator,
+            objective_metric_name=TUNING_OBJECTIVE_METRIC,
+            hyperparameter_ranges=HYPERPARAMETER_RANGES,
+            objective_type="Minimize",
+            strategy="Bayesian",
+            max_jobs=int(model_tuning_parameters.get("max_jobs", TUNING_MAX_JOBS)),
+            max_parallel_jobs=int(
+                model_tuning_parameters.get("max_parallel_jobs", TUNING_MAX_PARALLEL_JOBS)
             ),
-        },
-    )
+            early_stopping_type="Auto",
+            warm_start_config=get_warm_start_config(sm_client, approved_model_package),
+            base_tuning_job_name=TUNING_JOB_NAME,
+        )
+        preprocessing_step_args = tuner.fit(inputs=training_inputs)
 
-    step_train = TrainingStep(
-        name=TRAINING_STEP_NAME,
-        step_args=preprocessing_step_args,
-        depends_on=[PROCESSING_STEP_NAME],
-    )
+        step_train = TuningStep(
+            name=TUNING_STEP_NAME,
+            step_args=preprocessing_step_args,
+            depends_on=[PROCESSING_STEP_NAME],
+            cache_config=cache_config,
+        )
+        # The best model is written by its training job under the estimator output path
+        model_data = step_train.get_top_model_s3_uri(
+            top_k=0,
+            s3_bucket=default_bucket,
+            prefix=Join(on="/", values=[steps_s3_prefix, "model_training"]),
+        )
+    else:
+        preprocessing_step_args = deepar_estimator.fit(inputs=training_inputs)
+
+        step_train = TrainingStep(
+            name=TRAINING_STEP_NAME,
+            step_args=preprocessing_step_args,
+            depends_on=[PROCESSING_STEP_NAME],
+            cache_config=cache_config,
+        )
+        model_data = step_train.properties.ModelArtifacts.S3ModelArtifacts
 
     #
-    # Step 3: Create the Model
+    # Step 3: Create the Model (test sets above the serverless evaluation size)
     #
     model = Model(
         image_uri=deepar_image_uri,
-        model_data=step_train.properties.ModelArtifacts.S3ModelArtifacts,
+        model_data=model_data,
         sagemaker_session=pipeline_session,
         role=role,
     )
@@ -449,7 +779,7 @@ def get_pipeline(
     )
 
     #
-    # Step 4: Batch Transform
+    # Step 4: Batch Transform (test sets above the serverless evaluation size)
     #
     # Batch Transform for DeepAR
     # documentation: https://docs.aws.amazon.com/sagemaker/latest/dg/deepar-in-formats.html#deepar-batch
@@ -458,49 +788,76 @@ def get_pipeline(
         "output_types": ["quantiles", "mean"],
         "quantiles": [str(low_quantile), "0.5", str(up_quantile)],
     }
-    transformer = Transformer(
-        model_name=step_create_model.properties.ModelName,
-        instance_type=TRANSFORM_INSTANCE_TYPE,
-        instance_count=1,
-        accept="application/jsonlines",
-        strategy="SingleRecord",
-        assemble_with="Line",
-        output_path=Join(
-            on="/",
-            values=[
-                pipeline_execution_s3_path,
-                "batch_transform",
-            ],
-        ),
-        sagemaker_session=pipeline_session,
-        env={"DEEPAR_INFERENCE_CONFIG": json.dumps(deepar_environment_param)},
-    )
+    if serverless_evaluation:
+        # The evaluation step creates a temporary model from the model artifacts and forecasts the
+        # test inputs with it on a serverless endpoint. Its arguments do not change between the
+        # executions with the same data version, so that it is cached like the training
+        step_transform = None
+        transform_outputs_input = []
+        evaluation_arguments = [
+            "--model-data", model_data,
+            "--image-uri", deepar_image_uri,
+            "--model-role", role,
+            "--inference-config", json.dumps(deepar_environment_param),
+            "--serverless-memory-size",
+            str(
+                model_evaluation_parameters.get(
+                    "serverless_memory_size", SERVERLESS_EVALUATION_MEMORY_SIZE
+                )
+            ),
+        ]
+    else:
+        transformer = Transformer(
+            model_name=step_create_model.properties.ModelName,
+            instance_type=TRANSFORM_INSTANCE_TYPE,
+            instance_count=1,
+            accept="application/jsonlines",
+            strategy="SingleRecord",
+            assemble_with="Line",
+            output_path=Join(
+                on="/",
+                values=[
+                    steps_s3_path,
+                    "batch_transform",
+                ],
+            ),
+            sagemaker_session=pipeline_session,
+            env={"DEEPAR_INFERENCE_CONFIG": json.dumps(deepar_environment_param)},
+        )
 
-    transform_inputs = TransformInput(
-        data=Join(
-            on="/",
-            values=[
-                step_preprocessing.properties.ProcessingOutputConfig.Outputs[
-                    "test"
-                ].S3Output.S3Uri,
-                "test-inputs.json",
-            ],
+        transform_inputs = TransformInput(
+            data=Join(
+                on="/",
+                values=[
+                    step_preprocessing.properties.ProcessingOutputConfig.Outputs[
+                        "test"
+                    ].S3Output.S3Uri,
+                    "test-inputs.json",
+                ],
+            )
         )
-    )
 
-    # The output of the DeepAR Tranform is also in JSON lines format, with one line per prediction
-    # The prediction will have the following format:
-    # { "quantiles": { "0.1": [...], "0.5": [...], "0.9": [...]}}
-    preprocessing_step_args = transformer.transform(
-        data=transform_inputs.data,
-        content_type="application/jsonlines",
-        split_type="Line",
-    )
+        # The output of the DeepAR Tranform is also in JSON lines format, with one line per prediction
+        # The prediction will have the following format:
+        # { "quantiles": { "0.1": [...], "0.5": [...], "0.9": [...]}}
+        preprocessing_step_args = transformer.transform(
+            data=transform_inputs.data,
+            content_type="application/jsonlines",
+            split_type="Line",
+        )
 
-    step_transform = TransformStep(
-        name=TRANSFORM_STEP_NAME,
-        step_args=preprocessing_step_args,
-    )
+        step_transform = TransformStep(
+            name=TRANSFORM_STEP_NAME,
+            step_args=preprocessing_step_args,
+            cache_config=cache_config,
+        )
+        transform_outputs_input = [
+            ProcessingInput(
+                source=step_transform.properties.TransformOutput.S3OutputPath,
+                destination=LOCAL_TRANSFORM_DIR,
+            ),
+        ]
+        evaluation_arguments = []
 
     #
     # Step 5: Evaluate the results of the Batch transform
@@ -520,17 +877,15 @@ def get_pipeline(
 
     eval_step_args = evaluate_processor.run(
         inputs=[
+            shared_code_input,
             ProcessingInput(
                 source=step_preprocessing.properties.ProcessingOutputConfig.Outputs[
                     "test"
                 ].S3Output.S3Uri,
                 destination=LOCAL_TEST_DIR,
             ),
-            ProcessingInput(
-                source=step_transform.properties.TransformOutput.S3OutputPath,
-                destination=LOCAL_TRANSFORM_DIR,
-            ),
-        ],
+        ]
+        + transform_outputs_input,
         outputs=[
             ProcessingOutput(
                 output_name="model_evaluation",
@@ -538,7 +893,7 @@ def get_pipeline(
                 destination=Join(
                     on="/",
                     values=[
-                        pipeline_execution_s3_path,
+                        steps_s3_path,
                         "model_evaluation",
                     ],
                 ),
@@ -549,7 +904,8 @@ def get_pipeline(
             "--target-col", model_target_parameters["target_col"],
             "--low_quantile", str(low_quantile),
             "--up_quantile", str(up_quantile),
-        ],
+        ]
+        + evaluation_arguments,
     )
 
     evaluation_report = PropertyFile(
@@ -562,7 +918,8 @@ def get_pipeline(
         name=EVALUATION_STEP_NAME,
         step_args=eval_step_args,
         property_files=[evaluation_report],
-        depends_on=[TRANSFORM_STEP_NAME],
+        depends_on=None if serverless_evaluation else [TRANSFORM_STEP_NAME],
+        cache_config=cache_config,
     )
 
     #
@@ -595,7 +952,7 @@ def get_pipeline(
         output_s3_uri=Join(
             on="/",
             values=[
-                pipeline_execution_s3_path,
+                steps_s3_path,
                 "model_quality_check",
             ],
         ),
@@ -613,6 +970,7 @@ def get_pipeline(
         supplied_baseline_statistics=supplied_baseline_statistics_model_quality,
         supplied_baseline_constraints=supplied_baseline_constraints_model_quality,
         model_package_group_name=model_package_group_name,
+        cache_config=cache_config,
     )
 
     model_metrics = ModelMetrics(
@@ -656,6 +1014,8 @@ def get_pipeline(
     # the newly calculated baselines. In some cases, users may retain an older version of the baseline file to be used
     # for drift checks and not register new baselines that are calculated in the Pipeline run.
 
+    # The model package stores the data version of the model, so that the next executions with the
+    # same data version do not register it again
     register_step_args = model.register(
         content_types=["application/json"],
         response_types=["application/json"],
@@ -665,6 +1025,9 @@ def get_pipeline(
         approval_status=model_approval_status,
         model_metrics=model_metrics,
         drift_check_baselines=drift_check_baselines,
+        customer_metadata_properties=(
+            {DATA_VERSION_METADATA_KEY: data_version} if data_version is not None else None
+        ),
     )
 
     step_register = ModelStep(
@@ -685,12 +1048,64 @@ def get_pipeline(
         ),
         right=weighted_quantile_loss_threshold,
     )
+    # The best hyperparameters of the tuning are stored on the registered model package. The next
+    # trainings use them once the model is approved
+    if_steps = [model_quality_check_step, step_register]
+    if tuning_enabled:
+        hyperparameters_processor = ScriptProcessor(
+            image_uri=processing_image_uri,
+            command=["python3"],
+            instance_type=PROCESSING_INSTANCE_TYPE,
+            instance_count=1,
+            base_job_name=UPDATE_HYPERPARAMETERS_JOB_NAME,
+            sagemaker_session=pipeline_session,
+            role=role,
+        )
+        update_hyperparameters_step_args = hyperparameters_processor.run(
+            inputs=[shared_code_input],
+            code=os.path.join(BASE_DIR, "update_hyperparameters.py"),
+            arguments=[
+                "--tuning-job-name", step_train.properties.HyperParameterTuningJobName,
+                "--model-package-arn", step_register.properties.ModelPackageArn,
+                "--metadata-prefix", TUNED_HYPERPARAMETER_METADATA_PREFIX,
+            ],
+        )
+        if_steps.append(
+            ProcessingStep(
+                name=UPDATE_HYPERPARAMETERS_STEP_NAME,
+                step_args=update_hyperparameters_step_args,
+            )
+        )
     step_cond = ConditionStep(
         name=CONDITON_STEP_NAME,
         conditions=[cond_lte],
-        if_steps=[model_quality_check_step, step_register],
+        if_steps=if_steps,
         else_steps=[],
     )
+    model_steps = ([] if serverless_evaluation else [step_create_model, step_transform]) + [
+        step_eval,
+        step_cond,
+    ]
+    # The model creation and registration steps cannot be cached. When the model of the data
+    # version is already registered, the execution stops after the cached training instead of
+    # creating and registering the same model again. The registered data version is a parameter,
+    # set to an empty string to register the model again
+    last_registered_data_version = get_registered_data_version(
+        describe_last_model_package(sm_client, model_package_group_name)
+    )
+    registered_data_version = ParameterString(
+        name="RegisteredDataVersion", default_value=last_registered_data_version
+    )
+    if data_version is not None:
+        print(f"The data version of the last registered model is {last_registered_data_version}.")
+        model_steps = [
+            ConditionStep(
+                name=DATA_VERSION_CONDITION_STEP_NAME,
+                conditions=[ConditionEquals(left=registered_data_version, right=data_version)],
+                if_steps=[],
+                else_steps=model_steps,
+            )
+        ]
 
 
     # pipeline instance
@@ -706,15 +1121,13 @@ def get_pipeline(
             register_new_baseline_model_quality,
             supplied_baseline_statistics_model_quality,
             supplied_baseline_constraints_model_quality,
+            registered_data_version,
         ],
         steps=[
             step_preprocessing,
             step_train,
-            step_create_model,
-            step_transform,
-            step_eval,
-            step_cond,
-        ],
+        ]
+        + model_steps,
         sagemaker_session=pipeline_session,
     )
     return pipeline
@@ -1,19 +1,38 @@
 """Feature engineers the Blockchain time series dataset for the DeepAR model."""
 
-# install the sagemaker package before the import
-import subprocess
 import sys
 
-subprocess.check_call([sys.executable, "-m", "pip", "install", "sagemaker>=2.239.0"])
-subprocess.check_call([sys.executable, "-m", "pip", "install", "pandas>=2.1.3"])
-import json  # noqa: E402
+# The shared modules are mounted by the pipeline next to the code of the script
+sys.path.insert(0, "/opt/ml/processing/input/shared")
+from dependencies import install_missing  # noqa: E402
+
+# The dependencies are in the processing image, they are only installed on other images
+install_missing(["sagemaker>=2.239.0", "pandas>=2.1.3", "pyarrow>=14.0.1"])
+import itertools  # noqa: E402
 import pathlib  # noqa: E402
 import logging  # noqa: E402
 import argparse  # noqa: E402
+import tempfile  # noqa: E402
 import boto3  # noqa: E402
+import botocore  # noqa: E402
 import pandas as pd  # noqa: E402
 from sagemaker.session import Session  # noqa: E402
 from sagemaker.feature_store.feature_group import FeatureGroup  # noqa: E402
+from feature_data import (  # noqa: E402
+    EVENT_TIME_FEATURE,
+    RECORD_IDENTIFIER,
+    dedupe_records,
+    merge_snapshot,
+    query_latest_records,
+)
+from time_series import (  # noqa: E402
+    calendar_features,
+    hopping_window_series,
+    parse_list,
+    resample_series,
+    series_layout,
+)
+from deepar_dataset import backtest_windows, columns_to_series, write_dataset  # noqa: E402
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -26,73 +45,211 @@ logger.addHandler(logging.StreamHandler())
 # Directories
 PROCESSING_FOLDER_NAME = "processing"
 LOCAL_DATA_DIR = f"/opt/ml/{PROCESSING_FOLDER_NAME}/data"
+# Deduplicated snapshot of the feature group records, used for the incremental extraction
+SNAPSHOT_PREFIX = "training-data-snapshots"
+SNAPSHOT_FILE_NAME = "snapshot.parquet"
+# Athena timestamp literal format of the snapshot write time watermark
+WRITE_TIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def read_snapshot(s3_client, bucket, key):
+    """Reads the snapshot of the feature group records from S3. Returns None if there is none."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        local_path = f"{tmp_dir}/{SNAPSHOT_FILE_NAME}"
+        try:
+            s3_client.download_file(bucket, key, local_path)
+        except botocore.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] in ["404", "NoSuchKey"]:
+                return None
+            raise e
+        return pd.read_parquet(local_path)
+
+
+def write_snapshot(s3_client, df, bucket, key):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        local_path = f"{tmp_dir}/{SNAPSHOT_FILE_NAME}"
+        df.to_parquet(local_path, index=False)
+        s3_client.upload_file(local_path, bucket, key)
 
 
-def write_dicts_to_file(path, data):
-    with open(path, "wb") as fp:
-        for d in data:
-            fp.write(json.dumps(d).encode("utf-8"))
-            fp.write("\n".encode("utf-8"))
+def extract_records(
+    feature_group,
+    columns,
+    s3_client,
+    bucket,
+    output_s3_path,
+    extraction_mode,
+    overlap_minutes,
+):
+    """Extracts the deduplicated records of the feature group.
+
+    In the incremental mode, the records are kept in a Parquet snapshot in the artifacts
+    bucket and only the record versions written to the offline store after the snapshot
+    watermark (the latest write_time, minus an overlap for the files visible late to Athena)
+    are queried and merged into it, whatever their tx_minute. The rewritten records replace
+    the snapshot ones and the deleted records are removed from it.
+    In the full mode, or if the snapshot does not have all the columns, all the records
+    are queried and the snapshot is rebuilt.
+
+    Returns:
+        pd.DataFrame: the deduplicated records, sorted by tx_minute
+    """
+    snapshot_key = f"{SNAPSHOT_PREFIX}/{feature_group.name}/{SNAPSHOT_FILE_NAME}"
+    snapshot = None
+    if extraction_mode == "incremental":
+        snapshot = read_snapshot(s3_client, bucket, snapshot_key)
+    if snapshot is not None and not set(columns + ["write_time"]).issubset(
+        snapshot.columns
+    ):
+        logger.info("The snapshot does not have all the columns. Rebuilding it.")
+        snapshot = None
+    written_since = None
+    if snapshot is not None and len(snapshot) > 0:
+        watermark = pd.Timestamp(snapshot["write_time"].max())
+        written_since = (watermark - pd.Timedelta(minutes=overlap_minutes)).strftime(
+            WRITE_TIME_FORMAT
+        )[:-3]
+        logger.info(
+            f"Read {len(snapshot)} records from the snapshot with the write time watermark {watermark}."
+        )
+    else:
+        logger.info("No snapshot used. Querying all the records.")
+    new_records = query_latest_records(
+        feature_group,
+        columns,
+        output_s3_path,
+        s3_client,
+        written_since=written_since,
+        with_deleted=True,
+    )
+    logger.info(f"Queried {len(new_records)} records.")
+    df = merge_snapshot(snapshot, new_records)
+    write_snapshot(s3_client, df, bucket, snapshot_key)
+    logger.info(
+        f"Stored the snapshot of {len(df)} records in s3://{bucket}/{snapshot_key}."
+    )
+    return df.drop(columns="write_time")
+
+
+def read_records(path, columns):
+    """Reads the deduplicated feature group records from a local Parquet or CSV file."""
+    if path.endswith(".csv"):
+        df = pd.read_csv(path)
+    else:
+        df = pd.read_parquet(path)
+    df = df[[RECORD_IDENTIFIER, EVENT_TIME_FEATURE] + list(columns)]
+    return dedupe_records(df).reset_index(drop=True)
 
 
 if __name__ == "__main__":
     logger.info("Starting preprocessing.")
     parser = argparse.ArgumentParser()
-    parser.add_argument("--region", type=str, required=True)
-    parser.add_argument("--feature-group-name", type=str, required=True)
-    parser.add_argument("--artifacts-bucket", type=str, required=True)
-    parser.add_argument("--output-s3-path", type=str, required=True)
+    # The feature group arguments are not used when the records are read from a local file
+    parser.add_argument("--region", type=str)
+    parser.add_argument("--feature-group-name", type=str)
+    parser.add_argument("--artifacts-bucket", type=str)
+    parser.add_argument("--output-s3-path", type=str)
+    # Local Parquet or CSV file of feature group records, used by the local pipeline runner
+    parser.add_argument("--input-records", type=str, default=None)
+    parser.add_argument("--local-data-dir", type=str, default=LOCAL_DATA_DIR)
+    # Latest tx_minute of the records to use, set by the pipeline to cache the step on the data
+    parser.add_argument("--high-water-mark", type=str, default=None)
     parser.add_argument("--freq", type=str, required=True)
     parser.add_argument("--target-col", type=str, required=True)
     parser.add_argument("--prediction-length", type=int, required=True)
+    # Comma separated lists, see the time_series shared module
+    parser.add_argument("--series-cols", type=str, default="none")
+    parser.add_argument("--series-windows", type=str, default="1")
+    parser.add_argument("--dynamic-features", type=str, default="none")
+    parser.add_argument(
+        "--extraction-mode",
+        type=str,
+        choices=["incremental", "full"],
+        default="incremental",
+    )
+    parser.add_argument("--snapshot-overlap-minutes", type=int, default=60)
+    parser.add_argument(
+        "--dataset-compression", type=str, choices=["none", "gzip"], default="none"
+    )
     args = parser.parse_args()
+    if args.input_records is None and not all(
+        [
+            args.region,
+            args.feature_group_name,
+            args.artifacts_bucket,
+            args.output_s3_path,
+        ]
+    ):
+        parser.error(
+            "--region, --feature-group-name, --artifacts-bucket and --output-s3-path are "
+            "required to read the records from the feature group"
+        )
+    local_data_dir = args.local_data_dir
     region = args.region
     feature_group_name = args.feature_group_name
     freq = args.freq
     target_col = args.target_col
     prediction_length = args.prediction_length
+    layout = series_layout(
+        target_col, parse_list(args.series_cols), parse_list(args.series_windows)
+    )
+    columns = list(dict.fromkeys(column for column, _ in layout))
+    dynamic_features = parse_list(args.dynamic_features)
     # Set S3 Buckets variables
     artifacts_bucket = args.artifacts_bucket
     output_s3_path = args.output_s3_path
 
-    # Set feature store session
-    boto_session = boto3.Session(region_name=region)
-    sagemaker_client = boto_session.client(service_name="sagemaker", region_name=region)
-    featurestore_runtime = boto_session.client(
-        service_name="sagemaker-featurestore-runtime", region_name=region
-    )
-    feature_store_session = Session(
-        boto_session=boto_session,
-        sagemaker_client=sagemaker_client,
-        sagemaker_featurestore_runtime_client=featurestore_runtime,
-    )
+    if args.input_records is not None:
+        logger.info(f"Loading the records from {args.input_records}.")
+        df = read_records(args.input_records, columns)
+    else:
+        # Set feature store session
+        boto_session = boto3.Session(region_name=region)
+        sagemaker_client = boto_session.client(
+            service_name="sagemaker", region_name=region
+        )
+        featurestore_runtime = boto_session.client(
+            service_name="sagemaker-featurestore-runtime", region_name=region
+        )
+        feature_store_session = Session(
+            boto_session=boto_session,
+            sagemaker_client=sagemaker_client,
+            sagemaker_featurestore_runtime_client=featurestore_runtime,
+        )
 
-    # Load data from LeatureStore
-    logger.info("Loading the data from SageMaker FeatureStore using Athena.")
-    transactions_feature_group_name = feature_group_name
-    transactions_feature_group = FeatureGroup(
-        name=transactions_feature_group_name, sagemaker_session=feature_store_session
-    )
-    # Query the Data from FeatureStore using Athena
-    transactions_data_query = transactions_feature_group.athena_query()
-    transactions_data_table = transactions_data_query.table_name
-    query_string = f'SELECT * FROM "{transactions_data_table}"'
-    # run Athena query. The output is loaded to a Pandas dataframe.
-    # dataset = pd.DataFrame()
-    transactions_data_query.run(
-        query_string=query_string,
-        output_location=output_s3_path,
-    )
-    transactions_data_query.wait()
-    df = transactions_data_query.as_dataframe()
+        # Load data from LeatureStore
+        logger.info("Loading the data from SageMaker FeatureStore using Athena.")
+        transactions_feature_group_name = feature_group_name
+        transactions_feature_group = FeatureGroup(
+            name=transactions_feature_group_name,
+            sagemaker_session=feature_store_session,
+        )
+        # Query the Data from FeatureStore using Athena. The output is loaded to a Pandas dataframe.
+        df = extract_records(
+            transactions_feature_group,
+            columns,
+            boto_session.client("s3"),
+            artifacts_bucket,
+            output_s3_path,
+            args.extraction_mode,
+            args.snapshot_overlap_minutes,
+        )
+
+    if args.high_water_mark is not None:
+        df = df[df[RECORD_IDENTIFIER] <= args.high_water_mark]
+        logger.info(
+            f"Kept {len(df)} records until the high-water mark {args.high_water_mark}."
+        )
 
-    # Simple Dataset ETL:
-    # - sort the values by time
-    # - convert the time column from string to Pandas TImestamp
-    logger.info("Performing Simple ETL.")
-    df.sort_values(by="tx_minute", axis=0, ascending=True, inplace=True)
-    df["tx_minute"] = pd.to_datetime(df["tx_minute"])
-    df.set_index("tx_minute", drop=True, inplace=True)
+    # Resample the series to the model frequency, the missing periods are NaN
+    logger.info(f"Resampling {len(df)} records to the {freq} frequency.")
+    df = resample_series(df, columns, freq)
+    logger.info(
+        f"{int(df[target_col].isna().sum())} missing data points in the series."
+    )
+    # Build one series per column and hopping window, the target series being the first one
+    df = hopping_window_series(df, layout)
+    logger.info(f"Built the {len(layout)} series {list(df.columns)}.")
 
     # Create the Train, Test and Validation Splits
     logger.info(
@@ -115,53 +272,48 @@ if __name__ == "__main__":
     validation_windows_length = num_validation_windows * prediction_length
 
     # Format the datasets for DeepAR
+    # The train, validation windows and test inputs are views on a single copy of the series
+    # (one column per series), which are streamed to the JSON lines files
     logger.info("Formatting the data for the DeepAR model.")
     df_test_targets = df[-test_length:]
-    df_train_validation = df[:-test_length]
-    df_train = df_train_validation[:-validation_windows_length]
-
-    training_data = [
-        {
-            "start": str(start_dataset),
-            "target": list(df_train[target_col]),
-        }
-    ]
-    validation_data = [
-        {
-            "start": str(start_dataset),
-            "target": list(
-                df_train_validation.iloc[
-                    0 : -int((num_validation_windows - k) * prediction_length),
-                    df_train_validation.columns.get_loc(target_col),
-                ]
-            ),
-        }
-        for k in range(1, num_validation_windows)
-    ]
-    validation_data.append(
-        {
-            "start": str(start_dataset),
-            "target": list(df_train_validation[target_col]),
-        }
+    values = df.to_numpy(dtype=float)
+    dynamic_feat = calendar_features(df.index, dynamic_features)
+    train_validation_values = values[:-test_length]
+    train_values = train_validation_values[:-validation_windows_length]
+    validation_windows = backtest_windows(
+        train_validation_values, num_validation_windows, prediction_length
     )
-    # For testing the dataset input will be the data minus the last prediction_length, which
-    # is equal to the entire train and cvalidation dataset
-    # The target will be the last prediction_length data points
-    test_inputs_data = [
-        {
-            "start": str(start_dataset),
-            "target": list(df_train_validation[target_col]),
-        }
-    ]
 
     # Store the datasets locally
     # (They will be stored to S3 in the pipeline using the ProcessingOutput)
     logger.info("Copying the training, validation and test datasets.")
     for data_path in ["train", "validation", "test"]:
-        pathlib.Path(f"{LOCAL_DATA_DIR}/{data_path}").mkdir(parents=True, exist_ok=True)
-    write_dicts_to_file(f"{LOCAL_DATA_DIR}/train/train.json", training_data)
-    write_dicts_to_file(f"{LOCAL_DATA_DIR}/validation/validation.json", validation_data)
-    write_dicts_to_file(f"{LOCAL_DATA_DIR}/test/test-inputs.json", test_inputs_data)
+        pathlib.Path(f"{local_data_dir}/{data_path}").mkdir(parents=True, exist_ok=True)
+    extension = ".json.gz" if args.dataset_compression == "gzip" else ".json"
+    write_dataset(
+        f"{local_data_dir}/train/train{extension}",
+        columns_to_series(train_values, start_dataset, dynamic_feat),
+        compression=args.dataset_compression,
+    )
+    write_dataset(
+        f"{local_data_dir}/validation/validation{extension}",
+        itertools.chain.from_iterable(
+            columns_to_series(window, start_dataset, dynamic_feat)
+            for window in validation_windows
+        ),
+        compression=args.dataset_compression,
+    )
+    # For testing the dataset input will be the data minus the last prediction_length, which
+    # is equal to the entire train and validation dataset
+    # The target will be the last prediction_length data points
+    # The dynamic features of the test inputs cover the prediction length
+    # The test inputs are read by the Batch Transform job and are not compressed
+    write_dataset(
+        f"{local_data_dir}/test/test-inputs.json",
+        columns_to_series(
+            train_validation_values, start_dataset, dynamic_feat, horizon=test_length
+        ),
+    )
     df_test_targets.to_csv(
-        f"{LOCAL_DATA_DIR}/test/test-targets.csv", header=True, index=False
+        f"{local_data_dir}/test/test-targets.csv", header=True, index=False
     )
@@ -0,0 +1,5 @@
+"""Modules shared by the processing scripts of the pipeline.
+
+The folder is mounted in the processing jobs as a ProcessingInput and added to the Python path
+of the scripts, so the modules must only import each other with absolute module names.
+"""
@@ -0,0 +1,117 @@
+"""Writes DeepAR datasets in the JSON Lines format, streaming the series from numpy arrays.
+
+See https://docs.aws.amazon.com/sagemaker/latest/dg/deepar.html#deepar-inputoutput
+"""
+
+import gzip
+import json
+
+import numpy as np
+
+# Number of values converted to text at once, to bound the memory used by the conversion
+CHUNK_SIZE = 65536
+
+
+def write_array(fp, values):
+    """Writes a numeric array as a JSON array, with the missing values (NaN) as null.
+
+    The values are converted to text by numpy chunk by chunk, without creating a Python float
+    object per value.
+    """
+    values = np.asarray(values, dtype=float)
+    fp.write("[")
+    for start in range(0, len(values), CHUNK_SIZE):
+        chunk = values[start : start + CHUNK_SIZE]
+        text = chunk.astype(str)
+        text[~np.isfinite(chunk)] = "null"
+        if start > 0:
+            fp.write(",")
+        fp.write(",".join(text))
+    fp.write("]")
+
+
+def write_series(fp, start, target, cat=None, dynamic_feat=None):
+    """Writes one time series as a JSON line.
+
+    Args:
+        fp: the text file object to write to
+        start (str): the timestamp of the first value
+        target (np.ndarray): the values of the series
+        cat (list[int]): the categories of the series (optional)
+        dynamic_feat (list[np.ndarray]): the dynamic features of the series (optional)
+    """
+    fp.write('{"start": ')
+    fp.write(json.dumps(str(start)))
+    fp.write(', "target": ')
+    write_array(fp, target)
+    if cat is not None:
+        fp.write(', "cat": ')
+        fp.write(json.dumps([int(c) for c in cat]))
+    if dynamic_feat is not None:
+        fp.write(', "dynamic_feat": [')
+        for i, feature in enumerate(dynamic_feat):
+            if i > 0:
+                fp.write(",")
+            write_array(fp, feature)
+        fp.write("]")
+    fp.write("}\n")
+
+
+def open_dataset(path, compression=None):
+    """Opens a dataset file for writing, gzip compressed if `compression` is "gzip"."""
+    if compression == "gzip":
+        return gzip.open(path, "wt", encoding="utf-8")
+    return open(path, "w", encoding="utf-8")
+
+
+def write_dataset(path, series, compression=None):
+    """Writes the time series to a JSON Lines file.
+
+    Args:
+        path (str): the file path. A ".gz" suffix is expected with the gzip compression, DeepAR
+            detects the compressed files by their extension
+        series (Iterable[dict]): the time series, as dicts with the `start`, `target` and optional
+            `cat` and `dynamic_feat` keys. A generator keeps a single series in memory at once
+        compression (str): None or "gzip"
+    """
+    with open_dataset(path, compression) as fp:
+        for s in series:
+            write_series(
+                fp, s["start"], s["target"], s.get("cat"), s.get("dynamic_feat")
+            )
+
+
+def backtest_windows(values, num_windows, prediction_length):
+    """Returns the prefixes of the series ending `prediction_length` values apart, the last one
+    being the full series. The prefixes are views on `values`, not copies.
+    """
+    values = np.asarray(values, dtype=float)
+    return [
+        values[: len(values) - (num_windows - k) * prediction_length]
+        for k in range(1, num_windows + 1)
+    ]
+
+
+def columns_to_series(values, start, dynamic_feat=None, horizon=0):
+    """Yields one series per column of a 2D array, with the column index as category when there
+    is more than one series.
+
+    Args:
+        values (np.ndarray): the values, with one row per period and one column per series
+        start (str): the timestamp of the first row
+        dynamic_feat (list[np.ndarray]): the dynamic features shared by the series, starting at
+            `start` (optional)
+        horizon (int): the number of periods after the last row the dynamic features must cover,
+            i.e. the prediction length for the inference inputs
+
+    Yields:
+        dict: the series, see `write_dataset`
+    """
+    nb_series = values.shape[1]
+    for i in range(nb_series):
+        series = {"start": start, "target": values[:, i]}
+        if nb_series > 1:
+            series["cat"] = [i]
+        if dynamic_feat:
+            series["dynamic_feat"] = [f[: len(values) + horizon] for f in dynamic_feat]
+        yield series
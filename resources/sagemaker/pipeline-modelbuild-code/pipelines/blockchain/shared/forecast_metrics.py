@@ -0,0 +1,83 @@
+"""Computes the forecast metrics of the DeepAR predictions.
+
+The metrics of all the quantiles and of all the forecast windows (e.g. backtest origins) are
+computed at once with broadcasted numpy operations. The targets have the shape (..., horizon),
+with any number of leading window dimensions, and the metrics are returned with the shape of the
+leading dimensions. The missing target values (NaN) are not taken into account.
+
+See https://docs.aws.amazon.com/sagemaker/latest/dg/deepar.html
+And https://website-nine-gules.vercel.app/blog/how-to-evaluate-probabilistic-forecasts-weighted-quantile-loss
+"""
+
+import numpy as np
+
+
+def quantile_loss(quantiles, predictions, targets):
+    """Returns the quantile loss of each prediction.
+
+    Args:
+        quantiles (array-like): the Q quantiles
+        predictions (np.ndarray): the quantile predictions, with the shape (Q, ..., horizon)
+        targets (np.ndarray): the target values, with the shape (..., horizon)
+
+    Returns:
+        np.ndarray: the quantile losses, with the shape of `predictions`
+    """
+    predictions = np.asarray(predictions, dtype=float)
+    quantiles = np.asarray(quantiles, dtype=float).reshape(
+        (-1,) + (1,) * (predictions.ndim - 1)
+    )
+    errors = np.asarray(targets, dtype=float) - predictions
+    return np.maximum(quantiles * errors, (quantiles - 1) * errors)
+
+
+def forecast_metrics(targets, mean_predictions, quantile_predictions, quantiles):
+    """Computes the metrics of the forecasts of each window.
+
+    The prediction interval is the one between the lowest and the highest quantiles.
+
+    Args:
+        targets (np.ndarray): the target values, with the shape (..., horizon)
+        mean_predictions (np.ndarray): the mean predictions, with the shape of `targets`
+        quantile_predictions (np.ndarray): the quantile predictions, with the shape
+            (Q, ..., horizon)
+        quantiles (list[float]): the Q quantiles, in increasing order
+
+    Returns:
+        dict[str, np.ndarray]: the `rmse`, `mape`, `coverage`, `interval_width` and
+            `weighted_quantile_loss` (mean of the quantiles) of each window, and the
+            `quantile_weighted_losses` of each quantile and window, with the shape (Q, ...)
+    """
+    targets = np.asarray(targets, dtype=float)
+    mean_predictions = np.asarray(mean_predictions, dtype=float)
+    quantile_predictions = np.asarray(quantile_predictions, dtype=float)
+    observed = np.isfinite(targets)
+    nb_observed = observed.sum(axis=-1)
+    abs_targets = np.where(observed, np.abs(targets), 0.0)
+    errors = np.where(observed, mean_predictions - targets, 0.0)
+    low_predictions = quantile_predictions[0]
+    up_predictions = quantile_predictions[-1]
+    covered = observed & (low_predictions <= targets) & (targets <= up_predictions)
+    # The windows without any target value, or without any non-zero target value for the MAPE
+    # and weighted quantile loss, have NaN metrics
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rmse = np.sqrt((errors**2).sum(axis=-1) / nb_observed)
+        percentage_errors = np.where(abs_targets > 0, np.abs(errors) / abs_targets, 0.0)
+        mape = percentage_errors.sum(axis=-1) / (abs_targets > 0).sum(axis=-1)
+        coverage = covered.sum(axis=-1) / nb_observed
+        interval_width = (
+            np.where(observed, up_predictions - low_predictions, 0.0).sum(axis=-1)
+            / nb_observed
+        )
+        losses = np.where(
+            observed, quantile_loss(quantiles, quantile_predictions, targets), 0.0
+        )
+        quantile_weighted_losses = 2 * losses.sum(axis=-1) / abs_targets.sum(axis=-1)
+    return {
+        "rmse": rmse,
+        "mape": mape,
+        "coverage": coverage,
+        "interval_width": interval_width,
+        "weighted_quantile_loss": quantile_weighted_losses.mean(axis=0),
+        "quantile_weighted_losses": quantile_weighted_losses,
+    }
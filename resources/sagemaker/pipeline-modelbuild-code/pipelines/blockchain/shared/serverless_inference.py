@@ -0,0 +1,184 @@
+"""Scores the DeepAR test inputs on a temporary serverless endpoint, in place of a Batch Transform.
+
+A Batch Transform job provisions an instance for minutes to score a few series. Below a number of
+series, the evaluation job deploys the model on a serverless endpoint instead, invokes it once per
+series and deletes it. The predictions are written in the format of the Batch Transform outputs, so
+that they are evaluated the same way.
+"""
+
+import hashlib
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Maximum length of a SageMaker endpoint name
+MAX_ENDPOINT_NAME_LENGTH = 63
+ENDPOINT_NAME_SUFFIX = "-eval"
+EVALUATION_MODEL_NAME_PREFIX = "deepar-evaluation"
+
+
+def evaluation_model_name(image_uri, model_data):
+    """Returns the name of the temporary model of the model artifacts. The name only depends on
+    the image and the artifacts, so that a retried evaluation finds the model, endpoint
+    configuration and endpoint left by an interrupted attempt, reuses them and deletes them.
+    """
+    key = hashlib.sha256(f"{image_uri}|{model_data}".encode("utf-8")).hexdigest()[:16]
+    return f"{EVALUATION_MODEL_NAME_PREFIX}-{key}"
+
+
+def create_evaluation_model(sm_client, image_uri, model_data, role):
+    """Creates the temporary model of the model artifacts, unless a previous attempt left it.
+
+    Args:
+        sm_client (botocore.client): the SageMaker client
+        image_uri (str): the URI of the inference image
+        model_data (str): the S3 URI of the model artifacts
+        role (str): the ARN of the execution role of the model
+
+    Returns:
+        str: the model name
+    """
+    model_name = evaluation_model_name(image_uri, model_data)
+    if describe_resource(sm_client, sm_client.describe_model, ModelName=model_name):
+        logger.info(f"The model {model_name} already exists.")
+        return model_name
+    logger.info(f"Creating the model {model_name} of the artifacts {model_data}.")
+    sm_client.create_model(
+        ModelName=model_name,
+        PrimaryContainer={"Image": image_uri, "ModelDataUrl": model_data},
+        ExecutionRoleArn=role,
+    )
+    return model_name
+
+
+def evaluation_endpoint_name(model_name):
+    """Returns the name of the temporary endpoint of a model, which is unique per model."""
+    prefix = model_name[: MAX_ENDPOINT_NAME_LENGTH - len(ENDPOINT_NAME_SUFFIX)].rstrip(
+        "-"
+    )
+    return f"{prefix}{ENDPOINT_NAME_SUFFIX}"
+
+
+def describe_resource(sm_client, describe, **kwargs):
+    """Returns the description of a SageMaker resource, None if it does not exist."""
+    try:
+        return describe(**kwargs)
+    except sm_client.exceptions.ClientError as e:
+        # SageMaker raises a validation error for the resources which do not exist
+        if "Could not find" in str(e):
+            return None
+        raise
+
+
+def predict_series(runtime_client, endpoint_name, series, inference_config):
+    """Forecasts a series of the DeepAR test inputs with a real-time request.
+
+    Args:
+        runtime_client (botocore.client): the SageMaker runtime client
+        endpoint_name (str): the endpoint name
+        series (dict): the DeepAR test input: start, target, cat and dynamic_feat
+        inference_config (dict): the DeepAR inference configuration, e.g. the quantiles
+
+    Returns:
+        dict: the prediction, with the same `mean` and `quantiles` as a Batch Transform output line
+    """
+    # See https://docs.aws.amazon.com/sagemaker/latest/dg/deepar-in-formats.html
+    response = runtime_client.invoke_endpoint(
+        EndpointName=endpoint_name,
+        ContentType="application/json",
+        Accept="application/json",
+        Body=json.dumps({"instances": [series], "configuration": inference_config}),
+    )
+    return json.loads(response["Body"].read())["predictions"][0]
+
+
+def serverless_transform(
+    sm_client,
+    runtime_client,
+    model_name,
+    test_inputs_file,
+    transform_outputs_file,
+    inference_config,
+    memory_size_in_mb=4096,
+):
+    """Deploys the model on a serverless endpoint, forecasts the test inputs and deletes the
+    endpoint.
+
+    The series are sent one request each, the real-time requests payloads being limited in size.
+    The endpoint configuration and the endpoint left by a previous attempt for the same model are
+    reused, e.g. when the evaluation job is retried.
+
+    Args:
+        sm_client (botocore.client): the SageMaker client
+        runtime_client (botocore.client): the SageMaker runtime client
+        model_name (str): the SageMaker model name
+        test_inputs_file (str): the JSON lines DeepAR test inputs, one line per series
+        transform_outputs_file (str): the JSON lines predictions written, one line per series
+        inference_config (dict): the DeepAR inference configuration, e.g. the quantiles
+        memory_size_in_mb (int): the memory of the serverless endpoint
+    """
+    endpoint_name = evaluation_endpoint_name(model_name)
+    logger.info(
+        f"Deploying the model {model_name} on the serverless endpoint {endpoint_name}."
+    )
+    if describe_resource(
+        sm_client, sm_client.describe_endpoint_config, EndpointConfigName=endpoint_name
+    ):
+        logger.info(f"The endpoint configuration {endpoint_name} already exists.")
+    else:
+        sm_client.create_endpoint_config(
+            EndpointConfigName=endpoint_name,
+            ProductionVariants=[
+                {
+                    "VariantName": "AllTraffic",
+                    "ModelName": model_name,
+                    "ServerlessConfig": {
+                        "MemorySizeInMB": memory_size_in_mb,
+                        "MaxConcurrency": 1,
+                    },
+                }
+            ],
+        )
+    try:
+        endpoint = describe_resource(
+            sm_client, sm_client.describe_endpoint, EndpointName=endpoint_name
+        )
+        if endpoint and endpoint["EndpointStatus"] == "Failed":
+            # A failed endpoint cannot be updated, it is created again
+            logger.info(f"Deleting the failed endpoint {endpoint_name}.")
+            sm_client.delete_endpoint(EndpointName=endpoint_name)
+            sm_client.get_waiter("endpoint_deleted").wait(EndpointName=endpoint_name)
+            endpoint = None
+        if endpoint:
+            logger.info(f"The endpoint {endpoint_name} already exists.")
+        else:
+            sm_client.create_endpoint(
+                EndpointName=endpoint_name, EndpointConfigName=endpoint_name
+            )
+        sm_client.get_waiter("endpoint_in_service").wait(EndpointName=endpoint_name)
+        logger.info("Forecasting the test inputs.")
+        with open(test_inputs_file) as f_in, open(transform_outputs_file, "w") as f_out:
+            for line in f_in:
+                if line.strip():
+                    prediction = predict_series(
+                        runtime_client,
+                        endpoint_name,
+                        json.loads(line),
+                        inference_config,
+                    )
+                    f_out.write(json.dumps(prediction) + "\n")
+    finally:
+        logger.info(f"Deleting the serverless endpoint {endpoint_name}.")
+        try:
+            sm_client.delete_endpoint(EndpointName=endpoint_name)
+        except sm_client.exceptions.ClientError as e:
+            logger.warning(
+                f"An error occurred deleting the endpoint {endpoint_name}: {e}"
+            )
+        try:
+            sm_client.delete_endpoint_config(EndpointConfigName=endpoint_name)
+        except sm_client.exceptions.ClientError as e:
+            logger.warning(
+                f"An error occurred deleting the endpoint configuration {endpoint_name}: {e}"
+            )
@@ -0,0 +1,165 @@
+"""Prepares the feature group records as regular time series for the DeepAR model."""
+
+import numpy as np
+import pandas as pd
+
+RECORD_IDENTIFIER = "tx_minute"
+
+
+def column_aggregation(column):
+    """Returns how the records of a column are aggregated within a period: the totals of the
+    Flink job (e.g. `total_fee_1min`) are summed, the other values (e.g. `avg_fee_1min`) averaged.
+    """
+    return "sum" if column.startswith("total_") else "mean"
+
+
+def resample_series(df, columns, freq, index_col=RECORD_IDENTIFIER, aggregations=None):
+    """Resamples the records to a regular frequency grid.
+
+    DeepAR infers the timestamp of every value from the series start and its frequency, so the
+    series must have exactly one value per period. Repeated timestamps are deduplicated (the last
+    record is kept), the missing periods (e.g. ingestion outages) are filled with NaN, which DeepAR
+    handles as missing values, and the records within a period are summed or averaged if the
+    frequency is coarser than the records. All the operations are vectorised.
+
+    Args:
+        df (pd.DataFrame): the records, with the timestamps in the `index_col` column
+        columns (list[str]): the columns to resample
+        freq (str): the pandas frequency of the series, e.g. "1min"
+        index_col (str): the timestamps column
+        aggregations (dict[str, str]): the "sum" or "mean" aggregation of the columns within a
+            period. Defaults to `column_aggregation`
+
+    Returns:
+        pd.DataFrame: the resampled columns indexed by the start of each period
+    """
+    aggregations = aggregations or {}
+    index = pd.DatetimeIndex(pd.to_datetime(df[index_col]), name=index_col)
+    series = df[list(columns)].set_axis(index)
+    series = series.sort_index(kind="stable")
+    series = series[~series.index.duplicated(keep="last")]
+    if series.empty:
+        return series
+    resampler = series.resample(freq)
+    # The sum of a period without records is NaN, like its mean
+    return pd.DataFrame(
+        {
+            column: (
+                resampler[column].sum(min_count=1)
+                if aggregations.get(column, column_aggregation(column)) == "sum"
+                else resampler[column].mean()
+            )
+            for column in series.columns
+        }
+    )
+
+
+# Features computed from the timestamps of the series, scaled to [-0.5, 0.5]. As they are known in
+# the future, they can be passed to DeepAR as dynamic features over the prediction horizon
+CALENDAR_FEATURES = {
+    "hour_of_day": lambda index: index.hour / 23.0 - 0.5,
+    "day_of_week": lambda index: index.dayofweek / 6.0 - 0.5,
+}
+
+
+def parse_list(value):
+    """Parses a comma separated list of a SSM parameter or script argument. "none" is an empty
+    list, as SSM parameters can not be empty.
+    """
+    if value is None or value.strip().lower() == "none":
+        return []
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def series_name(column, window):
+    """Returns the name of the series of a column averaged over a hopping window of `window`
+    periods. The series of a single period is the column itself.
+    """
+    return column if window == 1 else f"{column}_hop{window}"
+
+
+def series_layout(target_col, series_cols=(), series_windows=(1,)):
+    """Lists the series of the DeepAR model as (column, window) tuples, one per column and hopping
+    window. The index of a series is its category, the first one being the target column over a
+    single period, which is the series monitored and evaluated.
+
+    Args:
+        target_col (str): the predicted column
+        series_cols (list[str]): the other aggregated columns modelled as series
+        series_windows (list[int]): the sizes of the hopping windows, in number of periods
+
+    Returns:
+        list[tuple[str, int]]: the column and window of each series
+    """
+    columns = [target_col] + [c for c in series_cols if c != target_col]
+    windows = [1] + sorted({int(w) for w in series_windows} - {1})
+    return [(column, window) for column in columns for window in windows]
+
+
+def hopping_window_series(df, layout):
+    """Computes the series of the layout from the resampled records. The windows hop by one period,
+    so that all the series have the frequency of the records and can be trained together.
+
+    Args:
+        df (pd.DataFrame): the resampled records, with one column per column of the layout
+        layout (list[tuple[str, int]]): the series, see `series_layout`
+
+    Returns:
+        pd.DataFrame: one column per series, named by `series_name`, in the order of the layout
+    """
+    return pd.DataFrame(
+        {
+            series_name(column, window): (
+                df[column]
+                if window == 1
+                else df[column].rolling(window, min_periods=1).mean()
+            )
+            for column, window in layout
+        },
+        index=df.index,
+    )
+
+
+def calendar_features(index, features):
+    """Computes the calendar features of the timestamps.
+
+    Args:
+        index (pd.DatetimeIndex): the timestamps, which must cover the prediction horizon when
+            the features are sent for inference
+        features (list[str]): the names of the features, keys of `CALENDAR_FEATURES`
+
+    Returns:
+        list[np.ndarray]: one array per feature
+    """
+    return [np.asarray(CALENDAR_FEATURES[f](index), dtype=float) for f in features]
+
+
+def target_series_inputs(target_parameters, index, prediction_length):
+    """Returns the category and dynamic features sent with the target series for inference, as
+    configured by the model target parameters the model was trained with.
+
+    Args:
+        target_parameters (dict[str, str]): the model target SSM parameters
+        index (pd.DatetimeIndex): the timestamps of the target series sent for inference
+        prediction_length (int): the number of periods predicted
+
+    Returns:
+        tuple[list[int], list[list[float]]]: the category and dynamic features, None if the
+            model is not trained with them
+    """
+    layout = series_layout(
+        target_parameters["target_col"],
+        parse_list(target_parameters.get("series_cols", "none")),
+        parse_list(target_parameters.get("series_windows", "1")),
+    )
+    features = parse_list(target_parameters.get("dynamic_features", "none"))
+    cat = [0] if len(layout) > 1 else None
+    dynamic_feat = None
+    if features:
+        horizon_index = pd.date_range(
+            index[0],
+            periods=len(index) + prediction_length,
+            freq=target_parameters["freq"],
+        )
+        dynamic_feat = [f.tolist() for f in calendar_features(horizon_index, features)]
+    return cat, dynamic_feat
@@ -0,0 +1,69 @@
+"""Stores the hyperparameters of the best training job of the hyperparameter tuning on the
+registered model package, as customer metadata properties. Once the model package is approved, the
+next pipeline executions train with them in place of the training hyperparameters SSM parameters.
+The SSM parameters, deployed by the CDK stack, are not changed."""
+
+import sys
+
+# The shared modules are mounted by the pipeline next to the code of the script
+sys.path.insert(0, "/opt/ml/processing/input/shared")
+from dependencies import install_missing  # noqa: E402
+
+# The dependencies are in the processing image, they are only installed on other images
+install_missing(["boto3"])
+import logging  # noqa: E402
+import argparse  # noqa: E402
+import boto3  # noqa: E402
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler())
+
+
+def best_hyperparameters(sm_client, tuning_job_name):
+    """Returns the tuned hyperparameters of the best training job of a tuning job.
+
+    Args:
+        sm_client (botocore.client): the SageMaker client
+        tuning_job_name (str): the hyperparameter tuning job name
+
+    Returns:
+        dict[str, str]: the tuned hyperparameters
+    """
+    response = sm_client.describe_hyper_parameter_tuning_job(
+        HyperParameterTuningJobName=tuning_job_name
+    )
+    best_training_job = response["BestTrainingJob"]
+    objective = best_training_job["FinalHyperParameterTuningJobObjectiveMetric"]
+    logger.info(
+        f"Best training job is {best_training_job['TrainingJobName']} with "
+        f"{objective['MetricName']} {objective['Value']}."
+    )
+    # The categorical values may be JSON encoded
+    return {
+        name: value.strip('"')
+        for name, value in best_training_job["TunedHyperParameters"].items()
+    }
+
+
+if __name__ == "__main__":
+    logger.info("Starting the storage of the tuned hyperparameters.")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tuning-job-name", type=str, required=True)
+    parser.add_argument("--model-package-arn", type=str, required=True)
+    parser.add_argument("--metadata-prefix", type=str, default="tuned_")
+    args = parser.parse_args()
+
+    sm_client = boto3.client("sagemaker")
+    hyperparameters = best_hyperparameters(sm_client, args.tuning_job_name)
+    # The other customer metadata properties of the model package are kept
+    sm_client.update_model_package(
+        ModelPackageArn=args.model_package_arn,
+        CustomerMetadataProperties={
+            f"{args.metadata_prefix}{name}": value
+            for name, value in hyperparameters.items()
+        },
+    )
+    for name, value in hyperparameters.items():
+        logger.info(f"Stored the tuned hyperparameter {name} = {value}.")
+    logger.info(f"The tuned hyperparameters are stored on {args.model_package_arn}.")
@@ -0,0 +1,71 @@
+import gzip
+import io
+import json
+
+import numpy as np
+
+from pipelines.blockchain.shared import deepar_dataset
+from pipelines.blockchain.shared.deepar_dataset import (
+    backtest_windows,
+    columns_to_series,
+    write_array,
+    write_dataset,
+)
+
+
+def test_write_array_writes_nan_as_null():
+    fp = io.StringIO()
+    write_array(fp, [1.5, np.nan, -2.0, np.inf])
+    assert json.loads(fp.getvalue()) == [1.5, None, -2.0, None]
+
+
+def test_write_array_chunks(monkeypatch):
+    monkeypatch.setattr(deepar_dataset, "CHUNK_SIZE", 3)
+    values = np.arange(8, dtype=float)
+    values[4] = np.nan
+    fp = io.StringIO()
+    write_array(fp, values)
+    assert json.loads(fp.getvalue()) == [0, 1, 2, 3, None, 5, 6, 7]
+    fp = io.StringIO()
+    write_array(fp, [])
+    assert fp.getvalue() == "[]"
+
+
+def test_backtest_windows_are_views():
+    values = np.arange(10, dtype=float)
+    windows = backtest_windows(values, 3, 2)
+    assert [len(w) for w in windows] == [6, 8, 10]
+    assert all(np.shares_memory(w, values) for w in windows)
+
+
+def test_write_dataset(tmp_path):
+    values = np.array([[1.0, 10.0], [np.nan, 20.0], [3.0, 30.0]])
+    dynamic_feat = [np.arange(5, dtype=float)]
+    path = str(tmp_path / "test.json.gz")
+    write_dataset(
+        path,
+        columns_to_series(values, "2024-06-20 08:00:00", dynamic_feat, horizon=1),
+        compression="gzip",
+    )
+    with gzip.open(path, "rt") as f:
+        series = [json.loads(line) for line in f]
+    assert series == [
+        {
+            "start": "2024-06-20 08:00:00",
+            "target": [1.0, None, 3.0],
+            "cat": [0],
+            "dynamic_feat": [[0.0, 1.0, 2.0, 3.0]],
+        },
+        {
+            "start": "2024-06-20 08:00:00",
+            "target": [10.0, 20.0, 30.0],
+            "cat": [1],
+            "dynamic_feat": [[0.0, 1.0, 2.0, 3.0]],
+        },
+    ]
+
+
+def test_single_series_has_no_category():
+    series = list(columns_to_series(np.ones((3, 1)), "2024-06-20 08:00:00"))
+    assert len(series) == 1
+    assert "cat" not in series[0] and "dynamic_feat" not in series[0]
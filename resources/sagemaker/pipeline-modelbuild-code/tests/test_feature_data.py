@@ -0,0 +1,191 @@
+import pandas as pd
+import pytest
+
+from pipelines.blockchain.shared.feature_data import (
+    build_latest_records_query,
+    merge_snapshot,
+    query_high_water_mark,
+    unload_to_dataframe,
+)
+
+
+class FakeAthenaQuery:
+    table_name = "feature-group-table"
+
+    def __init__(self):
+        self.queries = []
+
+    def run(self, query_string, output_location):
+        self.queries.append((query_string, output_location))
+
+    def wait(self):
+        pass
+
+
+class FakeFeatureGroup:
+    def __init__(self, athena_query):
+        self._athena_query = athena_query
+
+    def athena_query(self):
+        return self._athena_query
+
+
+class FakeS3Client:
+    """Serves the pages of an S3 listing and downloads the dataframes of the listed keys as
+    Parquet files."""
+
+    def __init__(self, pages, dataframes=None):
+        self.pages = pages
+        self.dataframes = dataframes or {}
+        self.listed_prefixes = []
+
+    def get_paginator(self, operation_name):
+        client = self
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix):
+                client.listed_prefixes.append((Bucket, Prefix))
+                return iter(client.pages)
+
+        return Paginator()
+
+    def download_file(self, bucket, key, filename):
+        self.dataframes[key].to_parquet(filename, index=False)
+
+
+def records(rows, deleted=None):
+    df = pd.DataFrame(
+        rows, columns=["tx_minute", "event_time", "total_fee_1min", "write_time"]
+    )
+    df["write_time"] = pd.to_datetime(df["write_time"])
+    if deleted is not None:
+        df["is_deleted"] = deleted
+    return df
+
+
+def test_build_latest_records_query_written_since():
+    query = build_latest_records_query(
+        "table",
+        ["total_fee_1min"],
+        written_since="2024-06-20 08:00:00.000",
+        with_deleted=True,
+    )
+    assert "WHERE write_time > timestamp '2024-06-20 08:00:00.000'" in query
+    assert query.startswith(
+        'SELECT "tx_minute", "event_time", "total_fee_1min", write_time, is_deleted FROM ('
+    )
+    assert query.endswith("WHERE version_rank = 1")
+    assert build_latest_records_query("table", ["total_fee_1min"]).endswith(
+        "WHERE version_rank = 1 AND NOT is_deleted"
+    )
+
+
+def test_build_latest_records_query():
+    query = build_latest_records_query(
+        "table", ["total_fee_1min"], since="2024-06-20 08:00:00"
+    )
+    assert query == (
+        'SELECT "tx_minute", "event_time", "total_fee_1min" FROM ('
+        'SELECT "tx_minute", "event_time", "total_fee_1min", write_time, is_deleted, '
+        'row_number() OVER (PARTITION BY "tx_minute" '
+        'ORDER BY "event_time" DESC, write_time DESC, api_invocation_time DESC'
+        ') AS version_rank FROM "table" WHERE "tx_minute" > \'2024-06-20 08:00:00\''
+        ") WHERE version_rank = 1 AND NOT is_deleted"
+    )
+    assert 'FROM "table" )' in build_latest_records_query("table", [])
+
+
+def test_unload_to_dataframe():
+    pytest.importorskip("pyarrow")
+    athena_query = FakeAthenaQuery()
+    pages = [
+        {"Contents": [{"Key": "results/unload/part-0"}]},
+        {"Contents": [{"Key": "results/unload/part-1"}]},
+    ]
+    s3_client = FakeS3Client(
+        pages,
+        {
+            "results/unload/part-0": pd.DataFrame(
+                {"tx_minute": ["2024-06-20 08:00:00"]}
+            ),
+            "results/unload/part-1": pd.DataFrame(
+                {"tx_minute": ["2024-06-20 08:01:00"]}
+            ),
+        },
+    )
+    df = unload_to_dataframe(
+        athena_query, "SELECT 1", "s3://bucket/results/", s3_client
+    )
+    assert sorted(df["tx_minute"]) == ["2024-06-20 08:00:00", "2024-06-20 08:01:00"]
+    query_string, output_location = athena_query.queries[0]
+    assert output_location == "s3://bucket/results/"
+    unload_path = query_string.split("'")[1]
+    assert query_string == (
+        f"UNLOAD (SELECT 1) TO '{unload_path}' WITH (format = 'PARQUET')"
+    )
+    # Each query unloads to a new folder
+    assert unload_path.startswith("s3://bucket/results/unload-")
+    assert s3_client.listed_prefixes == [("bucket", unload_path[len("s3://bucket/") :])]
+
+
+def test_unload_to_dataframe_without_results():
+    s3_client = FakeS3Client([{"KeyCount": 0}])
+    df = unload_to_dataframe(
+        FakeAthenaQuery(), "SELECT 1", "s3://bucket/results", s3_client
+    )
+    assert df.empty
+
+
+def test_query_high_water_mark_without_records():
+    athena_query = FakeAthenaQuery()
+    high_water_mark = query_high_water_mark(
+        FakeFeatureGroup(athena_query), "s3://bucket/results", FakeS3Client([{}])
+    )
+    assert high_water_mark is None
+    assert 'max("tx_minute")' in athena_query.queries[0][0]
+    assert athena_query.queries[0][0].startswith("UNLOAD (")
+
+
+def test_merge_snapshot():
+    snapshot = records(
+        [
+            ["2024-06-20 08:00:00", 1.0, 10, "2024-06-20 08:01:00"],
+            ["2024-06-20 08:01:00", 1.0, 20, "2024-06-20 08:02:00"],
+            ["2024-06-20 08:02:00", 1.0, 30, "2024-06-20 08:03:00"],
+        ]
+    )
+    # A rewrite and a delete of older minutes, and a new minute
+    new_records = records(
+        [
+            ["2024-06-20 08:00:00", 2.0, 11, "2024-06-21 00:00:00"],
+            ["2024-06-20 08:01:00", 2.0, None, "2024-06-21 00:00:00"],
+            ["2024-06-20 08:03:00", 1.0, 40, "2024-06-21 00:00:00"],
+        ],
+        deleted=[False, True, False],
+    )
+    df = merge_snapshot(snapshot, new_records)
+    assert list(df.columns) == [
+        "tx_minute",
+        "event_time",
+        "total_fee_1min",
+        "write_time",
+    ]
+    assert df["tx_minute"].tolist() == [
+        "2024-06-20 08:00:00",
+        "2024-06-20 08:02:00",
+        "2024-06-20 08:03:00",
+    ]
+    assert df["total_fee_1min"].tolist() == [11, 30, 40]
+
+
+def test_merge_snapshot_without_snapshot():
+    new_records = records(
+        [
+            ["2024-06-20 08:00:00", 1.0, 10, "2024-06-20 08:01:00"],
+            ["2024-06-20 08:01:00", 1.0, 20, "2024-06-20 08:02:00"],
+        ],
+        deleted=[False, True],
+    )
+    df = merge_snapshot(None, new_records)
+    assert df["tx_minute"].tolist() == ["2024-06-20 08:00:00"]
+    assert "is_deleted" not in df.columns
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from pipelines.blockchain.shared.forecast_metrics import forecast_metrics, quantile_loss
+
+QUANTILES = [0.1, 0.5, 0.9]
+
+
+def loop_metrics(targets, mean_predictions, quantile_predictions, quantiles):
+    """Reference implementation, one window and one quantile at a time."""
+    observed = np.isfinite(targets)
+    x = targets[observed]
+    mean = mean_predictions[observed]
+    low = quantile_predictions[0][observed]
+    up = quantile_predictions[-1][observed]
+    losses = []
+    for alpha, predictions in zip(quantiles, quantile_predictions):
+        q = predictions[observed]
+        ql = np.where(x > q, alpha * (x - q), (1 - alpha) * (q - x))
+        losses.append(2 * ql.sum() / np.abs(x).sum())
+    non_zero = x != 0
+    return {
+        "rmse": np.sqrt(((mean - x) ** 2).mean()),
+        "mape": (np.abs(mean - x)[non_zero] / np.abs(x[non_zero])).mean(),
+        "coverage": ((low <= x) & (x <= up)).mean(),
+        "interval_width": (up - low).mean(),
+        "weighted_quantile_loss": np.mean(losses),
+    }
+
+
+@pytest.fixture
+def forecasts():
+    rng = np.random.default_rng(0)
+    targets = rng.gamma(2.0, 2.0, size=(4, 12))
+    targets[1, 3] = np.nan
+    targets[2, :4] = np.nan
+    mean_predictions = targets + rng.normal(0, 1, size=targets.shape)
+    quantile_predictions = np.stack(
+        [np.nan_to_num(mean_predictions) + z for z in (-1.28, 0.0, 1.28)]
+    )
+    return targets, mean_predictions, quantile_predictions
+
+
+def test_quantile_loss():
+    losses = quantile_loss([0.1, 0.9], [[2.0, 2.0], [2.0, 2.0]], [1.0, 3.0])
+    np.testing.assert_allclose(losses, [[0.9, 0.1], [0.1, 0.9]])
+
+
+def test_forecast_metrics_matches_loop(forecasts):
+    targets, mean_predictions, quantile_predictions = forecasts
+    metrics = forecast_metrics(
+        targets, mean_predictions, quantile_predictions, QUANTILES
+    )
+    assert metrics["quantile_weighted_losses"].shape == (len(QUANTILES), len(targets))
+    for window in range(len(targets)):
+        expected = loop_metrics(
+            targets[window],
+            mean_predictions[window],
+            quantile_predictions[:, window],
+            QUANTILES,
+        )
+        for name, value in expected.items():
+            assert metrics[name][window] == pytest.approx(value), name
+
+
+def test_forecast_metrics_single_window(forecasts):
+    targets, mean_predictions, quantile_predictions = forecasts
+    metrics = forecast_metrics(
+        targets[0], mean_predictions[0], quantile_predictions[:, 0], QUANTILES
+    )
+    assert np.ndim(metrics["rmse"]) == 0
+    assert float(metrics["weighted_quantile_loss"]) == pytest.approx(
+        loop_metrics(
+            targets[0], mean_predictions[0], quantile_predictions[:, 0], QUANTILES
+        )["weighted_quantile_loss"]
+    )
+
+
+def test_forecast_metrics_without_targets():
+    targets = np.full((2, 3), np.nan)
+    targets[1] = [1.0, 2.0, 3.0]
+    predictions = np.ones((2, 3))
+    metrics = forecast_metrics(
+        targets, predictions, np.stack([predictions] * 3), QUANTILES
+    )
+    assert np.isnan(metrics["rmse"][0]) and np.isnan(
+        metrics["weighted_quantile_loss"][0]
+    )
+    assert np.isfinite(metrics["rmse"][1]) and np.isfinite(
+        metrics["weighted_quantile_loss"][1]
+    )
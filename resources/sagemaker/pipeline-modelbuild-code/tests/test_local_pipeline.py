@@ -0,0 +1,41 @@
+import json
+
+import pytest
+
+from pipelines.blockchain.local_pipeline import (
+    MODEL_BUILD_PARAMS_FILE,
+    make_feature_records,
+    run_local_pipeline,
+    stub_forecast,
+)
+
+
+@pytest.fixture
+def feature_records():
+    return make_feature_records(periods=24 * 60)
+
+
+def test_make_feature_records(feature_records):
+    assert feature_records["tx_minute"].duplicated().any()
+    assert feature_records["tx_minute"].nunique() < 24 * 60
+
+
+def test_stub_forecast():
+    forecast = stub_forecast([1.0, "NaN", 3.0, None], 2, [0.1, 0.5, 0.9])
+    assert forecast["mean"] == [2.0, 2.0]
+    assert forecast["quantiles"]["0.5"] == pytest.approx([2.0, 2.0])
+    assert forecast["quantiles"]["0.1"][0] < 2.0 < forecast["quantiles"]["0.9"][0]
+
+
+def test_run_local_pipeline(feature_records, tmp_path):
+    # The processing scripts need the dependencies of the processing image
+    for package in ["boto3", "sagemaker", "pyarrow"]:
+        pytest.importorskip(package)
+    records_file = str(tmp_path / "records.csv")
+    feature_records.to_csv(records_file, index=False)
+    with open(MODEL_BUILD_PARAMS_FILE) as f:
+        params = json.load(f)
+    result = run_local_pipeline(records_file, str(tmp_path), params)
+    assert set(result["steps"]) == {"PreprocessData", "Transform", "EvaluateModel"}
+    assert result["evaluation"]["deepar_metrics"]["weighted_quantile_loss"]["value"] > 0
+    assert (tmp_path / "data" / "train" / "train.json.gz").exists()
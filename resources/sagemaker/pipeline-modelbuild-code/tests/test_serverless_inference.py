@@ -0,0 +1,301 @@
+import io
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from pipelines.blockchain.shared.serverless_inference import (
+    MAX_ENDPOINT_NAME_LENGTH,
+    create_evaluation_model,
+    evaluation_endpoint_name,
+    evaluation_model_name,
+    serverless_transform,
+)
+
+
+class ClientError(Exception):
+    pass
+
+
+class FakeSageMakerClient:
+    """Records the calls. The models, endpoint configurations and endpoints passed exist, the
+    endpoints with their status. The deletions fail with `delete_error`."""
+
+    exceptions = SimpleNamespace(ClientError=ClientError)
+
+    def __init__(self, models=(), endpoint_configs=(), endpoints=(), delete_error=None):
+        self.calls = []
+        self.models = set(models)
+        self.endpoint_configs = set(endpoint_configs)
+        if not isinstance(endpoints, dict):
+            endpoints = dict.fromkeys(endpoints, "InService")
+        self.endpoints = dict(endpoints)
+        self.delete_error = delete_error
+
+    def describe_model(self, ModelName):
+        if ModelName not in self.models:
+            raise ClientError(f"Could not find model {ModelName}.")
+        return {"ModelName": ModelName}
+
+    def describe_endpoint_config(self, EndpointConfigName):
+        if EndpointConfigName not in self.endpoint_configs:
+            raise ClientError(
+                f"Could not find endpoint configuration {EndpointConfigName}."
+            )
+        return {"EndpointConfigName": EndpointConfigName}
+
+    def describe_endpoint(self, EndpointName):
+        if EndpointName not in self.endpoints:
+            raise ClientError(f"Could not find endpoint {EndpointName}.")
+        return {
+            "EndpointName": EndpointName,
+            "EndpointStatus": self.endpoints[EndpointName],
+        }
+
+    def create_model(self, **kwargs):
+        self.calls.append(("create_model", kwargs))
+
+    def create_endpoint_config(self, **kwargs):
+        self.calls.append(("create_endpoint_config", kwargs))
+
+    def create_endpoint(self, **kwargs):
+        self.calls.append(("create_endpoint", kwargs))
+
+    def get_waiter(self, name):
+        client = self
+
+        class Waiter:
+            def wait(self, **kwargs):
+                client.calls.append((name, kwargs))
+
+        return Waiter()
+
+    def delete_endpoint(self, **kwargs):
+        self.calls.append(("delete_endpoint", kwargs))
+        if self.delete_error:
+            raise ClientError(self.delete_error)
+
+    def delete_endpoint_config(self, **kwargs):
+        self.calls.append(("delete_endpoint_config", kwargs))
+        if self.delete_error:
+            raise ClientError(self.delete_error)
+
+
+class FakeRuntimeClient:
+    def __init__(self, fail=False):
+        self.fail = fail
+
+    def invoke_endpoint(self, Body, **kwargs):
+        if self.fail:
+            raise RuntimeError("invocation error")
+        request = json.loads(Body)
+        target = request["instances"][0]["target"]
+        prediction = {
+            "mean": [target[-1]],
+            "quantiles": {
+                q: [target[-1]] for q in request["configuration"]["quantiles"]
+            },
+        }
+        return {"Body": io.BytesIO(json.dumps({"predictions": [prediction]}).encode())}
+
+
+@pytest.fixture
+def test_inputs_file(tmp_path):
+    path = tmp_path / "test-inputs.json"
+    path.write_text(
+        "\n".join(
+            json.dumps(
+                {"start": "2024-06-20 00:00:00", "target": [1.0, value], "cat": [i]}
+            )
+            for i, value in enumerate([2.0, 3.0])
+        )
+        + "\n"
+    )
+    return str(path)
+
+
+def test_evaluation_endpoint_name():
+    name = evaluation_endpoint_name("pipelines-" + "a" * 46 + "-CreateModel-abc")
+    assert len(name) <= MAX_ENDPOINT_NAME_LENGTH
+    assert name.endswith("-eval") and "--" not in name
+
+
+def test_create_evaluation_model():
+    sm_client = FakeSageMakerClient()
+    model_name = create_evaluation_model(
+        sm_client, "deepar-image", "s3://bucket/model.tar.gz", "role-arn"
+    )
+    assert model_name.startswith("deepar-evaluation-")
+    assert len(evaluation_endpoint_name(model_name)) <= MAX_ENDPOINT_NAME_LENGTH
+    # The name is derived from the model, so that a retry finds the resources of an attempt
+    assert model_name == evaluation_model_name(
+        "deepar-image", "s3://bucket/model.tar.gz"
+    )
+    assert model_name != evaluation_model_name(
+        "deepar-image", "s3://bucket/other/model.tar.gz"
+    )
+    assert sm_client.calls == [
+        (
+            "create_model",
+            {
+                "ModelName": model_name,
+                "PrimaryContainer": {
+                    "Image": "deepar-image",
+                    "ModelDataUrl": "s3://bucket/model.tar.gz",
+                },
+                "ExecutionRoleArn": "role-arn",
+            },
+        )
+    ]
+
+
+def test_serverless_transform(test_inputs_file, tmp_path):
+    sm_client = FakeSageMakerClient()
+    outputs_file = str(tmp_path / "test-inputs.json.out")
+    serverless_transform(
+        sm_client,
+        FakeRuntimeClient(),
+        "model",
+        test_inputs_file,
+        outputs_file,
+        {"quantiles": ["0.1", "0.5", "0.9"]},
+    )
+    with open(outputs_file) as f:
+        predictions = [json.loads(line) for line in f]
+    assert [p["mean"] for p in predictions] == [[2.0], [3.0]]
+    assert predictions[0]["quantiles"]["0.9"] == [2.0]
+    assert [call for call, _ in sm_client.calls][-2:] == [
+        "delete_endpoint",
+        "delete_endpoint_config",
+    ]
+
+
+def test_serverless_transform_deletes_endpoint_on_error(test_inputs_file, tmp_path):
+    sm_client = FakeSageMakerClient()
+    with pytest.raises(RuntimeError):
+        serverless_transform(
+            sm_client,
+            FakeRuntimeClient(fail=True),
+            "model",
+            test_inputs_file,
+            str(tmp_path / "test-inputs.json.out"),
+            {"quantiles": ["0.5"]},
+        )
+    assert ("delete_endpoint", {"EndpointName": "model-eval"}) in sm_client.calls
+
+
+def test_serverless_transform_reuses_existing_endpoint(test_inputs_file, tmp_path):
+    sm_client = FakeSageMakerClient(
+        endpoint_configs=["model-eval"], endpoints=["model-eval"]
+    )
+    serverless_transform(
+        sm_client,
+        FakeRuntimeClient(),
+        "model",
+        test_inputs_file,
+        str(tmp_path / "test-inputs.json.out"),
+        {"quantiles": ["0.5"]},
+    )
+    calls = [call for call, _ in sm_client.calls]
+    assert "create_endpoint_config" not in calls and "create_endpoint" not in calls
+    assert calls[-2:] == ["delete_endpoint", "delete_endpoint_config"]
+
+
+def test_serverless_transform_creates_missing_endpoint(test_inputs_file, tmp_path):
+    # The endpoint configuration of a previous attempt is reused, the endpoint is created
+    sm_client = FakeSageMakerClient(endpoint_configs=["model-eval"])
+    serverless_transform(
+        sm_client,
+        FakeRuntimeClient(),
+        "model",
+        test_inputs_file,
+        str(tmp_path / "test-inputs.json.out"),
+        {"quantiles": ["0.5"]},
+    )
+    calls = [call for call, _ in sm_client.calls]
+    assert "create_endpoint_config" not in calls
+    assert (
+        "create_endpoint",
+        {"EndpointName": "model-eval", "EndpointConfigName": "model-eval"},
+    ) in sm_client.calls
+
+
+def test_serverless_transform_ignores_deletion_errors(test_inputs_file, tmp_path):
+    # A failed deletion does not hide the predictions, nor the error of the forecasts
+    sm_client = FakeSageMakerClient(delete_error="Could not find endpoint")
+    serverless_transform(
+        sm_client,
+        FakeRuntimeClient(),
+        "model",
+        test_inputs_file,
+        str(tmp_path / "test-inputs.json.out"),
+        {"quantiles": ["0.5"]},
+    )
+    with pytest.raises(RuntimeError):
+        serverless_transform(
+            sm_client,
+            FakeRuntimeClient(fail=True),
+            "model",
+            test_inputs_file,
+            str(tmp_path / "test-inputs.json.out"),
+            {"quantiles": ["0.5"]},
+        )
+
+
+def test_create_evaluation_model_reuses_existing_model():
+    model_name = evaluation_model_name("deepar-image", "s3://bucket/model.tar.gz")
+    sm_client = FakeSageMakerClient(models=[model_name])
+    assert (
+        create_evaluation_model(
+            sm_client, "deepar-image", "s3://bucket/model.tar.gz", "role-arn"
+        )
+        == model_name
+    )
+    assert sm_client.calls == []
+
+
+def test_retried_evaluation_deletes_the_leftover_endpoint(test_inputs_file, tmp_path):
+    # An attempt killed while forecasting left its model, configuration and endpoint
+    model_name = evaluation_model_name("deepar-image", "s3://bucket/model.tar.gz")
+    endpoint_name = evaluation_endpoint_name(model_name)
+    sm_client = FakeSageMakerClient(
+        models=[model_name],
+        endpoint_configs=[endpoint_name],
+        endpoints=[endpoint_name],
+    )
+    serverless_transform(
+        sm_client,
+        FakeRuntimeClient(),
+        create_evaluation_model(
+            sm_client, "deepar-image", "s3://bucket/model.tar.gz", "role-arn"
+        ),
+        test_inputs_file,
+        str(tmp_path / "test-inputs.json.out"),
+        {"quantiles": ["0.5"]},
+    )
+    assert [call for call, _ in sm_client.calls] == [
+        "endpoint_in_service",
+        "delete_endpoint",
+        "delete_endpoint_config",
+    ]
+    assert sm_client.calls[-1][1] == {"EndpointConfigName": endpoint_name}
+
+
+def test_serverless_transform_recreates_failed_endpoint(test_inputs_file, tmp_path):
+    sm_client = FakeSageMakerClient(
+        endpoint_configs=["model-eval"], endpoints={"model-eval": "Failed"}
+    )
+    serverless_transform(
+        sm_client,
+        FakeRuntimeClient(),
+        "model",
+        test_inputs_file,
+        str(tmp_path / "test-inputs.json.out"),
+        {"quantiles": ["0.5"]},
+    )
+    assert [call for call, _ in sm_client.calls][:4] == [
+        "delete_endpoint",
+        "endpoint_deleted",
+        "create_endpoint",
+        "endpoint_in_service",
+    ]
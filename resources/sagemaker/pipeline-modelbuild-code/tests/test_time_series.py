@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+
+from pipelines.blockchain.shared.time_series import resample_series
+
+
+def records():
+    # Two records in the first 5 minutes, a repeated timestamp, none in the second 5 minutes
+    return pd.DataFrame(
+        {
+            "tx_minute": [
+                "2024-06-20 08:00:00",
+                "2024-06-20 08:01:00",
+                "2024-06-20 08:01:00",
+                "2024-06-20 08:10:00",
+            ],
+            "total_fee_1min": [10.0, 0.0, 20.0, 40.0],
+            "avg_fee_1min": [1.0, 0.0, 3.0, 4.0],
+        }
+    )
+
+
+def test_resample_series_sums_the_totals_and_averages_the_other_values():
+    df = resample_series(records(), ["total_fee_1min", "avg_fee_1min"], "5min")
+    assert df.index.tolist() == list(
+        pd.date_range("2024-06-20 08:00:00", periods=3, freq="5min")
+    )
+    np.testing.assert_array_equal(df["total_fee_1min"], [30.0, np.nan, 40.0])
+    np.testing.assert_array_equal(df["avg_fee_1min"], [2.0, np.nan, 4.0])
+
+
+def test_resample_series_aggregations():
+    df = resample_series(
+        records(), ["total_fee_1min"], "5min", aggregations={"total_fee_1min": "mean"}
+    )
+    np.testing.assert_array_equal(df["total_fee_1min"], [15.0, np.nan, 40.0])
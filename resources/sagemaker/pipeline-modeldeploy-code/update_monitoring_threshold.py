@@ -1,6 +1,7 @@
 import argparse
 import json
 import logging
+from datetime import datetime, timedelta, timezone
 import boto3
 from botocore.exceptions import ClientError
 from utils import get_latest_approved_package
@@ -10,6 +11,10 @@ logging.basicConfig(encoding='utf-8', level=logging.INFO)
 sm_client = boto3.client("sagemaker")
 s3_client = boto3.client("s3")
 ssm_client = boto3.client("ssm")
+cw_client = boto3.client("cloudwatch")
+
+# Number of days of the monitoring backtests used to estimate the dispersion of the metric
+DISPERSION_LOOKBACK_DAYS = 7
 
 
 def get_ssm_parameters(param_path: str) -> dict[str, str]:
@@ -34,7 +39,48 @@ def get_ssm_parameters(param_path: str) -> dict[str, str]:
     return parameters
 
 
-def update_model_threshold(model_package_group_name: str, model_pipeline_name: str, bucket: str) -> None:
+def get_weighted_quantile_loss_dispersion(stage_name: str) -> float:
+    """Returns the average standard deviation of the weighted quantile loss across the backtest
+    origins of the custom monitoring job over the last days, 0 if it has not run.
+
+    The statistics are queried per day, CloudWatch aligning the periods on their start, and
+    the average is computed over all the samples of the days of the window.
+    The errors reading the metric, e.g. a missing permission, are raised.
+
+    Args:
+        stage_name (str): the stage of the endpoint monitored
+
+    Returns:
+        float: the standard deviation
+    """
+    end_time = datetime.now(timezone.utc)
+    response = cw_client.get_metric_statistics(
+        Namespace="CustomModelMonitoring",
+        MetricName="weighted_quantile_loss_std",
+        Dimensions=[{"Name": "StageName", "Value": stage_name}],
+        StartTime=end_time - timedelta(days=DISPERSION_LOOKBACK_DAYS),
+        EndTime=end_time,
+        Period=24 * 3600,
+        Statistics=["Sum", "SampleCount"],
+    )
+    datapoints = response["Datapoints"]
+    sample_count = sum(datapoint["SampleCount"] for datapoint in datapoints)
+    if not sample_count:
+        logger.warning(
+            f"No weighted quantile loss dispersion of the {stage_name} monitoring in the last "
+            f"{DISPERSION_LOOKBACK_DAYS} days, the threshold is not bounded by the dispersion."
+        )
+        return 0.0
+    logger.info(
+        f"Weighted quantile loss dispersion of the {stage_name} monitoring averaged over "
+        f"{int(sample_count)} samples in {len(datapoints)} days."
+    )
+    return sum(datapoint["Sum"] for datapoint in datapoints) / sample_count
+
+
+def update_model_threshold(
+    model_package_group_name: str, model_pipeline_name: str, bucket: str, stage_name: str
+) -> None:
     """Update the model validation threshold in the SSM Parameter Store if the threshold is lower
     than the current threshold stored in the SSM Parameter Store.
 
@@ -42,6 +88,7 @@ def update_model_threshold(model_package_group_name: str, model_pipeline_name: s
         model_package_group_name (str): the name of the SageMaker model package group for the project
         model_pipeline_name (str): the name of the SageMaker Model Building Pipeline
         bucket (str): the name of the S3 bucket where the evaluation output is stored
+        stage_name (str): the stage of the endpoint whose monitoring metrics bound the threshold
     """
     # Get the execution ID of the last approved model
     try:
@@ -80,7 +127,15 @@ def update_model_threshold(model_package_group_name: str, model_pipeline_name: s
         if not (current_model_mwql == weighted_quantile_loss_value) and weighted_quantile_loss_value < weighted_quantile_loss_threshold:
             update_rate = float(model_validation_thresholds["update_rate"])
             threshold_update_step = abs(weighted_quantile_loss_value - weighted_quantile_loss_threshold) * update_rate
-            new_threshold = weighted_quantile_loss_value + threshold_update_step 
+            # The threshold is not set closer to the model's metric than the standard deviation of
+            # the monitoring metric across its backtest origins, so that the noise of the metric
+            # alone does not breach it
+            dispersion = get_weighted_quantile_loss_dispersion(stage_name)
+            logger.info(f"Weighted quantile loss dispersion of the monitoring backtests: {dispersion}")
+            new_threshold = min(
+                weighted_quantile_loss_value + max(threshold_update_step, dispersion),
+                weighted_quantile_loss_threshold,
+            )
             ssm_client.put_parameter(
                 Name="/rdi-mlops/sagemaker/model-build/validation-threshold/weighted_quantile_loss",
                 Description="Model build pipeline parameter for validation-threshold/weighted_quantile_loss",
@@ -112,8 +167,12 @@ if __name__ == "__main__":
     parser.add_argument("--sagemaker-project-id", type=str, required=True)
     parser.add_argument("--sagemaker-project-name", type=str, required=True)
     parser.add_argument("--model-package-group-name", type=str, required=True)
+    # The stage whose endpoint is monitored by the custom monitoring job
+    parser.add_argument("--stage-name", type=str, required=True)
     args, _ = parser.parse_known_args()
 
     model_pipeline_name = f"{args.sagemaker_project_name}-model-training"
     bucket = f"sagemaker-project-{args.sagemaker_project_id}"
-    update_model_threshold(args.model_package_group_name, model_pipeline_name, bucket)
+    update_model_threshold(
+        args.model_package_group_name, model_pipeline_name, bucket, args.stage_name
+    )
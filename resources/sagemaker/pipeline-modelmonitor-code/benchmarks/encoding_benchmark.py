@@ -0,0 +1,88 @@
+"""Micro-benchmark of the encoding of the DeepAR inference requests.
+
+Compares, for minute series of 10k to 1M points with 1% of missing values:
+    * the previous encoding, a list comprehension over the values and `json.dumps` of the floats
+    * the encoding of the deepar_encoding module, with orjson (if installed) and the json module
+
+Usage:
+    python benchmarks/encoding_benchmark.py --sizes 10000 100000 1000000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(
+    0, os.path.join(BASE_DIR, "..", "resources", "pipelines", "data_collection")
+)
+import deepar_encoding  # noqa: E402
+
+
+def legacy_encode_series(ts):
+    target = [x if np.isfinite(x) else "NaN" for x in ts]
+    return json.dumps({"start": str(ts.index[0]), "target": target})
+
+
+def make_series(size, missing_ratio=0.01, seed=42):
+    rng = np.random.default_rng(seed)
+    values = rng.gamma(2.0, 2000.0, size)
+    values[rng.random(size) < missing_ratio] = np.nan
+    return pd.Series(
+        values, index=pd.date_range("2024-06-20", periods=size, freq="1min")
+    )
+
+
+def best_time(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def benchmark(sizes, repeat=3):
+    orjson = deepar_encoding.orjson
+    encoders = {"legacy": legacy_encode_series}
+    if orjson is not None:
+        encoders["orjson"] = deepar_encoding.encode_series
+    encoders["json"] = deepar_encoding.encode_series
+    reports = []
+    for size in sizes:
+        ts = make_series(size)
+        expected = json.loads(legacy_encode_series(ts))
+        report = {"points": size}
+        for name, encoder in encoders.items():
+            # The json encoding is measured without orjson
+            deepar_encoding.orjson = None if name == "json" else orjson
+            assert json.loads(encoder(ts)) == expected, name
+            report[f"{name}_seconds"] = round(best_time(lambda: encoder(ts), repeat), 4)
+        deepar_encoding.orjson = orjson
+        for name in encoders:
+            if name != "legacy":
+                report[f"{name}_speedup"] = round(
+                    report["legacy_seconds"] / report[f"{name}_seconds"], 1
+                )
+        reports.append(report)
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser("Benchmark the encoding of the DeepAR requests.")
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10000, 100000, 1000000]
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    for report in benchmark(args.sizes, args.repeat):
+        print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -227,16 +227,69 @@ def main():
         monitor_outputs_bucket,
         f"code-artifacts/monitoring-data-collection/{timestamp}/custom_monitoring_metrics.py",
     )
+    s3_client.upload_file(
+        "resources/pipelines/data_collection/capture_records.py",
+        monitor_outputs_bucket,
+        f"code-artifacts/monitoring-data-collection/{timestamp}/capture_records.py",
+    )
     s3_client.upload_file(
         "resources/pipelines/data_collection/utils.py",
         monitor_outputs_bucket,
         f"code-artifacts/monitoring-data-collection/{timestamp}/utils.py",
     )
-    # List of processing images: https://github.com/aws/sagemaker-python-sdk/tree/master/src/sagemaker/image_uri_config
-    # If we need to create our own container: https://docs.aws.amazon.com/sagemaker/latest/dg/processing-container-run-scripts.html
-    processing_image_uri = sagemaker.image_uris.get_base_python_image_uri(
-        region=REGION, py_version="310"
+    s3_client.upload_file(
+        "resources/pipelines/data_collection/deepar_encoding.py",
+        monitor_outputs_bucket,
+        f"code-artifacts/monitoring-data-collection/{timestamp}/deepar_encoding.py",
+    )
+    s3_client.upload_file(
+        "resources/pipelines/data_collection/feature_data.py",
+        monitor_outputs_bucket,
+        f"code-artifacts/monitoring-data-collection/{timestamp}/feature_data.py",
+    )
+    s3_client.upload_file(
+        "resources/pipelines/data_collection/time_series.py",
+        monitor_outputs_bucket,
+        f"code-artifacts/monitoring-data-collection/{timestamp}/time_series.py",
+    )
+    s3_client.upload_file(
+        "resources/pipelines/data_collection/monitoring_data.py",
+        monitor_outputs_bucket,
+        f"code-artifacts/monitoring-data-collection/{timestamp}/monitoring_data.py",
     )
+    s3_client.upload_file(
+        "resources/pipelines/data_collection/backtesting.py",
+        monitor_outputs_bucket,
+        f"code-artifacts/monitoring-data-collection/{timestamp}/backtesting.py",
+    )
+    s3_client.upload_file(
+        "resources/pipelines/data_collection/forecast_metrics.py",
+        monitor_outputs_bucket,
+        f"code-artifacts/monitoring-data-collection/{timestamp}/forecast_metrics.py",
+    )
+    s3_client.upload_file(
+        "resources/pipelines/data_collection/cloudwatch_metrics.py",
+        monitor_outputs_bucket,
+        f"code-artifacts/monitoring-data-collection/{timestamp}/cloudwatch_metrics.py",
+    )
+    s3_client.upload_file(
+        "resources/pipelines/data_collection/dependencies.py",
+        monitor_outputs_bucket,
+        f"code-artifacts/monitoring-data-collection/{timestamp}/dependencies.py",
+    )
+    # The processing image is built from resources/sagemaker/processing-image with the pinned
+    # dependencies of the processing scripts. If it is not deployed, the scripts run on the
+    # SageMaker base Python image and install their dependencies at runtime
+    try:
+        processing_image_uri = ssm_client.get_parameter(
+            Name="/rdi-mlops/stack-parameters/sagemaker-processing-image-uri"
+        )["Parameter"]["Value"]
+    except ssm_client.exceptions.ParameterNotFound:
+        logger.info("The processing image is not deployed, using the SageMaker base Python image.")
+        # List of processing images: https://github.com/aws/sagemaker-python-sdk/tree/master/src/sagemaker/image_uri_config
+        processing_image_uri = sagemaker.image_uris.get_base_python_image_uri(
+            region=REGION, py_version="310"
+        )
     # Create the monitoring pipeline configuration for staging
     staging_monitoring_pipeline_data = dict(
         region=REGION,
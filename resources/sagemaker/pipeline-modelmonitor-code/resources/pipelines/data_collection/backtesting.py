@@ -0,0 +1,123 @@
+"""Rolling-origin backtesting of the deployed DeepAR model.
+
+The target series is cut at several forecast origins, `stride` periods apart, the last one leaving
+the latest `prediction_length` points to forecast. The series ending at each origin are predicted
+with batched endpoint requests and the forecast metrics are computed for all the origins at once.
+The mean and the dispersion of the metrics across the origins are more stable than the metrics of
+a single origin.
+"""
+
+import numpy as np
+import pandas as pd
+
+from forecast_metrics import forecast_metrics
+from time_series import target_series_inputs
+from utils import cutoff_series
+
+
+def rolling_origins(nb_points, prediction_length, num_origins, stride):
+    """Returns the forecast origins, as the number of points of the series before each origin.
+    The origins leaving less than `prediction_length` points of context are dropped.
+
+    Args:
+        nb_points (int): the number of points of the series
+        prediction_length (int): the number of points forecast from each origin
+        num_origins (int): the number of origins
+        stride (int): the number of points between two origins
+
+    Returns:
+        list[int]: the origins, in chronological order
+    """
+    last_origin = nb_points - prediction_length
+    origins = last_origin - stride * np.arange(num_origins)[::-1]
+    return origins[origins >= prediction_length].tolist()
+
+
+def backtest_metrics(targets, mean_predictions, quantile_predictions, quantiles):
+    """Computes the forecast metrics of each origin, see `forecast_metrics.forecast_metrics`.
+
+    Args:
+        targets (np.ndarray): the target values, with one row per origin
+        mean_predictions (np.ndarray): the mean predictions, with the shape of `targets`
+        quantile_predictions (np.ndarray): the quantile predictions, with one matrix of the shape
+            of `targets` per quantile
+        quantiles (list[float]): the quantiles, in increasing order
+
+    Returns:
+        pd.DataFrame: the `rmse`, `mape`, `coverage`, `interval_width` and
+            `weighted_quantile_loss` of each origin, and the weighted loss of each quantile in
+            the `weighted_quantile_loss_<quantile>` columns
+    """
+    metrics = forecast_metrics(
+        targets, mean_predictions, quantile_predictions, quantiles
+    )
+    for q, losses in zip(quantiles, metrics.pop("quantile_weighted_losses")):
+        metrics[f"weighted_quantile_loss_{q}"] = losses
+    return pd.DataFrame(metrics)
+
+
+def run_backtest(
+    predictor,
+    ts,
+    target_parameters,
+    prediction_length,
+    num_origins,
+    stride,
+    quantiles,
+):
+    """Backtests the model of the endpoint on rolling origins of the target series.
+
+    Args:
+        predictor (DeepARPredictor): the predictor of the endpoint
+        ts (pd.Series): the target series, resampled to the model frequency
+        target_parameters (dict[str, str]): the model target SSM parameters
+        prediction_length (int): the number of points forecast from each origin
+        num_origins (int): the maximum number of origins
+        stride (int): the number of points between two origins
+        quantiles (list[float]): the quantiles to predict
+
+    Returns:
+        tuple[pd.DataFrame, pd.DataFrame]: the metrics of each origin, with the `origin`
+            column being the first forecast timestamp, and the predictions with their targets
+    """
+    origins = rolling_origins(len(ts), prediction_length, num_origins, stride)
+    if not origins:
+        raise ValueError(
+            f"The series of {len(ts)} points is too short to backtest {prediction_length} points."
+        )
+    series = cutoff_series(ts, ts.index[np.array(origins) - 1])
+    inputs = [
+        target_series_inputs(target_parameters, s.index, prediction_length)
+        for s in series
+    ]
+    cats = [cat for cat, _ in inputs]
+    dynamic_feats = [dynamic_feat for _, dynamic_feat in inputs]
+    df_predictions = predictor.predict_batch(
+        series,
+        freq=pd.tseries.frequencies.to_offset(target_parameters["freq"]),
+        cat=cats if cats[0] is not None else None,
+        dynamic_feat=dynamic_feats if dynamic_feats[0] is not None else None,
+        series_ids=ts.index[origins],
+        quantiles=quantiles,
+        return_mean=True,
+    )
+    # The predictions are returned by origin then timestamp, so that each column can be reshaped
+    # to one row per origin
+    shape = (len(origins), prediction_length)
+    targets = np.lib.stride_tricks.sliding_window_view(
+        ts.to_numpy(dtype=float), prediction_length
+    )[origins]
+    df_predictions["target"] = targets.reshape(-1)
+    df_metrics = backtest_metrics(
+        targets,
+        df_predictions["mean"].to_numpy(dtype=float).reshape(shape),
+        np.stack(
+            [
+                df_predictions[str(q)].to_numpy(dtype=float).reshape(shape)
+                for q in quantiles
+            ]
+        ),
+        quantiles,
+    )
+    df_metrics.insert(0, "origin", ts.index[origins])
+    return df_metrics, df_predictions.rename(columns={"series": "origin"})
@@ -0,0 +1,87 @@
+"""Builds the data capture and ground truth records of the monitoring data collection and writes
+them as JSON lines files, in the formats read by the SageMaker Model Monitor.
+The module has no dependency, so that it is imported without installing the script dependencies.
+"""
+
+import itertools
+import json
+import uuid
+from datetime import datetime
+from typing import Any, Iterable, TypeAlias
+
+OutputData: TypeAlias = dict[str, "Any | OutputData"]
+
+
+# Maximum number of records per data capture or ground truth JSON lines file
+MAX_RECORDS_PER_FILE = 1000
+
+
+def ground_truth_with_id(data: str, uuid: str) -> OutputData:
+    return {
+        "groundTruthData": {
+            "data": str(data),
+            "encoding": "CSV",
+        },
+        "eventMetadata": {
+            "eventId": str(uuid),
+        },
+        "eventVersion": "0",
+    }
+
+
+def predictions_with_id(
+    uuid: str, endpoint_input: str, prediction: float, inference_time: datetime
+) -> OutputData:
+    return {
+        "captureData": {
+            "endpointInput": {
+                "observedContentType": "application/json",
+                "mode": "INPUT",
+                "data": endpoint_input,
+                "encoding": "JSON",
+            },
+            "endpointOutput": {
+                "observedContentType": "text/csv; charset=character-encoding",
+                "mode": "OUTPUT",
+                "data": str(prediction),
+                "encoding": "CSV",
+            },
+        },
+        "eventMetadata": {
+            "eventId": str(uuid),
+            "inferenceId": str(uuid),
+            "inferenceTime": inference_time.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        },
+        "eventVersion": "0",
+    }
+
+
+def event_id(endpoint_name: str, run_time: datetime, index: int) -> uuid.UUID:
+    """Returns the ID of the prediction `index` of a run, the same for its data capture and ground
+    truth records. The IDs are unique across the runs and endpoints and can be recomputed.
+    """
+    return uuid.uuid5(
+        uuid.NAMESPACE_URL, f"{endpoint_name}/{run_time:%Y-%m-%dT%H:%M:%S}/{index}"
+    )
+
+
+def write_output_data(
+    path: str,
+    records: Iterable[OutputData],
+    file_prefix: str,
+    max_records_per_file: int = MAX_RECORDS_PER_FILE,
+) -> int:
+    """Writes the records to JSON lines files of at most `max_records_per_file` records, named
+    after the `file_prefix` so that the files of successive runs do not overwrite each other.
+
+    Returns:
+        int: the number of files written
+    """
+    nb_files = 0
+    records = iter(records)
+    while chunk := list(itertools.islice(records, max_records_per_file)):
+        with open(f"{path}{file_prefix}-{nb_files:05d}.jsonl", "w") as f:
+            f.write("\n".join(json.dumps(record) for record in chunk))
+            f.write("\n")
+        nb_files += 1
+    return nb_files
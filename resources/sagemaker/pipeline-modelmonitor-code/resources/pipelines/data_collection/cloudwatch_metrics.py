@@ -0,0 +1,112 @@
+"""Publishes the custom monitoring metrics to CloudWatch with the fewest PutMetricData requests.
+
+The metric values are buffered and sent when the publisher is flushed. The values of a metric with
+the same dimensions are sent as a single metric datum, with the distinct values and their counts
+in the Values and Counts arrays, so that CloudWatch computes their statistics (average,
+percentiles, ...). The data are then sent in requests of up to 1000 metric data.
+See https://docs.aws.amazon.com/AmazonCloudWatch/latest/APIReference/API_PutMetricData.html
+"""
+
+import json
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# PutMetricData limits
+MAX_METRIC_DATA_PER_REQUEST = 1000
+MAX_VALUES_PER_DATUM = 150
+# The request payload is limited to 1 MB, the metric data are counted with a margin for the
+# request encoding
+MAX_REQUEST_BYTES = 800 * 1024
+
+
+class MetricsPublisher:
+    """Buffers metric values and publishes them to a CloudWatch namespace in batches.
+
+    Args:
+        cw_client (botocore.client): the CloudWatch client
+        namespace (str): the namespace of the metrics
+        dimensions (dict[str, str]): the dimensions of all the metrics (optional)
+        storage_resolution (int): 1 for high-resolution metrics, 60 for standard resolution
+    """
+
+    def __init__(self, cw_client, namespace, dimensions=None, storage_resolution=60):
+        self.cw_client = cw_client
+        self.namespace = namespace
+        self.dimensions = dict(dimensions or {})
+        self.storage_resolution = storage_resolution
+        self._values = {}
+
+    def add(self, name, value, unit="None", dimensions=None):
+        """Adds one or several values to a metric. The non-finite values are ignored, CloudWatch
+        rejects them.
+
+        Args:
+            name (str): the metric name
+            value (float | array-like): the value, or the values (e.g. one per backtest origin)
+            unit (str): the CloudWatch unit of the values
+            dimensions (dict[str, str]): the dimensions of the metric, added to the publisher ones
+        """
+        values = np.asarray(value, dtype=float).reshape(-1)
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            logger.warning(
+                f"No finite value for the metric {name}, it is not published."
+            )
+            return
+        dimensions = tuple({**self.dimensions, **(dimensions or {})}.items())
+        self._values.setdefault((name, unit, dimensions), []).append(values)
+
+    def metric_data(self):
+        """Returns the metric data of the buffered values."""
+        metric_data = []
+        for (name, unit, dimensions), values in self._values.items():
+            distinct_values, counts = np.unique(
+                np.concatenate(values), return_counts=True
+            )
+            for start in range(0, len(distinct_values), MAX_VALUES_PER_DATUM):
+                end = start + MAX_VALUES_PER_DATUM
+                datum = {
+                    "MetricName": name,
+                    "Dimensions": [{"Name": k, "Value": v} for k, v in dimensions],
+                    "Unit": unit,
+                    "StorageResolution": self.storage_resolution,
+                }
+                if len(distinct_values) == 1 and counts[0] == 1:
+                    datum["Value"] = float(distinct_values[0])
+                else:
+                    datum["Values"] = distinct_values[start:end].tolist()
+                    datum["Counts"] = counts[start:end].astype(float).tolist()
+                metric_data.append(datum)
+        return metric_data
+
+    def flush(self):
+        """Publishes the buffered values and clears the buffer.
+
+        Returns:
+            int: the number of PutMetricData requests
+        """
+        batches = []
+        batch, batch_bytes = [], 0
+        for datum in self.metric_data():
+            datum_bytes = len(json.dumps(datum))
+            if batch and (
+                len(batch) == MAX_METRIC_DATA_PER_REQUEST
+                or batch_bytes + datum_bytes > MAX_REQUEST_BYTES
+            ):
+                batches.append(batch)
+                batch, batch_bytes = [], 0
+            batch.append(datum)
+            batch_bytes += datum_bytes
+        if batch:
+            batches.append(batch)
+        for batch in batches:
+            self.cw_client.put_metric_data(MetricData=batch, Namespace=self.namespace)
+        logger.info(
+            f"Published {sum(len(b) for b in batches)} metric data to {self.namespace} "
+            f"in {len(batches)} requests."
+        )
+        self._values = {}
+        return len(batches)
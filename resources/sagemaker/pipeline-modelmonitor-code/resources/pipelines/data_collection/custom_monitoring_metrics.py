@@ -1,24 +1,28 @@
-import subprocess
-import sys
+from dependencies import install_missing
 
-subprocess.check_call([sys.executable, "-m", "pip", "install", "sagemaker>=2.197.0"])
-subprocess.check_call([sys.executable, "-m", "pip", "install", "pandas>=2.1.3"])
-from utils import (
+# The dependencies are in the processing image, they are only installed on other images
+install_missing(["sagemaker>=2.197.0", "pandas>=2.1.3", "pyarrow>=14.0.1", "orjson>=3.9.0"])
+from utils import (  # noqa: E402
     DeepARPredictor,
     get_session,
     write_dicts_to_file,
     get_ssm_parameters,
 )
-import json
-import os
-import argparse
-import boto3
-import logging
-from botocore.config import Config
-from sagemaker import Session
-import numpy as np
-import pandas as pd
-from sagemaker.feature_store.feature_group import FeatureGroup
+from feature_data import lookback_start  # noqa: E402
+from monitoring_data import load_records  # noqa: E402
+from deepar_encoding import encode_target  # noqa: E402
+from time_series import resample_series, target_series_inputs  # noqa: E402
+from backtesting import run_backtest  # noqa: E402
+from cloudwatch_metrics import MetricsPublisher  # noqa: E402
+import json  # noqa: E402
+import os  # noqa: E402
+import argparse  # noqa: E402
+import boto3  # noqa: E402
+import logging  # noqa: E402
+import pandas as pd  # noqa: E402
+from botocore.config import Config  # noqa: E402
+from sagemaker import Session  # noqa: E402
+from sagemaker.feature_store.feature_group import FeatureGroup  # noqa: E402
 
 # create clients
 AWS_REGION = os.environ["AWS_REGION"]
@@ -33,12 +37,6 @@ s3_client = boto3.resource("s3", config=boto3_config)
 cw_client = boto3.client("cloudwatch", config=boto3_config)
 
 
-# See https://website-nine-gules.vercel.app/blog/how-to-evaluate-probabilistic-forecasts-weighted-quantile-loss
-# for weightd quantile losss calculations
-def quantile_loss(alpha, q, x):
-    return np.where(x > q, alpha * (x - q), (1 - alpha) * (q - x))
-
-
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--local-data-folder", type=str, required=True)
@@ -88,26 +86,30 @@ if __name__ == "__main__":
     transactions_feature_group = FeatureGroup(
         name=transactions_feature_group_name, sagemaker_session=feature_store_session
     )
-    transactions_data_query = transactions_feature_group.athena_query()
-    transactions_data_table = transactions_data_query.table_name
-
-    query_string = f'SELECT * FROM "{transactions_data_table}"'
-
-    # run Athena query. The output is loaded to a Pandas dataframe.
-    # dataset = pd.DataFrame()
-    transactions_data_query.run(
-        query_string=query_string,
-        output_location="s3://" + model_artifacts_bucket + "/query_results/",
+    target_col = model_target_parameters["target_col"]
+    # Only read the latest version of the target values within the lookback window, which is
+    # larger than the context and lags used by the model to forecast
+    data_extraction_parameters = get_ssm_parameters(
+        ssm_client, "/rdi-mlops/sagemaker/model-build/data-extraction"
+    )
+    inference_lookback_days = int(
+        data_extraction_parameters.get("inference_lookback_days", "30")
+    )
+    # The records are queried once per pipeline execution and shared by its steps
+    df = load_records(
+        transactions_feature_group,
+        [target_col],
+        boto_session.client("s3"),
+        os.environ.get("MONITORING_BUCKET", model_artifacts_bucket),
+        "s3://" + model_artifacts_bucket + "/query_results/",
+        since=lookback_start(inference_lookback_days * 24 * 60),
+        execution_id=os.environ.get("PIPELINE_EXECUTION_ID"),
     )
-    transactions_data_query.wait()
-    df = transactions_data_query.as_dataframe()
 
-    df.sort_values(by="tx_minute", axis=0, ascending=True, inplace=True)
-    df["tx_minute"] = pd.to_datetime(df["tx_minute"])
-    df.set_index("tx_minute", drop=True, inplace=True)
+    # Resample the series to the model frequency, the missing periods are NaN
+    df = resample_series(df, [target_col], model_target_parameters["freq"])
 
     start_dataset = df.index.min()
-    target_col = model_target_parameters["target_col"]
 
     total_nb_data_points = len(df)
     prediction_length = int(model_target_parameters["prediction_length"])
@@ -119,95 +121,97 @@ if __name__ == "__main__":
     df_input_data = df[:-prediction_length]
     df_target_data = df[-prediction_length:]
 
+    # The category and dynamic features of the target series if the model is trained on multiple
+    # series or with dynamic features
+    cat, dynamic_feat = target_series_inputs(
+        model_target_parameters, df_input_data.index, prediction_length
+    )
     input_data = [
         {
             "start": str(start_dataset),
-            "target": list(df_input_data[target_col]),
+            "target": encode_target(df_input_data[target_col]),
         }
     ]
+    if cat is not None:
+        input_data[0]["cat"] = cat
+    if dynamic_feat is not None:
+        input_data[0]["dynamic_feat"] = dynamic_feat
 
     endpoint_name = f"{stack_parameters['sagemaker-project-name']}-staging"
     predictor = DeepARPredictor(
         endpoint_name=endpoint_name, sagemaker_session=sagemaker_session
     )
 
-    # Convert the context data to time series
-    ts = df_input_data[target_col]
-    df_predictions = predictor.predict(
-        ts=ts, quantiles=[low_quantile, 0.5, up_quantile], return_mean=True
+    # Backtest the model on rolling origins, the last one forecasting the latest data points
+    # By default the origins are one prediction length apart, so that the forecasts do not overlap
+    backtest_parameters = get_ssm_parameters(
+        ssm_client, "/rdi-mlops/sagemaker/model-build/monitoring"
     )
-
-    targets = np.array(df_target_data[target_col])
-    mean_predictions = np.array(df_predictions["mean"])
-    # Create a dataframe with the target_col from the test targets and the quantiles from the Batch Transform outputs
-    logger.info("Creating the final dataframe.")
-    df_aggregate = pd.DataFrame(
-        {
-            "target": targets,
-            "prediction_mean": mean_predictions,
-            f"prediction_{low_quantile}": df_predictions[str(low_quantile)],
-            "prediction_0.5": df_predictions["0.5"],
-            f"prediction_{up_quantile}": df_predictions[str(up_quantile)],
-        }
+    num_origins = int(backtest_parameters.get("backtest_origins", "12"))
+    stride = int(backtest_parameters.get("backtest_stride", str(prediction_length)))
+    logger.info(f"Backtesting the model on {num_origins} origins {stride} points apart.")
+    df_metrics, df_aggregate = run_backtest(
+        predictor,
+        df[target_col],
+        model_target_parameters,
+        prediction_length,
+        num_origins,
+        stride,
+        [low_quantile, 0.5, up_quantile],
     )
-
-    # Compute the RMSE for the mean
-    logger.info("Computing the RMSE for the mean predition.")
-    
-    rmse = np.sqrt(((mean_predictions-targets)**2).mean())
-    # Compute the mean weighted quantile loss for a specific quantile
-    # See https://docs.aws.amazon.com/sagemaker/latest/dg/deepar.html
-    # And https://website-nine-gules.vercel.app/blog/how-to-evaluate-probabilistic-forecasts-weighted-quantile-loss
-    logger.info("Computing the mean weighted quantile loss.")
-    weighted_quantile_losses = np.array([])
-    weight = 2/np.abs(targets).sum()
-    for q in [low_quantile, 0.5, up_quantile]:
-        quantile_predictions = np.array(df_predictions[str(q)])
-        ql = quantile_loss(q, quantile_predictions, targets)
-        df_aggregate[f"quantile_loss_{q}"] = ql
-        weighted_quantile_losses = np.append(weighted_quantile_losses, ql.sum() * weight)
-    mean_weighted_quantile_loss = weighted_quantile_losses.mean()
+    # The origins without any target value (e.g. ingestion outage) have no metrics
+    df_metrics = df_metrics.dropna(subset=["rmse", "weighted_quantile_loss"])
+    logger.info(f"Backtest metrics:\n{df_metrics}")
+    rmse = df_metrics["rmse"].mean()
+    mean_weighted_quantile_loss = df_metrics["weighted_quantile_loss"].mean()
+    weighted_quantile_loss_std = df_metrics["weighted_quantile_loss"].std(ddof=0)
 
     report_dict = {
         "deepar_metrics": {
-            "rmse": {"value": rmse, "standard_deviation": "NaN"},
+            "rmse": {"value": rmse, "standard_deviation": df_metrics["rmse"].std(ddof=0)},
             "weighted_quantile_loss": {
                 "value": mean_weighted_quantile_loss,
-                "standard_deviation": "NaN",
+                "standard_deviation": weighted_quantile_loss_std,
+            },
+            **{
+                metric: {
+                    "value": df_metrics[metric].mean(),
+                    "standard_deviation": df_metrics[metric].std(ddof=0),
+                }
+                for metric in ["mape", "coverage", "interval_width"]
             },
         },
+        "backtest": {"origins": len(df_metrics), "stride": stride},
     }
 
-    # Create a CloudWatch metric with the mean weighted quantile loss values
+    # Publish the CloudWatch metrics in batched requests. The alarm is on the mean of the mean
+    # weighted quantile loss values across the origins, the other metrics are published with
+    # the values of all the origins, from which CloudWatch computes their statistics
     logger.info("Adding CloudWatch metric data")
-    logger.info({
-                "MetricName": "weighted_quantile_loss",
-                "Dimensions": [{"Name": "StageName", "Value": STAGE_NAME}],
-                "Unit": "None",
-                "Value": mean_weighted_quantile_loss,
-            })
-    cw_client.put_metric_data(
-        MetricData=[
-            {
-                "MetricName": "weighted_quantile_loss",
-                "Dimensions": [{"Name": "StageName", "Value": STAGE_NAME}],
-                "Unit": "None",
-                "Value": mean_weighted_quantile_loss,
-            },
-        ],
-        Namespace="CustomModelMonitoring",
-    )
-    cw_client.put_metric_data(
-        MetricData=[
-            {
-                "MetricName": "weighted_quantile_loss_threshold",
-                "Dimensions": [{"Name": "StageName", "Value": STAGE_NAME}],
-                "Unit": "None",
-                "Value": float(model_validation_thresholds["weighted_quantile_loss"]),
-            },
-        ],
-        Namespace="CustomModelMonitoring",
+    metrics_publisher = MetricsPublisher(
+        cw_client,
+        "CustomModelMonitoring",
+        dimensions={"StageName": STAGE_NAME},
+        storage_resolution=int(backtest_parameters.get("metrics_storage_resolution", "60")),
+    )
+    metrics_publisher.add("weighted_quantile_loss", mean_weighted_quantile_loss)
+    metrics_publisher.add("weighted_quantile_loss_std", weighted_quantile_loss_std)
+    metrics_publisher.add(
+        "weighted_quantile_loss_threshold",
+        float(model_validation_thresholds["weighted_quantile_loss"]),
     )
+    for metric in ["rmse", "mape", "coverage", "interval_width"]:
+        metrics_publisher.add(metric, df_metrics[metric])
+    for q in [low_quantile, 0.5, up_quantile]:
+        metrics_publisher.add(
+            "quantile_weighted_loss",
+            df_metrics[f"weighted_quantile_loss_{q}"],
+            dimensions={"Quantile": str(q)},
+        )
+    # Time since the latest record of the feature group, e.g. to detect an ingestion outage
+    data_freshness = pd.Timestamp.now(tz="UTC").tz_localize(None) - df.index.max()
+    metrics_publisher.add("data_freshness", data_freshness.total_seconds(), unit="Seconds")
+    metrics_publisher.flush()
 
     # Write files
     for folder_name in ["input", "target", "predictions", "evaluation"]:
@@ -217,11 +221,11 @@ if __name__ == "__main__":
     df_target_data.to_csv(
         f"{local_data_folder}/target/target.csv", header=True, index=False
     )
-    df_predictions.to_csv(
+    df_aggregate.to_csv(
         f"{local_data_folder}/predictions/predictions.csv", header=True, index=False
     )
-    df_aggregate.to_csv(
-        f"{local_data_folder}/evaluation/target-quantiles-losses.csv", header=True, index=False
+    df_metrics.to_csv(
+        f"{local_data_folder}/evaluation/backtest-metrics.csv", header=True, index=False
     )
     with open(f"{local_data_folder}/evaluation/evaluation.json", "w") as f:
         f.write(json.dumps(report_dict))
@@ -0,0 +1,76 @@
+"""Encodes the DeepAR inference requests to JSON without converting each value to a Python float.
+
+The missing values (NaN and infinite values) are encoded as "NaN" strings, as expected by DeepAR.
+See https://docs.aws.amazon.com/sagemaker/latest/dg/deepar-in-formats.html
+
+orjson is used to serialise the arrays if it is installed, the json module otherwise.
+"""
+
+import json
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+MISSING_VALUE = '"NaN"'
+
+
+def encode_float_array(values):
+    """Encodes a numeric array as a JSON array, with the missing values as "NaN".
+
+    Args:
+        values (array-like): the values, e.g. a pandas.Series
+
+    Returns:
+        str: the JSON array
+    """
+    values = np.ascontiguousarray(values, dtype=float)
+    if orjson is not None:
+        # orjson encodes the non-finite values as null, which is the only non-numeric token
+        return (
+            orjson.dumps(values, option=orjson.OPT_SERIALIZE_NUMPY)
+            .decode("utf-8")
+            .replace("null", MISSING_VALUE)
+        )
+    # The json module encodes the floats of the list in C and the non-finite values as the NaN,
+    # Infinity and -Infinity tokens, which are the only non-numeric tokens
+    return (
+        json.dumps(values.tolist(), separators=(",", ":"))
+        .replace("NaN", MISSING_VALUE)
+        .replace("-Infinity", MISSING_VALUE)
+        .replace("Infinity", MISSING_VALUE)
+    )
+
+
+def encode_target(values):
+    """Converts the values to a JSON serializable list, with the missing values as "NaN"."""
+    values = np.asarray(values, dtype=float)
+    encoded = values.astype(object)
+    encoded[~np.isfinite(values)] = "NaN"
+    return encoded.tolist()
+
+
+def encode_series(ts, cat=None, dynamic_feat=None):
+    """Encodes a time series of a DeepAR request to JSON.
+
+    Args:
+        ts (pd.Series): the time series, indexed by timestamp
+        cat (list[int]): the categories of the time series (optional)
+        dynamic_feat (list[array-like]): the dynamic features of the time series (optional)
+
+    Returns:
+        str: the JSON object, with the same content as `json.dumps(series_to_dict(...))`
+    """
+    parts = [
+        f'"start": {json.dumps(str(ts.index[0]))}',
+        f'"target": {encode_float_array(ts)}',
+    ]
+    if cat is not None:
+        parts.append(f'"cat": {json.dumps(cat)}')
+    if dynamic_feat is not None:
+        features = ", ".join(encode_float_array(f) for f in dynamic_feat)
+        parts.append(f'"dynamic_feat": [{features}]')
+    return "{" + ", ".join(parts) + "}"
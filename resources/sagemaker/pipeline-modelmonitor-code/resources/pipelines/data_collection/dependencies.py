@@ -0,0 +1,50 @@
+"""Installs the dependencies of a processing script which are not in the processing image.
+
+The pipelines run the processing scripts on the prebuilt processing image, which has all their
+dependencies, and nothing is installed. The packages are only installed at runtime when the scripts
+run on another image, e.g. the SageMaker base Python image if the processing image is not deployed.
+The module only uses the standard library, it is imported before the dependencies are installed.
+"""
+
+import importlib.metadata
+import logging
+import re
+import subprocess
+import sys
+
+logger = logging.getLogger(__name__)
+
+
+def version_tuple(version):
+    """Returns the numeric release of a version, e.g. (2, 1, 3) for "2.1.3.post1"."""
+    return tuple(int(n) for n in re.findall(r"\d+", version.split("+")[0])[:3])
+
+
+def missing_requirements(requirements):
+    """Returns the requirements which are not installed, or installed with an older version.
+
+    Args:
+        requirements (list[str]): the requirements, as "<package>" or "<package>>=<version>"
+
+    Returns:
+        list[str]: the requirements to install
+    """
+    missing = []
+    for requirement in requirements:
+        name, _, minimum_version = requirement.partition(">=")
+        try:
+            version = importlib.metadata.version(name.strip())
+        except importlib.metadata.PackageNotFoundError:
+            missing.append(requirement)
+            continue
+        if minimum_version and version_tuple(version) < version_tuple(minimum_version):
+            missing.append(requirement)
+    return missing
+
+
+def install_missing(requirements):
+    """Installs the requirements which are not satisfied, with a single pip command."""
+    missing = missing_requirements(requirements)
+    if missing:
+        logger.warning(f"Installing the missing processing dependencies: {missing}")
+        subprocess.check_call([sys.executable, "-m", "pip", "install", *missing])
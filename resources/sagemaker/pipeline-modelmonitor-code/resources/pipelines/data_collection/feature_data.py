@@ -0,0 +1,211 @@
+"""Reads the aggregated transactions features from the SageMaker Feature Store offline store."""
+
+import logging
+import tempfile
+import uuid
+from urllib.parse import urlparse
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+RECORD_IDENTIFIER = "tx_minute"
+EVENT_TIME_FEATURE = "event_time"
+# Format of the tx_minute record identifier, e.g. "2024-06-20 08:00:00"
+RECORD_IDENTIFIER_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def build_latest_records_query(
+    table_name, columns, since=None, written_since=None, with_deleted=False
+):
+    """Builds the Athena query returning the latest version of each record.
+
+    The offline store keeps every version of a record. The query only reads the record identifier,
+    the event time and the requested columns, keeps the latest version of each record with a window
+    function and removes the deleted records.
+
+    Args:
+        table_name (str): the offline store Glue table name
+        columns (list[str]): the feature columns to return
+        since (str): if set, only the records with a tx_minute after this value are returned
+        written_since (str): if set, only the record versions written to the offline store after
+            this time are read, whatever their tx_minute
+        with_deleted (bool): also return the deleted records, with the write_time and is_deleted
+            columns, to maintain a snapshot of the records
+
+    Returns:
+        str: the query
+    """
+    projection = ", ".join(
+        f'"{c}"' for c in [RECORD_IDENTIFIER, EVENT_TIME_FEATURE] + list(columns)
+    )
+    conditions = []
+    if since is not None:
+        conditions.append(f"\"{RECORD_IDENTIFIER}\" > '{since}'")
+    if written_since is not None:
+        conditions.append(f"write_time > timestamp '{written_since}'")
+    where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    if with_deleted:
+        outer_projection = f"{projection}, write_time, is_deleted"
+        deleted_filter = ""
+    else:
+        outer_projection = projection
+        deleted_filter = " AND NOT is_deleted"
+    return (
+        f"SELECT {outer_projection} FROM ("
+        f"SELECT {projection}, write_time, is_deleted, row_number() OVER ("
+        f'PARTITION BY "{RECORD_IDENTIFIER}" '
+        f'ORDER BY "{EVENT_TIME_FEATURE}" DESC, write_time DESC, api_invocation_time DESC'
+        f') AS version_rank FROM "{table_name}" {where_clause}'
+        f") WHERE version_rank = 1{deleted_filter}"
+    )
+
+
+def unload_to_dataframe(athena_query, query_string, output_s3_path, s3_client):
+    """Runs the query with an Athena UNLOAD statement and reads the Parquet files it writes.
+
+    Reading Parquet keeps the column types and avoids parsing the CSV results of a SELECT query.
+
+    Args:
+        athena_query (AthenaQuery): the feature group Athena query
+        query_string (str): the SELECT query
+        output_s3_path (str): the S3 path where the query results are stored
+        s3_client (botocore.client): the S3 client
+
+    Returns:
+        pd.DataFrame: the query results
+    """
+    # The UNLOAD destination must be empty
+    unload_s3_path = f"{output_s3_path.rstrip('/')}/unload-{uuid.uuid4().hex}/"
+    athena_query.run(
+        query_string=f"UNLOAD ({query_string}) TO '{unload_s3_path}' WITH (format = 'PARQUET')",
+        output_location=output_s3_path,
+    )
+    athena_query.wait()
+    url = urlparse(unload_s3_path)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        nb_files = 0
+        paginator = s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=url.netloc, Prefix=url.path.lstrip("/")):
+            for obj in page.get("Contents", []):
+                s3_client.download_file(
+                    url.netloc, obj["Key"], f"{tmp_dir}/part-{nb_files}"
+                )
+                nb_files += 1
+        if nb_files == 0:
+            return pd.DataFrame()
+        return pd.read_parquet(tmp_dir)
+
+
+def query_latest_records(
+    feature_group,
+    columns,
+    output_s3_path,
+    s3_client,
+    since=None,
+    written_since=None,
+    with_deleted=False,
+):
+    """Queries the latest version of the feature group records.
+
+    Args:
+        feature_group (FeatureGroup): the feature group to query
+        columns (list[str]): the feature columns to return
+        output_s3_path (str): the S3 path where the Athena query results are stored
+        s3_client (botocore.client): the S3 client
+        since (str): if set, only the records with a tx_minute after this value are returned
+        written_since (str): if set, only the record versions written after this time are read
+        with_deleted (bool): also return the deleted records, with the write_time and is_deleted
+            columns
+
+    Returns:
+        pd.DataFrame: the tx_minute, event_time and requested columns, sorted by tx_minute
+    """
+    athena_query = feature_group.athena_query()
+    query_string = build_latest_records_query(
+        athena_query.table_name,
+        columns,
+        since=since,
+        written_since=written_since,
+        with_deleted=with_deleted,
+    )
+    logger.info(f"Running the Athena query: {query_string}")
+    df = unload_to_dataframe(athena_query, query_string, output_s3_path, s3_client)
+    if df.empty:
+        snapshot_columns = ["write_time", "is_deleted"] if with_deleted else []
+        return pd.DataFrame(
+            columns=[RECORD_IDENTIFIER, EVENT_TIME_FEATURE]
+            + list(columns)
+            + snapshot_columns
+        )
+    df[RECORD_IDENTIFIER] = df[RECORD_IDENTIFIER].astype(str)
+    return df.sort_values(by=RECORD_IDENTIFIER, kind="stable").reset_index(drop=True)
+
+
+def query_high_water_mark(feature_group, output_s3_path, s3_client):
+    """Returns the latest tx_minute of the feature group records, None if there are no records.
+
+    Args:
+        feature_group (FeatureGroup): the feature group to query
+        output_s3_path (str): the S3 path where the Athena query results are stored
+        s3_client (botocore.client): the S3 client
+
+    Returns:
+        str: the latest tx_minute
+    """
+    athena_query = feature_group.athena_query()
+    query_string = f'SELECT max("{RECORD_IDENTIFIER}") AS high_water_mark FROM "{athena_query.table_name}"'
+    logger.info(f"Running the Athena query: {query_string}")
+    df = unload_to_dataframe(athena_query, query_string, output_s3_path, s3_client)
+    if df.empty or pd.isna(df["high_water_mark"].iloc[0]):
+        return None
+    return str(df["high_water_mark"].iloc[0])
+
+
+def lookback_start(lookback_minutes, end=None):
+    """Returns the tx_minute from which the records are read to cover the lookback window.
+
+    Args:
+        lookback_minutes (int): the size of the window in minutes
+        end (pd.Timestamp): the end of the window in UTC. Defaults to now
+
+    Returns:
+        str: the tx_minute starting the window
+    """
+    end = end if end is not None else pd.Timestamp.now(tz="UTC").tz_localize(None)
+    return (end - pd.Timedelta(minutes=lookback_minutes)).strftime(
+        RECORD_IDENTIFIER_FORMAT
+    )
+
+
+def dedupe_records(df):
+    """Keeps the latest version of each record, by event time. For equal event times, the last
+    record of the dataframe is kept.
+    """
+    df = df.sort_values(by=[RECORD_IDENTIFIER, EVENT_TIME_FEATURE], kind="stable")
+    return df.drop_duplicates(subset=RECORD_IDENTIFIER, keep="last")
+
+
+def merge_snapshot(snapshot, new_records):
+    """Merges the latest record versions written since a snapshot into it.
+
+    The new versions replace the records of the snapshot, and the records deleted since the
+    snapshot are removed from it.
+
+    Args:
+        snapshot (pd.DataFrame): the snapshot records, with the write_time column. None to build
+            the snapshot from the new records only
+        new_records (pd.DataFrame): the latest versions queried with the deleted records
+
+    Returns:
+        pd.DataFrame: the records of the updated snapshot, with the write_time column
+    """
+    columns = list(new_records.columns.drop("is_deleted"))
+    new_records = new_records.assign(is_deleted=new_records["is_deleted"].astype(bool))
+    if snapshot is not None:
+        # The new records come last, so that they replace the snapshot records of same event time
+        new_records = pd.concat(
+            [snapshot[columns].assign(is_deleted=False), new_records]
+        )
+    df = dedupe_records(new_records)
+    return df[~df["is_deleted"]][columns].reset_index(drop=True)
@@ -0,0 +1,102 @@
+"""Loads the feature group records used by the monitoring pipeline steps.
+
+The records are queried once per pipeline execution and cached as a Parquet file in the monitoring
+bucket, under `monitoring-data-cache/<pipeline execution ID>/<high-water mark>.parquet`, where the
+high-water mark is the latest tx_minute of the records. The following steps of the execution read
+the cached file instead of querying the offline store again.
+"""
+
+import logging
+import tempfile
+
+import botocore
+import pandas as pd
+
+from feature_data import RECORD_IDENTIFIER, query_latest_records
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = "monitoring-data-cache"
+# Format of the high-water mark in the file names, which sorts them chronologically
+HIGH_WATER_MARK_FORMAT = "%Y%m%dT%H%M%S"
+
+
+def find_cached_records(s3_client, bucket, execution_id):
+    """Returns the key of the cached records of the pipeline execution with the latest high-water
+    mark, None if there are none.
+    """
+    keys = []
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(
+        Bucket=bucket, Prefix=f"{CACHE_PREFIX}/{execution_id}/"
+    ):
+        keys += [
+            obj["Key"]
+            for obj in page.get("Contents", [])
+            if obj["Key"].endswith(".parquet")
+        ]
+    return max(keys) if keys else None
+
+
+def read_cached_records(s3_client, bucket, key):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        local_path = f"{tmp_dir}/records.parquet"
+        s3_client.download_file(bucket, key, local_path)
+        return pd.read_parquet(local_path)
+
+
+def write_cached_records(s3_client, df, bucket, execution_id):
+    high_water_mark = pd.Timestamp(df[RECORD_IDENTIFIER].max())
+    key = f"{CACHE_PREFIX}/{execution_id}/{high_water_mark:{HIGH_WATER_MARK_FORMAT}}.parquet"
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        local_path = f"{tmp_dir}/records.parquet"
+        df.to_parquet(local_path, index=False)
+        s3_client.upload_file(local_path, bucket, key)
+    return key
+
+
+def load_records(
+    feature_group,
+    columns,
+    s3_client,
+    bucket,
+    output_s3_path,
+    since,
+    execution_id=None,
+):
+    """Loads the latest version of the feature group records after `since`, from the cache of the
+    pipeline execution if a previous step stored them, from the offline store otherwise.
+
+    Args:
+        feature_group (FeatureGroup): the feature group to query
+        columns (list[str]): the feature columns to return
+        s3_client (botocore.client): the S3 client
+        bucket (str): the bucket where the records are cached
+        output_s3_path (str): the S3 path where the Athena query results are stored
+        since (str): only the records with a tx_minute after this value are returned
+        execution_id (str): the pipeline execution ID. The records are not cached if None
+
+    Returns:
+        pd.DataFrame: the tx_minute, event_time and requested columns, sorted by tx_minute
+    """
+    if execution_id:
+        try:
+            key = find_cached_records(s3_client, bucket, execution_id)
+            if key is not None:
+                df = read_cached_records(s3_client, bucket, key)
+                if set(columns).issubset(df.columns):
+                    logger.info(
+                        f"Read {len(df)} cached records from s3://{bucket}/{key}."
+                    )
+                    df = df[df[RECORD_IDENTIFIER] > since]
+                    return df.reset_index(drop=True)
+                logger.info("The cached records do not have all the columns.")
+        except botocore.exceptions.ClientError as e:
+            logger.warning(f"Could not read the cached records: {e}")
+    df = query_latest_records(
+        feature_group, columns, output_s3_path, s3_client, since=since
+    )
+    if execution_id and not df.empty:
+        key = write_cached_records(s3_client, df, bucket, execution_id)
+        logger.info(f"Cached {len(df)} records in s3://{bucket}/{key}.")
+    return df
@@ -1,28 +1,33 @@
-import subprocess
-import sys
+from dependencies import install_missing
 
-subprocess.check_call([sys.executable, "-m", "pip", "install", "sagemaker>=2.197.0"])
-subprocess.check_call([sys.executable, "-m", "pip", "install", "pandas>=2.1.3"])
-from utils import (
+# The dependencies are in the processing image, they are only installed on other images
+install_missing(["sagemaker>=2.197.0", "pandas>=2.1.3", "pyarrow>=14.0.1", "orjson>=3.9.0"])
+from utils import (  # noqa: E402
     DeepARPredictor,
-    DeepARData,
     get_session,
     write_dicts_to_file,
     get_ssm_parameters,
 )
-from sagemaker.feature_store.feature_group import FeatureGroup
-import json
-import os
-import argparse
-from datetime import datetime, timezone
-import uuid
-import boto3
-import logging
-import time
-from botocore.config import Config
-from sagemaker import Session
-import pandas as pd
-from typing import Any, TypeAlias
+from feature_data import lookback_start  # noqa: E402
+from monitoring_data import load_records  # noqa: E402
+from deepar_encoding import encode_target  # noqa: E402
+from time_series import resample_series, target_series_inputs  # noqa: E402
+from capture_records import (  # noqa: E402
+    event_id,
+    ground_truth_with_id,
+    predictions_with_id,
+    write_output_data,
+)
+from sagemaker.feature_store.feature_group import FeatureGroup  # noqa: E402
+import json  # noqa: E402
+import os  # noqa: E402
+import argparse  # noqa: E402
+from datetime import datetime, timedelta  # noqa: E402
+import boto3  # noqa: E402
+import logging  # noqa: E402
+from botocore.config import Config  # noqa: E402
+from sagemaker import Session  # noqa: E402
+import numpy as np  # noqa: E402
 
 # create clients
 AWS_REGION = os.environ["AWS_REGION"]
@@ -33,55 +38,6 @@ boto3_config = Config(
 ssm_client = boto3.client("ssm", config=boto3_config)
 s3_client = boto3.resource("s3", config=boto3_config)
 
-OutputData: TypeAlias = dict[str, Any | "OutputData"]
-
-
-def ground_truth_with_id(data: str, uuid: str) -> OutputData:
-    return {
-        "groundTruthData": {
-            "data": str(data),
-            "encoding": "CSV",
-        },
-        "eventMetadata": {
-            "eventId": str(uuid),
-        },
-        "eventVersion": "0",
-    }
-
-
-def predictions_with_id(
-    uuid: str, input_data: list[DeepARData], prediction: float
-) -> OutputData:
-    return {
-        "captureData": {
-            "endpointInput": {
-                "observedContentType": "application/json",
-                "mode": "INPUT",
-                "data": f'{{"instances" : {input_data} }}',
-                "encoding": "JSON",
-            },
-            "endpointOutput": {
-                "observedContentType": "text/csv; charset=character-encoding",
-                "mode": "OUTPUT",
-                "data": str(prediction),
-                "encoding": "CSV",
-            },
-        },
-        "eventMetadata": {
-            "eventId": str(uuid),
-            "inferenceId": str(uuid),
-            "inferenceTime": str(datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")),
-        },
-        "eventVersion": "0",
-    }
-
-
-def write_output_data(path: str, record: OutputData, file_index: int) -> None:
-    json_record = [json.dumps(record)]
-    data_to_upload = "\n".join(json_record)
-    with open(f"{path}record_{file_index}.jsonl", "w") as f:
-        f.write(data_to_upload)
-
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -130,26 +86,30 @@ if __name__ == "__main__":
     transactions_feature_group = FeatureGroup(
         name=transactions_feature_group_name, sagemaker_session=feature_store_session
     )
-    transactions_data_query = transactions_feature_group.athena_query()
-    transactions_data_table = transactions_data_query.table_name
-
-    query_string = f'SELECT * FROM "{transactions_data_table}"'
-
-    # run Athena query. The output is loaded to a Pandas dataframe.
-    # dataset = pd.DataFrame()
-    transactions_data_query.run(
-        query_string=query_string,
-        output_location="s3://" + model_artifacts_bucket + "/query_results/",
+    target_col = model_target_parameters["target_col"]
+    # Only read the latest version of the target values within the lookback window, which is
+    # larger than the context and lags used by the model to forecast
+    data_extraction_parameters = get_ssm_parameters(
+        ssm_client, "/rdi-mlops/sagemaker/model-build/data-extraction"
+    )
+    inference_lookback_days = int(
+        data_extraction_parameters.get("inference_lookback_days", "30")
+    )
+    # The records are queried once per pipeline execution and shared by its steps
+    df = load_records(
+        transactions_feature_group,
+        [target_col],
+        boto_session.client("s3"),
+        os.environ.get("MONITORING_BUCKET", model_artifacts_bucket),
+        "s3://" + model_artifacts_bucket + "/query_results/",
+        since=lookback_start(inference_lookback_days * 24 * 60),
+        execution_id=os.environ.get("PIPELINE_EXECUTION_ID"),
     )
-    transactions_data_query.wait()
-    df = transactions_data_query.as_dataframe()
 
-    df.sort_values(by="tx_minute", axis=0, ascending=True, inplace=True)
-    df["tx_minute"] = pd.to_datetime(df["tx_minute"])
-    df.set_index("tx_minute", drop=True, inplace=True)
+    # Resample the series to the model frequency, the missing periods are NaN
+    df = resample_series(df, [target_col], model_target_parameters["freq"])
 
     start_dataset = df.index.min()
-    target_col = model_target_parameters["target_col"]
 
     total_nb_data_points = len(df)
     prediction_length = int(model_target_parameters["prediction_length"])
@@ -161,17 +121,26 @@ if __name__ == "__main__":
     df_input_data = df[:-prediction_length]
     df_target_data = df[-prediction_length:]
 
+    # The category and dynamic features of the target series if the model is trained on multiple
+    # series or with dynamic features
+    cat, dynamic_feat = target_series_inputs(
+        model_target_parameters, df_input_data.index, prediction_length
+    )
     input_data = [
         {
             "start": str(start_dataset),
-            "target": list(df_input_data[target_col]),
+            "target": encode_target(df_input_data[target_col]),
         }
     ]
+    if cat is not None:
+        input_data[0]["cat"] = cat
+    if dynamic_feat is not None:
+        input_data[0]["dynamic_feat"] = dynamic_feat
 
     target_data = [
         {
             "start": str(start_dataset),
-            "target": list(df_target_data[target_col]),
+            "target": encode_target(df_target_data[target_col]),
         }
     ]
 
@@ -188,7 +157,12 @@ if __name__ == "__main__":
 
     # Convert the context data to time series
     ts = df_input_data[target_col]
-    df_predictions = predictor.predict(ts=ts, quantiles=[low_quantile, 0.5, up_quantile])
+    df_predictions = predictor.predict(
+        ts=ts,
+        cat=cat,
+        dynamic_feat=dynamic_feat,
+        quantiles=[low_quantile, 0.5, up_quantile],
+    )
 
     # Set the predictions and ground-truth folders
     upload_time = datetime.utcnow()
@@ -198,19 +172,42 @@ if __name__ == "__main__":
         os.makedirs(prediction_folder, exist_ok=True)
     if not os.path.isdir(ground_truth_folder):
         os.makedirs(ground_truth_folder, exist_ok=True)
-    for i in range(prediction_length):
-        record_uuid = uuid.uuid4()
-
-        predictions_data = predictions_with_id(
-            record_uuid, input_data, df_predictions["0.5"].values[i]
-        )
-        write_output_data(prediction_folder, predictions_data, i)
-
-        target_value = list(df_input_data[target_col])[i]
-        ground_truth = f"{i}?{target_value}"
-        ground_truth_data = ground_truth_with_id(
-            list(df_input_data[target_col])[i], record_uuid
-        )
-        write_output_data(ground_truth_folder, ground_truth_data, i)
-
-        time.sleep(1)
+    # The records of the run share the encoded endpoint input. Each prediction gets a unique
+    # inference time, one second apart from the run time, instead of waiting a second between
+    # the records
+    endpoint_input = json.dumps({"instances": input_data})
+    run_time = upload_time.replace(microsecond=0)
+    file_prefix = f"records-{run_time:%Y%m%dT%H%M%S}"
+    predicted_values = df_predictions["0.5"].to_numpy()
+    # The ground truth is the target data following the input data
+    target_values = df_target_data[target_col].to_numpy()
+    event_ids = [
+        event_id(endpoint_name, run_time, i) for i in range(prediction_length)
+    ]
+    nb_prediction_files = write_output_data(
+        prediction_folder,
+        (
+            predictions_with_id(
+                event_ids[i],
+                endpoint_input,
+                predicted_values[i],
+                run_time + timedelta(seconds=i),
+            )
+            for i in range(prediction_length)
+        ),
+        file_prefix,
+    )
+    # The missing target values have no ground truth
+    nb_ground_truth_files = write_output_data(
+        ground_truth_folder,
+        (
+            ground_truth_with_id(target_values[i], event_ids[i])
+            for i in range(prediction_length)
+            if np.isfinite(target_values[i])
+        ),
+        file_prefix,
+    )
+    logger.info(
+        f"Wrote {prediction_length} records to {nb_prediction_files} data capture files "
+        f"and {nb_ground_truth_files} ground truth files."
+    )
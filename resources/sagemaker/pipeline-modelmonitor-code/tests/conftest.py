@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The data collection scripts import their modules from their own folder, like in the processing
+# container
+BASE_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(
+    0, os.path.join(BASE_DIR, "..", "resources", "pipelines", "data_collection")
+)
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("sagemaker")
+
+from backtesting import rolling_origins, run_backtest  # noqa: E402
+
+QUANTILES = [0.1, 0.5, 0.9]
+TARGET_PARAMETERS = {"target_col": "avg_fee_1min", "freq": "1min"}
+
+
+class FakePredictor:
+    """Forecasts the actual values of the series after each origin, offset by the quantile."""
+
+    def __init__(self, ts, prediction_length):
+        self.ts = ts
+        self.prediction_length = prediction_length
+
+    def predict_batch(
+        self, series, freq, cat, dynamic_feat, series_ids, quantiles, return_mean
+    ):
+        rows = []
+        for s, series_id in zip(series, series_ids):
+            start = len(s)
+            for timestamp, value in self.ts.iloc[
+                start : start + self.prediction_length
+            ].items():
+                row = {"series": series_id, "timestamp": timestamp, "mean": value}
+                row.update({str(q): value + q - 0.5 for q in quantiles})
+                rows.append(row)
+        return pd.DataFrame(rows)
+
+
+def test_rolling_origins():
+    assert rolling_origins(20, 3, 4, 5) == [7, 12, 17]
+    assert rolling_origins(20, 3, 2, 1) == [16, 17]
+    # The origins leaving less than a prediction length of context are dropped
+    assert rolling_origins(20, 3, 10, 5) == [7, 12, 17]
+    assert rolling_origins(5, 3, 2, 1) == []
+
+
+def test_run_backtest_reshapes_the_predictions_by_origin():
+    ts = pd.Series(
+        np.arange(1, 21, dtype=float) ** 2,
+        index=pd.date_range("2024-06-20 08:00:00", periods=20, freq="1min"),
+    )
+    df_metrics, df_predictions = run_backtest(
+        FakePredictor(ts, 3), ts, TARGET_PARAMETERS, 3, 3, 5, QUANTILES
+    )
+    assert df_metrics["origin"].tolist() == list(ts.index[[7, 12, 17]])
+    # The mean predictions are the targets of their origin
+    np.testing.assert_array_equal(df_metrics["rmse"], 0.0)
+    np.testing.assert_array_equal(df_metrics["coverage"], 1.0)
+    np.testing.assert_allclose(df_metrics["interval_width"], 0.8)
+    assert df_predictions["origin"].tolist() == [
+        origin for origin in ts.index[[7, 12, 17]] for _ in range(3)
+    ]
+    np.testing.assert_array_equal(df_predictions["target"], df_predictions["mean"])
+
+
+def test_run_backtest_on_a_short_series():
+    ts = pd.Series(
+        [1.0, 2.0], index=pd.date_range("2024-06-20", periods=2, freq="1min")
+    )
+    with pytest.raises(ValueError):
+        run_backtest(FakePredictor(ts, 3), ts, TARGET_PARAMETERS, 3, 3, 1, QUANTILES)
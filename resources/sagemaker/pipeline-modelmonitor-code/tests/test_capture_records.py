@@ -0,0 +1,63 @@
+import json
+import os
+from datetime import datetime
+
+from capture_records import (
+    event_id,
+    ground_truth_with_id,
+    predictions_with_id,
+    write_output_data,
+)
+
+RUN_TIME = datetime(2024, 6, 20, 8, 0, 0)
+
+
+def read_files(path):
+    return {
+        name: [json.loads(line) for line in open(os.path.join(path, name))]
+        for name in sorted(os.listdir(path))
+    }
+
+
+def test_write_output_data(tmp_path):
+    path = f"{tmp_path}/"
+    nb_files = write_output_data(
+        path, ({"index": i} for i in range(5)), "records-run", max_records_per_file=2
+    )
+    assert nb_files == 3
+    files = read_files(path)
+    assert list(files) == [
+        "records-run-00000.jsonl",
+        "records-run-00001.jsonl",
+        "records-run-00002.jsonl",
+    ]
+    assert [record["index"] for records in files.values() for record in records] == [
+        0,
+        1,
+        2,
+        3,
+        4,
+    ]
+
+
+def test_write_output_data_without_records(tmp_path):
+    assert write_output_data(f"{tmp_path}/", iter([]), "records-run") == 0
+    assert os.listdir(tmp_path) == []
+
+
+def test_event_ids_are_unique_and_stable():
+    ids = [event_id("endpoint", RUN_TIME, i) for i in range(3)]
+    assert len(set(ids)) == 3
+    assert ids[0] == event_id("endpoint", RUN_TIME, 0)
+    assert ids[0] != event_id("other-endpoint", RUN_TIME, 0)
+
+
+def test_prediction_and_ground_truth_share_the_event_id():
+    uuid = event_id("endpoint", RUN_TIME, 0)
+    prediction = predictions_with_id(uuid, '{"instances": []}', 1.5, RUN_TIME)
+    ground_truth = ground_truth_with_id(2.0, uuid)
+    assert prediction["eventMetadata"]["eventId"] == str(uuid)
+    assert prediction["eventMetadata"]["inferenceTime"] == "2024-06-20T08:00:00Z"
+    assert prediction["captureData"]["endpointOutput"]["data"] == "1.5"
+    assert ground_truth["eventMetadata"]["eventId"] == str(uuid)
+    assert ground_truth["groundTruthData"]["data"] == "2.0"
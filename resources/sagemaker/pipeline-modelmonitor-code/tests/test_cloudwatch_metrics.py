@@ -0,0 +1,68 @@
+import json
+
+import numpy as np
+
+import cloudwatch_metrics
+from cloudwatch_metrics import MAX_VALUES_PER_DATUM, MetricsPublisher
+
+
+class FakeCloudWatchClient:
+    def __init__(self):
+        self.requests = []
+
+    def put_metric_data(self, MetricData, Namespace):
+        self.requests.append((Namespace, MetricData))
+
+
+def test_values_and_counts():
+    publisher = MetricsPublisher(
+        FakeCloudWatchClient(), "namespace", dimensions={"Endpoint": "staging"}
+    )
+    publisher.add("rmse", [1.0, 2.0, 1.0, np.nan])
+    publisher.add("rmse", 3.0)
+    publisher.add("coverage", 0.9, unit="Percent", dimensions={"Quantile": "0.9"})
+    publisher.add("mape", [np.inf])
+    rmse, coverage = publisher.metric_data()
+    assert rmse["Values"] == [1.0, 2.0, 3.0]
+    assert rmse["Counts"] == [2.0, 1.0, 1.0]
+    assert rmse["Dimensions"] == [{"Name": "Endpoint", "Value": "staging"}]
+    assert coverage["Value"] == 0.9 and "Values" not in coverage
+    assert coverage["Unit"] == "Percent"
+    assert coverage["Dimensions"] == [
+        {"Name": "Endpoint", "Value": "staging"},
+        {"Name": "Quantile", "Value": "0.9"},
+    ]
+
+
+def test_values_are_split_by_datum():
+    publisher = MetricsPublisher(FakeCloudWatchClient(), "namespace")
+    publisher.add("score", np.arange(2 * MAX_VALUES_PER_DATUM + 10))
+    metric_data = publisher.metric_data()
+    assert [len(datum["Values"]) for datum in metric_data] == [150, 150, 10]
+    assert sum(sum(datum["Counts"]) for datum in metric_data) == 310
+
+
+def test_flush_batches_the_metric_data():
+    cw_client = FakeCloudWatchClient()
+    publisher = MetricsPublisher(cw_client, "namespace")
+    for i in range(2500):
+        publisher.add(f"metric-{i}", i)
+    assert publisher.flush() == 3
+    assert [len(data) for _, data in cw_client.requests] == [1000, 1000, 500]
+    assert {namespace for namespace, _ in cw_client.requests} == {"namespace"}
+    # The buffer is cleared
+    assert publisher.flush() == 0
+    assert len(cw_client.requests) == 3
+
+
+def test_flush_keeps_the_requests_below_the_payload_size(monkeypatch):
+    monkeypatch.setattr(cloudwatch_metrics, "MAX_REQUEST_BYTES", 2000)
+    cw_client = FakeCloudWatchClient()
+    publisher = MetricsPublisher(cw_client, "namespace")
+    for i in range(20):
+        publisher.add(f"metric-{i}", np.arange(10) + i)
+    publisher.flush()
+    assert len(cw_client.requests) > 1
+    assert sum(len(data) for _, data in cw_client.requests) == 20
+    for _, data in cw_client.requests:
+        assert sum(len(json.dumps(datum)) for datum in data) <= 2000
@@ -0,0 +1,47 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import deepar_encoding
+from deepar_encoding import encode_float_array, encode_series, encode_target
+
+
+@pytest.fixture(params=["orjson", "json"])
+def encoder(request, monkeypatch):
+    if request.param == "orjson":
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(deepar_encoding, "orjson", None)
+    return request.param
+
+
+def test_encode_target():
+    assert encode_target([1.5, np.nan, np.inf, 2]) == [1.5, "NaN", "NaN", 2.0]
+
+
+def test_encode_float_array(encoder):
+    values = np.array([1.5, np.nan, -np.inf, np.inf, 0.1, 1e-7])
+    assert json.loads(encode_float_array(values)) == [
+        1.5,
+        "NaN",
+        "NaN",
+        "NaN",
+        0.1,
+        1e-7,
+    ]
+
+
+def test_encode_series(encoder):
+    ts = pd.Series(
+        [1.0, np.nan, 3.0],
+        index=pd.date_range("2024-06-20 08:00:00", periods=3, freq="1min"),
+    )
+    encoded = encode_series(ts, cat=[0], dynamic_feat=[[0.5, np.nan, 0.0, 0.1]])
+    assert json.loads(encoded) == {
+        "start": "2024-06-20 08:00:00",
+        "target": encode_target(ts),
+        "cat": [0],
+        "dynamic_feat": [[0.5, "NaN", 0.0, 0.1]],
+    }
@@ -0,0 +1,96 @@
+import shutil
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("botocore")
+pytest.importorskip("pyarrow")
+
+import monitoring_data  # noqa: E402
+from monitoring_data import load_records  # noqa: E402
+
+SINCE = "2024-06-20 08:00:00"
+
+
+class FakeS3Client:
+    """Stores the uploaded files in a local folder."""
+
+    def __init__(self, tmp_path):
+        self.root = tmp_path
+        self.keys = []
+
+    def get_paginator(self, operation_name):
+        client = self
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix):
+                keys = [key for key in client.keys if key.startswith(Prefix)]
+                return iter([{"Contents": [{"Key": key} for key in keys]}])
+
+        return Paginator()
+
+    def upload_file(self, filename, bucket, key):
+        shutil.copy(filename, self.root / key.replace("/", "_"))
+        self.keys.append(key)
+
+    def download_file(self, bucket, key, filename):
+        shutil.copy(self.root / key.replace("/", "_"), filename)
+
+
+@pytest.fixture
+def queries(monkeypatch):
+    """Records the offline store queries, which return two records."""
+    queries = []
+
+    def query_latest_records(feature_group, columns, output_s3_path, s3_client, since):
+        queries.append((columns, since))
+        return pd.DataFrame(
+            {
+                "tx_minute": ["2024-06-20 08:01:00", "2024-06-20 08:02:00"],
+                "event_time": [1.0, 2.0],
+                **{column: [1.0, 2.0] for column in columns},
+            }
+        )
+
+    monkeypatch.setattr(monitoring_data, "query_latest_records", query_latest_records)
+    return queries
+
+
+def load(s3_client, columns=("avg_fee_1min",), since=SINCE, execution_id="execution"):
+    return load_records(
+        None,
+        list(columns),
+        s3_client,
+        "bucket",
+        "s3://bucket/results/",
+        since,
+        execution_id=execution_id,
+    )
+
+
+def test_load_records_queries_once_per_execution(tmp_path, queries):
+    s3_client = FakeS3Client(tmp_path)
+    first = load(s3_client)
+    assert s3_client.keys == ["monitoring-data-cache/execution/20240620T080200.parquet"]
+    second = load(s3_client, since="2024-06-20 08:01:00")
+    assert len(queries) == 1
+    pd.testing.assert_frame_equal(second, first[1:].reset_index(drop=True))
+    # Another execution queries the records again
+    load(s3_client, execution_id="other-execution")
+    assert len(queries) == 2
+
+
+def test_load_records_queries_the_missing_columns(tmp_path, queries):
+    s3_client = FakeS3Client(tmp_path)
+    load(s3_client)
+    df = load(s3_client, columns=["avg_fee_1min", "total_fee_1min"])
+    assert len(queries) == 2
+    assert "total_fee_1min" in df.columns
+
+
+def test_load_records_without_execution_id(tmp_path, queries):
+    s3_client = FakeS3Client(tmp_path)
+    load(s3_client, execution_id=None)
+    load(s3_client, execution_id=None)
+    assert len(queries) == 2
+    assert s3_client.keys == []
@@ -0,0 +1,61 @@
+import json
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("sagemaker")
+
+import utils  # noqa: E402
+from utils import DeepARPredictor, chunk_instances, cutoff_series  # noqa: E402
+
+
+def fake_endpoint(requests):
+    """Returns a fake endpoint predicting the last value of each series, recording the requests."""
+
+    def predict(self, data):
+        request = json.loads(data.decode("utf-8"))
+        requests.append(data)
+        predictions = [
+            {"quantiles": {"0.5": [instance["target"][-1]] * 2}}
+            for instance in request["instances"]
+        ]
+        return json.dumps({"predictions": predictions}).encode("utf-8")
+
+    return predict
+
+
+def test_chunk_instances():
+    instances = ["a" * 8, "b" * 8, "c" * 8, "d" * 8]
+    # Each instance takes 10 bytes with its separator
+    assert chunk_instances(instances, 25) == [(0, 2), (2, 4)]
+    assert chunk_instances(instances, 40) == [(0, 4)]
+    assert chunk_instances(instances, 10) == [(0, 1), (1, 2), (2, 3), (3, 4)]
+    assert chunk_instances([], 10) == []
+    with pytest.raises(ValueError):
+        chunk_instances(instances, 9)
+
+
+def test_predict_batch_splits_the_requests():
+    ts = pd.Series(
+        np.arange(10, dtype=float),
+        index=pd.date_range("2024-06-20 08:00:00", periods=10, freq="1min"),
+    )
+    series = cutoff_series(ts, ts.index[4:])
+    requests = []
+    predictor = DeepARPredictor("endpoint", sagemaker_session=mock.MagicMock())
+    with mock.patch.object(
+        utils.sagemaker.predictor.Predictor, "predict", fake_endpoint(requests)
+    ):
+        df = predictor.predict_batch(
+            series, quantiles=["0.5"], max_payload_bytes=500, max_workers=2
+        )
+    assert len(requests) > 1
+    assert all(len(request) <= 500 for request in requests)
+    # The predictions are returned in the order of the series, after their last timestamp
+    assert df.columns.tolist() == ["series", "timestamp", "0.5"]
+    assert df["series"].tolist() == [i for i in range(len(series)) for _ in range(2)]
+    assert df["0.5"].tolist() == [float(v) for v in range(4, 10) for _ in range(2)]
+    assert df["timestamp"].iloc[0] == ts.index[5]
+    assert df["timestamp"].iloc[1] == ts.index[6]
@@ -0,0 +1,121 @@
+"""Benchmark of the startup time of the processing scripts, with and without the processing image.
+
+Runs, in Docker containers, the startup of the processing scripts: the installation of the
+missing dependencies with the `dependencies` module and the import of the dependencies. It
+compares:
+    * the base Python image, where the dependencies are installed at runtime, as on the SageMaker
+      base Python image before the processing image
+    * the processing image, built from the Dockerfile of this folder, where nothing is installed
+
+Each run starts a new container, as a processing job does. Docker must be installed, and the base
+image must have network access to PyPI.
+
+Usage:
+    python benchmarks/startup_benchmark.py --build --repeat 3
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import time
+
+BASE_DIR = os.path.dirname(os.path.realpath(__file__))
+IMAGE_DIR = os.path.join(BASE_DIR, "..")
+SHARED_CODE_DIR = os.path.join(
+    IMAGE_DIR, "..", "pipeline-modelbuild-code", "pipelines", "blockchain", "shared"
+)
+# Dependencies of the monitoring scripts, the superset of the processing scripts dependencies
+REQUIREMENTS = [
+    "sagemaker>=2.197.0",
+    "pandas>=2.1.3",
+    "pyarrow>=14.0.1",
+    "orjson>=3.9.0",
+]
+STARTUP_CODE = f"""
+import sys
+sys.path.insert(0, "/opt/ml/processing/input/shared")
+from dependencies import install_missing
+install_missing({REQUIREMENTS!r})
+import orjson, pandas, pyarrow, sagemaker
+"""
+
+
+def build_image(tag):
+    subprocess.run(
+        ["docker", "build", "--platform", "linux/amd64", "-t", tag, IMAGE_DIR],
+        check=True,
+    )
+
+
+def startup_time(image):
+    command = [
+        "docker",
+        "run",
+        "--rm",
+        "--platform",
+        "linux/amd64",
+        "-v",
+        f"{os.path.realpath(SHARED_CODE_DIR)}:/opt/ml/processing/input/shared:ro",
+        image,
+        "python3",
+        "-c",
+        STARTUP_CODE,
+    ]
+    start = time.perf_counter()
+    subprocess.run(
+        command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    return time.perf_counter() - start
+
+
+def benchmark(images, repeat=3):
+    reports = []
+    for name, image in images.items():
+        # Pull the image once, the pull time is not part of the startup of the scripts
+        startup_time(image)
+        times = [startup_time(image) for _ in range(repeat)]
+        reports.append(
+            {
+                "image": name,
+                "median_seconds": round(statistics.median(times), 2),
+                "min_seconds": round(min(times), 2),
+            }
+        )
+    baseline = reports[0]["median_seconds"]
+    for report in reports[1:]:
+        report["speedup"] = round(baseline / report["median_seconds"], 1)
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        "Benchmark the startup time of the processing scripts."
+    )
+    parser.add_argument(
+        "--base-image",
+        type=str,
+        default="public.ecr.aws/docker/library/python:3.10-slim",
+        help="Image on which the dependencies are installed at runtime",
+    )
+    parser.add_argument(
+        "--image",
+        type=str,
+        default="rdi-sagemaker-processing:benchmark",
+        help="Processing image, with the dependencies installed",
+    )
+    parser.add_argument(
+        "--build", action="store_true", help="Build the processing image first"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    if args.build:
+        build_image(args.image)
+    images = {"runtime-install": args.base_image, "processing-image": args.image}
+    for report in benchmark(images, args.repeat):
+        print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()